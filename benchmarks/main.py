@@ -0,0 +1,180 @@
+from contextlib import redirect_stdout
+from shutil import rmtree
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import os
+
+from jen.build import Build
+from jen.cli import CliApp, CliCommand
+from jen.run import App
+
+from .site_generator import SiteGenerator
+
+
+class RunBenchmarks(CliCommand):
+
+    name = 'run'
+    usage = 'python -m benchmarks run <output.json>'
+    description = 'Generate a synthetic site, time build and server, write results to <output.json>'
+    options = (
+        ('--pages=N', 'Number of pages (default: 1000)'),
+        ('--depth=N', 'Levels of template inheritance (default: 3)'),
+        ('--includes=N', 'Partials included by each page (default: 5)'),
+        ('--assets=N', 'Number of static assets (default: 100)'),
+        ('--asset-size=BYTES', 'Size of each static asset (default: 10240)'),
+        ('--requests=N', 'Requests sent to the server (default: 5000)'),
+        ('--repeat=N', 'Times each build is repeated (default: 3)'),
+    )
+
+    def run(self, output, pages=1000, depth=3, includes=5, assets=100, asset_size=10240, requests=5000, repeat=3):
+        generator = SiteGenerator(
+            pages=self.int_option('pages', pages),
+            depth=int(depth),
+            includes=int(includes),
+            assets=int(assets),
+            asset_size=int(asset_size),
+        )
+        directory = tempfile.mkdtemp(prefix='jen-benchmark-')
+        try:
+            source = os.path.join(directory, 'site')
+            generator.generate(source)
+            results = {
+                'environment': self.environment(),
+                'site': generator.shape(),
+                'build': self.benchmark_build(source, os.path.join(directory, 'dist'), self.int_option('repeat', repeat)),
+                'app': self.benchmark_app(source, generator.urls(), self.int_option('requests', requests)),
+                'startup': self.benchmark_startup(self.int_option('repeat', repeat)),
+            }
+        finally:
+            rmtree(directory)
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        self.echo('build:', '{:.3f}s'.format(results['build']['min']))
+        self.echo('app:', '{:.0f} req/s'.format(results['app']['requests_per_second']),
+            'p50 {:.3f}ms'.format(results['app']['p50'] * 1000), 'p99 {:.3f}ms'.format(results['app']['p99'] * 1000))
+        self.echo('startup:', ', '.join('{} {:.1f}ms'.format(name, seconds * 1000)
+            for name, seconds in sorted(results['startup'].items())))
+
+    def environment(self):
+        try:
+            commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        }
+
+    def benchmark_build(self, source, target, repeat):
+        timings = []
+        for _ in range(repeat):
+            build = Build()
+            started = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                build.build(source, target)
+            timings.append(time.perf_counter() - started)
+            rmtree(target)
+        return summary(timings)
+
+    def benchmark_app(self, source, urls, requests):
+        app = App(source)
+        latencies = []
+        started = time.perf_counter()
+        for number in range(requests):
+            env = {'PATH_INFO': urls[number % len(urls)], 'REQUEST_METHOD': 'GET'}
+            request_started = time.perf_counter()
+            body = app(env, start_response)
+            for _ in body:
+                pass
+            if hasattr(body, 'close'):
+                body.close()
+            latencies.append(time.perf_counter() - request_started)
+        elapsed = time.perf_counter() - started
+        results = summary(latencies)
+        results['requests'] = requests
+        results['requests_per_second'] = requests / elapsed
+        return results
+
+    def benchmark_startup(self, repeat):
+        modules = (('cli', 'jen.main'), ('build', 'jen.build'), ('run', 'jen.run'))
+        return dict((name, min(import_times('import ' + module)[module] for _ in range(repeat)))
+            for name, module in modules)
+
+
+class CompareBenchmarks(CliCommand):
+
+    name = 'compare'
+    usage = 'python -m benchmarks compare <before.json> <after.json>'
+    description = 'Show how the timings in <after.json> changed from <before.json>'
+
+    metrics = (
+        ('build', 'min'),
+        ('build', 'median'),
+        ('app', 'requests_per_second'),
+        ('app', 'p50'),
+        ('app', 'p99'),
+        ('startup', 'cli'),
+        ('startup', 'build'),
+    )
+
+    def run(self, before, after):
+        with open(before, 'r') as f:
+            before = json.load(f)
+        with open(after, 'r') as f:
+            after = json.load(f)
+        for section, metric in self.metrics:
+            if section not in before or section not in after:
+                continue
+            old = before[section][metric]
+            new = after[section][metric]
+            change = (new - old) / old * 100 if old else 0.0
+            self.echo('{}.{}:'.format(section, metric), '{:.6g} -> {:.6g}'.format(old, new), '({:+.1f}%)'.format(change))
+
+
+def start_response(status, headers):
+    pass
+
+
+def summary(timings):
+    ordered = sorted(timings)
+    return {
+        'min': ordered[0],
+        'median': percentile(ordered, 50),
+        'p50': percentile(ordered, 50),
+        'p99': percentile(ordered, 99),
+        'max': ordered[-1],
+    }
+
+
+def import_times(statement):
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+    times = {}
+    for line in process.stderr.decode().splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def percentile(ordered, percent):
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+app = CliApp()
+app.command(RunBenchmarks())
+app.command(CompareBenchmarks())
+
+
+def run():
+    app.call()
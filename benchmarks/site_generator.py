@@ -0,0 +1,74 @@
+import os
+
+
+class SiteGenerator(object):
+
+    def __init__(self, pages=100, depth=2, includes=3, assets=10, asset_size=10 * 1024):
+        self.pages = pages
+        self.depth = depth
+        self.includes = includes
+        self.assets = assets
+        self.asset_size = asset_size
+
+    def shape(self):
+        return {
+            'pages': self.pages,
+            'depth': self.depth,
+            'includes': self.includes,
+            'assets': self.assets,
+            'asset_size': self.asset_size,
+        }
+
+    def generate(self, directory):
+        os.makedirs(directory)
+        self.write_layouts(directory)
+        self.write_partials(directory)
+        self.write_pages(directory)
+        self.write_assets(directory)
+
+    def write_layouts(self, directory):
+        self.write(directory, '_layout_0.html', '<html><body>{% block body %}{% endblock %}</body></html>\n')
+        for level in range(1, self.depth + 1):
+            self.write(directory, '_layout_{}.html'.format(level), (
+                "{{% extends '_layout_{parent}.html' %}}\n"
+                "{{% block body %}}<div class=\"level-{level}\">{{{{ super() }}}}"
+                "{{% block level_{level} %}}{{% endblock %}}</div>{{% endblock %}}\n"
+            ).format(parent=level - 1, level=level))
+
+    def write_partials(self, directory):
+        for number in range(self.includes):
+            self.write(directory, '_partials/item_{}.html'.format(number), (
+                '<ul>{{% for i in range(10) %}}<li class="item-{number}">{{{{ i }}}}</li>{{% endfor %}}</ul>\n'
+            ).format(number=number))
+
+    def write_pages(self, directory):
+        includes = ''.join("{{% include '_partials/item_{}.html' %}}".format(number) for number in range(self.includes))
+        block = 'level_{}'.format(self.depth) if self.depth else 'body'
+        for number in range(self.pages):
+            self.write(directory, self.page_path(number), (
+                "{{% extends '_layout_{depth}.html' %}}\n"
+                "{{% block {block} %}}<h1>Page {number}</h1>{includes}{{% endblock %}}\n"
+            ).format(depth=self.depth, block=block, number=number, includes=includes))
+
+    def write_assets(self, directory):
+        line = 'body { color: #333; margin: 0 auto; }\n'
+        content = (line * (self.asset_size // len(line) + 1))[:self.asset_size]
+        for number in range(self.assets):
+            self.write(directory, self.asset_path(number), content)
+
+    def page_path(self, number):
+        return 'section-{}/page-{}.html'.format(number // 100, number)
+
+    def asset_path(self, number):
+        return 'assets/style-{}.css'.format(number)
+
+    def urls(self):
+        urls = ['/' + self.page_path(number)[:-5] for number in range(self.pages)]
+        urls += ['/' + self.asset_path(number) for number in range(self.assets)]
+        return urls
+
+    def write(self, directory, relative_path, content):
+        path = os.path.join(directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
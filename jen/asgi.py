@@ -0,0 +1,327 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import time
+
+from jinja2.exceptions import TemplateNotFound
+
+from . import compression
+from .asgi_server import AsgiServer
+from .run import App
+from .template_renderer import TemplateRenderer
+
+
+class AsgiApp(App):
+
+    def __init__(self, directory, cache_directory=None, threads=None, **options):
+        super(AsgiApp, self).__init__(directory, cache_directory, **options)
+        self.template_renderer = TemplateRenderer(directory, cache_directory, enable_async=True)
+        self.executor = ThreadPoolExecutor(threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        env = self.environ(scope)
+        if self.live_reload is not None:
+            self.live_reload.start()
+            if env['PATH_INFO'] == self.live_reload.path:
+                headers = [('Content-Type', 'text/event-stream'), ('Cache-Control', 'no-cache')]
+                await self.send_response(send, ('200 OK', headers, self.live_events(receive)))
+                return
+        if self.metrics is None:
+            _, response = await self.handle(env)
+        else:
+            response = await self.measured_handle(env)
+        await self.send_response(send, response)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def environ(self, scope):
+        env = {'PATH_INFO': scope['path'], 'REQUEST_METHOD': scope.get('method', 'GET')}
+        for name, value in scope.get('headers', []):
+            env['HTTP_' + name.decode('latin-1').upper().replace('-', '_')] = value.decode('latin-1')
+        return env
+
+    async def handle(self, env):
+        path = env['PATH_INFO']
+        route = await self.route(path)
+        response = await self.template_response(env, route)
+        if response:
+            return 'try_template', response
+        response = await self.static_response(env, route)
+        if response:
+            return 'try_static', response
+        response = await self.not_found_response(env, path)
+        if response:
+            return 'try_404', response
+        return 'not_found', self.reply('404 Not Found')
+
+    async def measured_handle(self, env):
+        if env['PATH_INFO'] == self.metrics.path:
+            body = await self.blocking(self.metrics.render)
+            return self.reply('200 OK', 'text/plain; version=0.0.4', body)
+        started = time.perf_counter()
+        try:
+            branch, response = await self.handle(env)
+        except Exception:
+            self.metrics.increment('render_errors')
+            raise
+        status, headers, body = response
+        if not status.startswith('304') and not self.is_head(env):
+            lengths = [int(value) for name, value in headers if name == 'Content-Length']
+            if lengths:
+                self.metrics.increment('bytes_served', lengths[0])
+            elif not isinstance(body, bytes):
+                response = (status, headers, self.counted_body(body))
+        self.metrics.increment('requests')
+        self.metrics.observe(branch, time.perf_counter() - started)
+        return response
+
+    async def counted_body(self, body):
+        try:
+            async for chunk in body:
+                self.metrics.increment('bytes_served', len(chunk))
+                yield chunk
+        finally:
+            await body.aclose()
+
+    async def live_events(self, receive):
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        changed = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self.live_reload.subscribe(loop, changed.set)
+        version = self.live_reload.version
+        try:
+            yield b'retry: 1000\n\n'
+            while not disconnected.done():
+                waiter = asyncio.ensure_future(changed.wait())
+                await asyncio.wait([waiter, disconnected], timeout=self.live_reload.heartbeat,
+                    return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if disconnected.done():
+                    break
+                changed.clear()
+                version, message = self.live_reload.next_event(version, 0)
+                yield message
+        finally:
+            self.live_reload.unsubscribe(loop, changed.set)
+            disconnected.cancel()
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def route(self, path):
+        if time.monotonic() >= self.routes.next_scan:
+            await self.blocking(self.routes.refresh)
+        route = self.routes.routes.get(path)
+        if route is None and self.routes.collections:
+            route = await self.blocking(self.routes.collection_route, path)
+        return route
+
+    async def template_response(self, env, route):
+        if not route or not route.template:
+            return
+        if self.is_head(env):
+            head = await self.blocking(self.head_template, env, route)
+            if head:
+                return self.head_reply(*head)
+            return
+        if self.stream:
+            return await self.stream_response(env, route)
+        try:
+            page = await self.render_page(route)
+        except TemplateNotFound as error:
+            self.forget_deleted_route(route, error)
+            return
+        encoding = self.negotiate_encoding(env, 'text/html', len(page.body))
+        etag = self.encoded_etag(page.etag, encoding)
+        headers = self.validators(etag, page.last_modified) + self.encoding_headers('text/html', encoding)
+        if self.not_modified(env, etag, page.last_modified):
+            return self.reply('304 Not Modified', headers=headers)
+        body = await self.blocking(self.encoded_body, self.page_key(route), page.etag, encoding, lambda: page.body)
+        return self.reply('200 OK', 'text/html', body, headers)
+
+    async def stream_response(self, env, route):
+        try:
+            fingerprint = await self.blocking(self.fingerprint, route)
+            compiled = await self.blocking(self.template_renderer.load, route.template)
+        except TemplateNotFound as error:
+            self.forget_deleted_route(route, error)
+            return
+        etag, last_modified = self.stream_validators(fingerprint)
+        encoding = self.negotiate_encoding(env, 'text/html', self.compress_min_size)
+        headers = self.encoding_headers('text/html', encoding)
+        if etag:
+            etag = self.encoded_etag(etag, encoding)
+            headers = self.validators(etag, last_modified) + headers
+            if self.not_modified(env, etag, last_modified):
+                return self.reply('304 Not Modified', headers=headers)
+        body = self.rendered_chunks(compiled, route.context, encoding)
+        return '200 OK', [('Content-Type', 'text/html')] + headers, body
+
+    async def rendered_chunks(self, compiled, context, encoding):
+        compress_chunk, flush = compression.stream_compressor(encoding) if encoding else (None, None)
+        buffer = []
+        size = 0
+        async for piece in compiled.generate_async(context or {}):
+            buffer.append(piece)
+            size += len(piece)
+            if size < self.chunk_size:
+                continue
+            chunk = ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+            yield compress_chunk(chunk) if encoding else chunk
+        chunk = ''.join(buffer).encode('utf-8')
+        if self.live_reload is not None:
+            chunk += self.live_reload.script
+        if encoding:
+            yield compress_chunk(chunk) + flush()
+        elif chunk:
+            yield chunk
+
+    async def static_response(self, env, route):
+        if not route or route.template:
+            return
+        mime = self.guess_mime(route.path)
+        encoding = None
+        if route.size <= self.compress_max_size and not self.wants_range(env):
+            encoding = self.negotiate_encoding(env, mime, route.size)
+        etag = self.static_etag(route.size, route.mtime_ns)
+        last_modified = route.mtime_ns / 1e9
+        headers = self.validators(self.encoded_etag(etag, encoding), last_modified) + self.encoding_headers(mime, encoding)
+        if self.not_modified(env, self.encoded_etag(etag, encoding), last_modified):
+            return self.reply('304 Not Modified', headers=headers)
+        if self.is_head(env):
+            return self.head_reply(*self.head_static(route, mime, etag, encoding, headers))
+        if encoding:
+            try:
+                body = await self.blocking(self.encoded_body, route.path, etag, encoding,
+                    lambda: self.read_file(route.path))
+            except OSError:
+                self.routes.invalidate()
+                return
+            return self.reply('200 OK', mime, body, headers)
+        try:
+            f = await self.blocking(open, route.path, 'rb')
+        except OSError:
+            self.routes.invalidate()
+            return
+        file_stat = os.fstat(f.fileno())
+        etag = self.static_etag(file_stat.st_size, file_stat.st_mtime_ns)
+        headers = self.validators(etag, file_stat.st_mtime) + self.encoding_headers(mime, None)
+        headers.append(('Accept-Ranges', 'bytes'))
+        ranges = self.requested_ranges(env, file_stat.st_size, etag, file_stat.st_mtime)
+        if ranges is not None:
+            status, headers, body = self.partial(f, file_stat.st_size, ranges, mime, headers)
+            return status, headers, self.range_chunks(body)
+        headers = [
+            ('Content-Type', mime),
+            ('Content-Length', str(file_stat.st_size)),
+        ] + headers
+        return '200 OK', headers, self.file_chunks(f)
+
+    async def file_chunks(self, f):
+        try:
+            while True:
+                chunk = await self.blocking(f.read, self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+
+    async def range_chunks(self, ranges):
+        chunks = iter(ranges)
+        try:
+            while True:
+                chunk = await self.blocking(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            ranges.close()
+
+    async def not_found_response(self, env, path):
+        route = await self.route('/404') if '.' not in path else None
+        if route and route.template and self.is_head(env):
+            return self.head_reply('404 Not Found', 'text/html', None, [])
+        if route and route.template:
+            page = await self.render_page(route)
+            return self.reply('404 Not Found', 'text/html', page.body)
+
+    async def render_page(self, route):
+        key = self.page_key(route)
+        fingerprint = await self.blocking(self.fingerprint, route)
+        page = self.page_cache.get(key, fingerprint)
+        if page is None:
+            compiled = await self.blocking(self.template_renderer.load, route.template)
+            page = self.page((await compiled.render_async(route.context or {})).encode('utf-8'), fingerprint)
+            self.page_cache.put(key, fingerprint, page, len(page.body))
+        return page
+
+    def blocking(self, function, *args):
+        return asyncio.get_event_loop().run_in_executor(self.executor, function, *args)
+
+    def reply(self, status, mime='text/html', data='', headers=()):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if status.startswith('304'):
+            return status, list(headers), b''
+        return status, [
+            ('Content-Type', mime),
+            ('Content-Length', str(len(data))),
+        ] + list(headers), data
+
+    def head_reply(self, status, mime, length, headers):
+        status, headers = self.head_headers(status, mime, length, headers)
+        return status, headers, b''
+
+    async def send_response(self, send, response):
+        status, headers, body = response
+        await send({
+            'type': 'http.response.start',
+            'status': int(status[:3]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        if isinstance(body, bytes):
+            await send({'type': 'http.response.body', 'body': body})
+            return
+        try:
+            async for chunk in body:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            await body.aclose()
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+def serve(app, bind=None):
+    host, port = parse_bind(bind)
+    try:
+        import uvicorn
+    except ImportError:
+        AsgiServer(app, host, port).run()
+    else:
+        uvicorn.run(app, host=host, port=port)
+
+
+def parse_bind(bind):
+    if not bind:
+        return '127.0.0.1', 8000
+    host, _, port = bind.rpartition(':')
+    if not port.isdigit():
+        raise ValueError('--bind must look like HOST:PORT')
+    return host.strip('[]') or '127.0.0.1', int(port)
@@ -0,0 +1,148 @@
+from http import HTTPStatus
+from urllib.parse import unquote
+import asyncio
+import traceback
+
+
+class AsgiServer(object):
+
+    max_header_size = 64 * 1024
+    keep_alive_timeout = 75
+
+    def __init__(self, app, host='127.0.0.1', port=8000):
+        self.app = app
+        self.host = host
+        self.port = port
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self):
+        server = await self.start()
+        async with server:
+            await server.serve_forever()
+
+    def start(self):
+        return asyncio.start_server(self.handle_connection, self.host, self.port, limit=self.max_header_size)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await asyncio.wait_for(self.read_request(reader, writer), self.keep_alive_timeout)
+                if request is None or not await self.respond(request, writer):
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader, writer):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as error:
+            if error.partial.strip():
+                raise
+            return None
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, version = lines[0].split(' ')
+        headers = []
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers.append((name.strip().lower(), value.strip()))
+        fields = dict(headers)
+        if 'transfer-encoding' in fields:
+            raise ValueError('Chunked request bodies are not supported')
+        body = await reader.readexactly(int(fields.get('content-length', 0)))
+        connection = fields.get('connection', '').lower()
+        keep_alive = version == 'HTTP/1.1' and connection != 'close' or connection == 'keep-alive'
+        path, _, query = target.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0', 'spec_version': '2.1'},
+            'http_version': version[5:],
+            'method': method.upper(),
+            'scheme': 'http',
+            'path': unquote(path),
+            'raw_path': path.encode('latin-1'),
+            'query_string': query.encode('latin-1'),
+            'root_path': '',
+            'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            'server': (self.host, self.port),
+            'client': (writer.get_extra_info('peername') or (None, None))[:2],
+        }
+        return scope, body, keep_alive
+
+    async def respond(self, request, writer):
+        scope, body, keep_alive = request
+        state = {'started': False, 'chunked': False, 'keep_alive': keep_alive, 'received': False}
+        head_only = scope['method'] == 'HEAD'
+        finished = asyncio.get_event_loop().create_future()
+
+        async def receive():
+            if state['received']:
+                await finished
+                return {'type': 'http.disconnect'}
+            state['received'] = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = [(name.decode('latin-1'), value.decode('latin-1'))
+                    for name, value in message.get('headers', [])]
+                names = set(name.lower() for name, _ in headers)
+                has_body = status >= 200 and status not in (204, 304) and not head_only
+                if has_body and 'content-length' not in names:
+                    if scope['http_version'] == '1.1':
+                        state['chunked'] = True
+                        headers.append(('Transfer-Encoding', 'chunked'))
+                    else:
+                        state['keep_alive'] = False
+                if not state['keep_alive']:
+                    headers.append(('Connection', 'close'))
+                lines = ['HTTP/1.1 {} {}'.format(status, self.reason(status))]
+                lines.extend('{}: {}'.format(name, value) for name, value in headers)
+                writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+                state['started'] = True
+            elif message['type'] == 'http.response.body':
+                data = message.get('body', b'')
+                if data and not head_only:
+                    if state['chunked']:
+                        writer.write('{:x}\r\n'.format(len(data)).encode('latin-1') + data + b'\r\n')
+                    else:
+                        writer.write(data)
+                if state['chunked'] and not message.get('more_body', False):
+                    writer.write(b'0\r\n\r\n')
+                await writer.drain()
+
+        try:
+            await self.app(scope, receive, send)
+        except asyncio.CancelledError:
+            raise
+        except ConnectionError:
+            if state['started']:
+                return False
+            raise
+        except Exception:
+            traceback.print_exc()
+            if state['started']:
+                return False
+            state['keep_alive'] = False
+            await send({'type': 'http.response.start', 'status': 500,
+                'headers': [(b'Content-Type', b'text/plain'), (b'Content-Length', b'21')]})
+            await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+        finally:
+            if not finished.done():
+                finished.set_result(None)
+        return state['keep_alive']
+
+    def reason(self, status):
+        try:
+            return HTTPStatus(status).phrase
+        except ValueError:
+            return ''
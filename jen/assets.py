@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+
+from .manifest import file_hash
+
+
+class AssetManifest(object):
+
+    filename = '.jen-assets.json'
+    hash_length = 10
+
+    def __init__(self, files=None):
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, directory):
+        try:
+            with open(os.path.join(directory, cls.filename), 'r') as f:
+                return cls(json.load(f)['files'])
+        except (OSError, ValueError, KeyError):
+            return cls()
+
+    def save(self, directory):
+        with open(os.path.join(directory, self.filename), 'w') as f:
+            json.dump({'files': self.files}, f, indent=1, sort_keys=True)
+
+    def update(self, previous, source, relative_paths, threads=None, variants=None):
+        variants = variants or {}
+        pending = []
+        for relative_path in relative_paths:
+            stat = os.stat(os.path.join(source, relative_path))
+            entry = {'mtime': stat.st_mtime, 'size': stat.st_size}
+            if relative_path in variants:
+                entry['variant'] = variants[relative_path]
+            old_entry = previous.files.get(relative_path)
+            if old_entry and old_entry['mtime'] == entry['mtime'] and old_entry['size'] == entry['size'] and (
+                    old_entry.get('variant') == entry.get('variant')):
+                self.files[relative_path] = dict(old_entry)
+            else:
+                self.files[relative_path] = entry
+                pending.append(relative_path)
+        paths = [os.path.join(source, relative_path) for relative_path in pending]
+        with ThreadPoolExecutor(threads or os.cpu_count()) as executor:
+            for relative_path, digest in zip(pending, executor.map(file_hash, paths)):
+                entry = self.files[relative_path]
+                if 'variant' in entry:
+                    digest = hashlib.sha1((digest + entry['variant']).encode('utf-8')).hexdigest()
+                entry['hash'] = digest
+                entry['path'] = fingerprinted_path(relative_path, digest[:self.hash_length])
+        return [relative_path for relative_path in pending
+            if previous.files.get(relative_path, {}).get('path') != self.files[relative_path]['path']]
+
+    def remove(self, relative_path):
+        self.files.pop(relative_path, None)
+
+    def urls(self):
+        return dict((relative_path, entry['path']) for relative_path, entry in self.files.items())
+
+
+def fingerprinted_path(relative_path, digest):
+    directory, filename = os.path.split(relative_path)
+    name, extension = os.path.splitext(filename)
+    return os.path.join(directory, name + '.' + digest + extension)
@@ -1,7 +1,15 @@
-from shutil import copyfile
+from collections import deque
+import itertools
 import os
+import shutil
+
+from jinja2.exceptions import TemplateError
 
 from .cli import CliCommand
+from .collection import CONFIG, load_collections
+from .data import DIRECTORY, is_data_path
+from .dependencies import DependencyGraph
+from .manifest import Manifest
 from .template_renderer import TemplateRenderer
 
 
@@ -10,48 +18,674 @@ class Build(CliCommand):
     name = 'build'
     usage = 'jen build <source> <target>'
     description = 'Build contents from <source> and output results to <target>'
+    options = (
+        ('--jobs=N', 'Render templates on N worker processes'),
+        ('--incremental', 'Only rebuild outputs whose sources or dependencies changed'),
+        ('--cache-dir=DIR', 'Keep compiled templates in DIR between runs'),
+        ('--precompress', 'Write .gz (and .br, with brotli) files next to text outputs'),
+        ('--static-mode=MODE', 'How static files are written: copy, hardlink, reflink or symlink'),
+        ('--minify', 'Minify HTML pages and CSS and JS files'),
+        ('--profile[=N]', 'Time every output and show the N slowest (default: 10)'),
+        ('--profile-output=FILE', 'Save a Chrome trace (.json) or a cProfile dump (any other name)'),
+        ('--fingerprint', 'Also write static files as name.<hash>.ext and resolve asset() to them'),
+        ('--replace', 'Replace an existing <target> in one atomic swap when the build is done'),
+        ('--watch', 'Keep running and rebuild affected outputs when sources change'),
+    )
+
+    jobs = 1
+    incremental = False
+    cache_directory = None
+    target_directory = None
+    data_directory = None
+    collections = {}
+    collection_batch_size = 64
+    precompress = False
+    precompress_min_size = 256
+    static_mode = 'copy'
+    minify = False
+    minifier = None
+    minify_report = None
+    fingerprint_assets = False
+    replace = False
+    profile = 0
+    profiler = None
+    writer = None
+    writer_threads = 4
+    debounce = 0.2
 
-    def run(self, source, target):
+    def run(self, source, target, jobs=1, incremental=False, cache_dir=None, precompress=False, static_mode='copy',
+            minify=False, profile=False, profile_output=None, fingerprint=False, replace=False,
+            watch=False):
+        from .output_writer import staging_directory, swap_directories
+        from .static_files import MODES
         source = os.path.realpath(source)
         target = os.path.realpath(target)
+        self.jobs = self.int_option('jobs', jobs, os.cpu_count() or 1)
+        self.incremental = incremental
+        self.cache_directory = os.path.realpath(cache_dir) if cache_dir else None
+        self.target_directory = target
+        self.precompress = precompress
+        self.static_mode = static_mode
+        self.minify = minify
+        self.fingerprint_assets = fingerprint
+        self.replace = replace
+        self.profile = self.int_option('profile', profile or True, 10) if profile or profile_output else 0
+        if self.static_mode not in MODES:
+            self.abort('ERROR:', '--static-mode must be one of: ' + ', '.join(MODES))
         if not os.path.isdir(source):
             self.abort('ERROR:', 'source must be a valid directory')
-        if os.path.exists(target):
+        if is_inside(source, target) or is_inside(target, source):
+            self.abort('ERROR:', 'source and target directories must not overlap')
+        if os.path.exists(target) and not self.incremental and not self.replace:
             self.abort('ERROR:', 'target directory already exists')
-        self.build(source, target)
+        output = target if self.incremental else staging_directory(target)
+        try:
+            if profile_output and not profile_output.endswith('.json'):
+                import cProfile
+                profiler = cProfile.Profile()
+                profiler.runcall(self.build, source, target, output)
+                profiler.dump_stats(profile_output)
+            else:
+                self.build(source, target, output)
+            if output != target:
+                swap_directories(output, target)
+        except BaseException:
+            if output != target and os.path.exists(output):
+                shutil.rmtree(output)
+            raise
+        if self.profiler:
+            self.echo()
+            self.profiler.report(self.echo, self.template_graph(source), self.profile)
+        if profile_output and profile_output.endswith('.json'):
+            self.profiler.write_trace(profile_output)
+        if watch:
+            self.watch(source, target)
+
+    def watch(self, source, target):
+        from .watcher import watch
+        watcher = watch(source, excluded=[self.cache_directory, target])
+        watcher.settle = self.debounce
+        graph = self.template_graph(source)
+        self.profiler = None
+        self.echo('Watching', source, 'for changes, press Ctrl+C to stop')
+        try:
+            while True:
+                changed = watcher.wait()
+                if changed:
+                    self.rebuild(source, target, changed, graph)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+
+    def rebuild(self, source, target, changed, graph):
+        if None in changed:
+            changed = set(self.relative_path(source, path) for path in self.get_files_from_directory(source))
+        changed = self.expand_directories(source, target, changed)
+        templates = set(path for path in changed if path.endswith('.html'))
+        data_paths = set(path for path in changed if is_data_path(path))
+        for relative_path in templates:
+            if os.path.isfile(os.path.join(source, relative_path)):
+                try:
+                    graph.add(relative_path, self.template_renderer.template_dependencies(relative_path))
+                except TemplateError:
+                    graph.add(relative_path, [None])
+            else:
+                graph.remove(relative_path)
+        self.template_renderer.invalidate(templates)
+        affected = changed | graph.dependents_of(templates | data_paths)
+        if templates or data_paths:
+            affected |= set(template for template in graph.edges if graph.is_dynamic(template))
+        if self.fingerprint_assets and self.rebuild_assets(source, target, changed - templates):
+            affected |= self.asset_users(graph)
+        self.create_output_directories(source, target,
+            [path for path in (os.path.join(source, relative_path) for relative_path in affected) if os.path.isfile(path)])
+        written = []
+        for relative_path in sorted(affected):
+            path = os.path.join(source, relative_path)
+            if not self.is_static(path) and not self.is_template(path):
+                continue
+            try:
+                if not os.path.isfile(path):
+                    self.remove_output(target, relative_path)
+                    continue
+                if self.is_static(path):
+                    self.copy_static(source, target, path)
+                else:
+                    self.render_template(source, target, path)
+            except (OSError, TemplateError) as error:
+                self.echo('ERROR:', relative_path, str(error))
+                continue
+            written.append(path)
+        self.rebuild_collections(source, target, changed, affected, graph)
+        if self.incremental:
+            self.track_changes(source, affected, graph)
+        if self.precompress or self.incremental:
+            self.compress_outputs(source, target, written)
+        if self.incremental:
+            self.manifest.save(target)
+
+    def expand_directories(self, source, target, changed):
+        expanded = set()
+        for relative_path in changed:
+            for root in (source, target):
+                directory = os.path.join(root, relative_path)
+                if os.path.isdir(directory):
+                    expanded.update(self.relative_path(root, path) for path in self.get_files_from_directory(directory))
+                    break
+            else:
+                expanded.add(relative_path)
+        return expanded
+
+    def rebuild_collections(self, source, target, changed, affected, graph):
+        if CONFIG in changed:
+            try:
+                self.collections = load_collections(source)
+            except ValueError as error:
+                self.echo('ERROR:', str(error))
+                return
+            if self.incremental:
+                for name in sorted(set(self.manifest.collections) - set(self.collections)):
+                    for output in self.manifest.collections.pop(name)['outputs']:
+                        self.remove_output(target, output)
+        names = []
+        for name, collection in sorted(self.collections.items()):
+            try:
+                inputs = self.collection_inputs(collection, graph)
+            except ValueError as error:
+                self.echo('ERROR:', str(error))
+                continue
+            if CONFIG in changed or None in inputs or inputs & affected:
+                names.append(name)
+        try:
+            self.build_collections(source, target, names)
+        except (OSError, TemplateError, ValueError) as error:
+            self.echo('ERROR:', str(error))
+
+    def rebuild_assets(self, source, target, relative_paths):
+        from .assets import AssetManifest
+        previous = AssetManifest(dict(self.asset_manifest.files))
+        existing = []
+        for relative_path in relative_paths:
+            if os.path.isfile(os.path.join(source, relative_path)):
+                existing.append(relative_path)
+            else:
+                self.asset_manifest.remove(relative_path)
+        changed = self.asset_manifest.update(previous, source, existing, variants=self.asset_variants(source, existing))
+        removed = set(previous.files) - set(self.asset_manifest.files)
+        for relative_path in set(changed) | removed:
+            if relative_path in previous.files and 'path' in previous.files[relative_path]:
+                self.remove_output(target, previous.files[relative_path]['path'])
+        self.assets.clear()
+        self.assets.update(self.asset_manifest.urls())
+        self.save_assets(target)
+        return changed or removed
+
+    def track_changes(self, source, relative_paths, graph):
+        for relative_path in relative_paths:
+            path = os.path.join(source, relative_path)
+            if not os.path.isfile(path):
+                self.manifest.files.pop(relative_path, None)
+                continue
+            self.manifest.track(self.manifest, relative_path, path)
+            entry = self.manifest.files[relative_path]
+            entry['outputs'] = self.outputs_of(relative_path) if self.is_static(path) or self.is_template(path) else []
+            self.mark_minified(entry, path)
+            if path.endswith('.html'):
+                entry['dependencies'] = graph.edges.get(relative_path, [])
 
-    def build(self, source, target):
-        self.template_renderer = TemplateRenderer(source)
+    def remove_output(self, target, relative_path):
+        from . import compression
+        output_path = os.path.join(target, relative_path)
+        self.remove_outputs(target, [relative_path + extension for extension in compression.EXTENSIONS.values()])
+        if os.path.exists(output_path):
+            os.remove(output_path)
+            self.remove_empty_directories(target, os.path.dirname(output_path))
+            self.echo('REMOVED:', relative_path)
+
+    def build(self, source, target, output=None):
+        output = output or target
+        self.template_renderer = TemplateRenderer(source, self.cache_directory)
+        self.data_directory = os.path.join(source, DIRECTORY)
+        self.collections = self.load_collections(source)
+        if self.profile:
+            from .profiler import BuildProfile
+            self.profiler = BuildProfile()
+        else:
+            self.profiler = None
+        if self.minify:
+            from .minify import Minifier, MinifyReport
+            self.minifier = Minifier(os.path.join(self.cache_directory, 'minify') if self.cache_directory else None)
+            self.minify_report = MinifyReport()
         filepaths = self.get_files_from_directory(source)
+        changed_assets = self.update_assets(source, target, filepaths)
+        collections = sorted(self.collections)
+        if self.incremental:
+            filepaths = self.plan_incremental(source, target, filepaths, changed_assets)
+            collections = self.planned_collections
+        self.create_output_directories(source, output, filepaths)
+        if self.jobs > 1:
+            self.build_in_parallel(source, output, filepaths)
+        else:
+            self.build_serially(source, output, filepaths)
+        self.build_collections(source, output, collections)
+        if self.precompress or self.incremental:
+            self.compress_outputs(source, output, filepaths)
+        if self.incremental:
+            self.manifest.save(target)
+        self.save_assets(output)
+        if self.minify_report:
+            from .profiler import format_size
+            self.minify_report.report(self.echo, format_size)
+        if self.profiler:
+            self.profiler.stop()
+
+    def create_output_directories(self, source, target, filepaths):
+        from .output_writer import create_directories
+        outputs = []
         for path in filepaths:
-            if self.is_static(path):
-                self.copy_static(source, target, path)
-            if self.is_template(path):
-                self.render_template(source, target, path)
+            if self.is_static(path) or self.is_template(path):
+                outputs.extend(self.outputs_of(self.relative_path(source, path)))
+        create_directories(target, outputs)
+
+    def build_serially(self, source, target, filepaths):
+        from .output_writer import OutputWriter
+        self.writer = OutputWriter(self.writer_threads)
+        try:
+            for path in filepaths:
+                if self.is_static(path):
+                    self.copy_static(source, target, path)
+                if self.is_template(path):
+                    self.render_template(source, target, path)
+        finally:
+            writer, self.writer = self.writer, None
+            writer.close()
+
+    def update_assets(self, source, target, filepaths):
+        from .assets import AssetManifest
+        previous = AssetManifest.load(target)
+        self.asset_manifest = AssetManifest()
+        changed = []
+        if self.fingerprint_assets:
+            static_paths = [self.relative_path(source, path) for path in filepaths if self.is_static(path)]
+            changed = self.asset_manifest.update(previous, source, static_paths,
+                variants=self.asset_variants(source, static_paths))
+        self.assets = self.asset_manifest.urls()
+        self.template_renderer.assets = self.assets
+        return changed + sorted(set(previous.files) - set(self.asset_manifest.files))
+
+    def asset_variants(self, source, relative_paths):
+        return dict((relative_path, 'minify-' + self.minifier.version) for relative_path in relative_paths
+            if self.minifies(os.path.join(source, relative_path)))
+
+    def save_assets(self, target):
+        from .assets import AssetManifest
+        if self.fingerprint_assets:
+            self.asset_manifest.save(target)
+        elif os.path.exists(os.path.join(target, AssetManifest.filename)):
+            os.remove(os.path.join(target, AssetManifest.filename))
+
+    def asset_users(self, graph):
+        users = set()
+        for template in graph.edges:
+            try:
+                if self.template_renderer.uses_assets(template):
+                    users.add(template)
+            except TemplateError:
+                users.add(template)
+        return users | graph.dependents_of(users)
+
+    def outputs_of(self, relative_path):
+        if relative_path in self.assets:
+            return [relative_path, self.assets[relative_path]]
+        return [relative_path]
+
+    def template_graph(self, source):
+        graph = DependencyGraph()
+        for path in self.get_files_from_directory(source):
+            if path.endswith('.html'):
+                relative_path = self.relative_path(source, path)
+                try:
+                    graph.add(relative_path, self.template_renderer.template_dependencies(relative_path))
+                except TemplateError:
+                    graph.add(relative_path, [None])
+        return graph
+
+    def compress_outputs(self, source, target, written_paths):
+        from concurrent.futures import ThreadPoolExecutor
+        from . import compression
+        written = [self.relative_path(source, path) for path in written_paths
+            if self.is_static(path) or self.is_template(path)]
+        if self.incremental:
+            written = set(written)
+            pending = []
+            for relative_path, entry in sorted(self.manifest.files.items()):
+                if 'compressed' in entry and (relative_path in written or not self.precompress):
+                    self.remove_outputs(target, entry.pop('compressed'))
+                if self.precompress and 'compressed' not in entry and entry['outputs']:
+                    pending.append(relative_path)
+        else:
+            pending = written
+        if not self.precompress:
+            return
+        encodings = compression.available_encodings()
+        outputs = [(relative_path, output) for relative_path in pending for output in self.outputs_of(relative_path)]
+        paths = [os.path.join(target, output) for _, output in outputs]
+        with ThreadPoolExecutor(os.cpu_count()) as threads:
+            results = threads.map(compression.precompress_file, paths,
+                [encodings] * len(paths), [self.precompress_min_size] * len(paths))
+            for (relative_path, _), variants in zip(outputs, results):
+                if self.incremental:
+                    entry = self.manifest.files[relative_path]
+                    compressed = entry.setdefault('compressed', [])
+                    compressed.extend(self.relative_path(target, variant) for variant in variants)
+
+    def remove_outputs(self, target, outputs):
+        for output in outputs:
+            output_path = os.path.join(target, output)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+    def plan_incremental(self, source, target, filepaths, changed_assets=()):
+        previous = Manifest.load(target)
+        self.manifest = Manifest()
+        changed = set()
+        for path in filepaths:
+            relative_path = self.relative_path(source, path)
+            if self.manifest.track(previous, relative_path, path):
+                changed.add(relative_path)
+        removed = set(previous.files) - set(self.manifest.files)
+        self.prune(target, previous, removed)
+        graph = DependencyGraph()
+        for path in filepaths:
+            relative_path = self.relative_path(source, path)
+            entry = self.manifest.files[relative_path]
+            entry['outputs'] = self.outputs_of(relative_path) if self.is_static(path) or self.is_template(path) else []
+            old_outputs = previous.files.get(relative_path, {}).get('outputs', [])
+            self.remove_outputs(target, [output for output in old_outputs if output not in entry['outputs']])
+            if path.endswith('.html'):
+                if relative_path in changed or 'dependencies' not in entry:
+                    try:
+                        entry['dependencies'] = self.template_renderer.template_dependencies(relative_path)
+                    except TemplateError:
+                        entry['dependencies'] = [None]
+                graph.add(relative_path, entry['dependencies'])
+        dirty = changed | removed
+        asset_users = self.asset_users(graph) if changed_assets else set()
+        planned = []
+        for path in filepaths:
+            relative_path = self.relative_path(source, path)
+            entry = self.manifest.files[relative_path]
+            if not entry['outputs']:
+                continue
+            if entry.get('minified', False) != self.minifies(path):
+                self.mark_minified(entry, path)
+                planned.append(path)
+            elif relative_path in changed or not self.outputs_exist(target, entry['outputs']):
+                planned.append(path)
+            elif self.is_template(path) and (graph.is_dynamic(relative_path) or graph.dependencies_of(relative_path) & dirty
+                    or relative_path in asset_users):
+                planned.append(path)
+        self.planned_collections = self.plan_collections(target, previous, dirty | asset_users, graph)
+        return planned
+
+    def plan_collections(self, target, previous, dirty, graph):
+        for name in sorted(set(previous.collections) - set(self.collections)):
+            for output in previous.collections[name]['outputs']:
+                self.remove_output(target, output)
+        planned = []
+        for name, collection in sorted(self.collections.items()):
+            entry = previous.collections.get(name)
+            self.manifest.collections[name] = entry or {'outputs': []}
+            inputs = self.collection_inputs(collection, graph)
+            if entry is None or entry.get('minified', False) != self.minify or None in inputs or inputs & dirty:
+                planned.append(name)
+        return planned
+
+    def collection_inputs(self, collection, graph):
+        inputs = set(collection.sources())
+        for template in collection.templates():
+            inputs.add(template)
+            inputs |= graph.dependencies_of(template)
+        return inputs
+
+    def load_collections(self, source):
+        try:
+            collections = load_collections(source)
+            for collection in collections.values():
+                collection.data_file()
+        except ValueError as error:
+            self.abort('ERROR:', str(error))
+        return collections
+
+    def build_collections(self, source, target, names):
+        from .output_writer import OutputWriter
+        if not names:
+            return
+        processes = None
+        if self.jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            self.template_renderer.data.preload()
+            processes = ProcessPoolExecutor(self.jobs, initializer=_init_worker, initargs=(self,))
+        else:
+            self.writer = OutputWriter(self.writer_threads)
+        try:
+            for name in names:
+                self.build_collection(source, target, self.collections[name], processes)
+        finally:
+            if processes is not None:
+                processes.shutdown()
+            else:
+                writer, self.writer = self.writer, None
+                writer.close()
+
+    def build_collection(self, source, target, collection, processes):
+        outputs = [] if self.incremental else None
+        pending = deque()
+        count = 0
+        pages = collection.pages()
+        while True:
+            batch = list(itertools.islice(pages, self.collection_batch_size))
+            if not batch:
+                break
+            count += len(batch)
+            if outputs is not None:
+                outputs.extend(relative_path for relative_path, _, _ in batch)
+            if processes is None:
+                self.add_records(self.write_pages(target, batch))
+                continue
+            if len(pending) >= self.jobs * 2:
+                self.add_records(pending.popleft().result())
+            pending.append(processes.submit(_write_pages, source, target, batch))
+        while pending:
+            self.add_records(pending.popleft().result())
+        if outputs is not None:
+            self.update_collection_outputs(target, collection.name, outputs)
+        self.echo('OK:', '{} ({} pages)'.format(collection.name, count))
+
+    def update_collection_outputs(self, target, name, outputs):
+        current = set(outputs)
+        for output in self.manifest.collections.get(name, {}).get('outputs', []):
+            if output not in current:
+                self.remove_output(target, output)
+        self.manifest.collections[name] = {'outputs': outputs}
+        if self.minify:
+            self.manifest.collections[name]['minified'] = True
+
+    def write_pages(self, target, pages):
+        from . import compression
+        from .output_writer import create_directories
+        create_directories(target, [relative_path for relative_path, _, _ in pages])
+        records = [self.write_page(target, relative_path, template, context) for relative_path, template, context in pages]
+        if self.precompress:
+            if self.writer is not None:
+                self.writer.raise_errors()
+            encodings = compression.available_encodings()
+            for relative_path, _, _ in pages:
+                compression.precompress_file(os.path.join(target, relative_path), encodings, self.precompress_min_size)
+        return records
+
+    def write_page(self, target, relative_path, template, context):
+        from .profiler import Timer
+        timer = Timer(relative_path, 'template')
+        return self.write_rendered(os.path.join(target, relative_path), template, context, timer)
+
+    def minifies(self, path):
+        if self.minifier is None or self.minifier.kind_of(path) is None:
+            return False
+        return self.is_static(path) or self.is_template(path)
+
+    def mark_minified(self, entry, path):
+        if self.minifies(path):
+            entry['minified'] = True
+        else:
+            entry.pop('minified', None)
+
+    def outputs_exist(self, target, outputs):
+        return all(os.path.exists(os.path.join(target, output)) for output in outputs)
+
+    def prune(self, target, previous, removed):
+        for relative_path in sorted(removed):
+            entry = previous.files[relative_path]
+            self.remove_outputs(target, entry.get('compressed', []))
+            for output in entry.get('outputs', []):
+                output_path = os.path.join(target, output)
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                    self.remove_empty_directories(target, os.path.dirname(output_path))
+                    self.echo('REMOVED:', output)
+
+    def remove_empty_directories(self, target, directory):
+        while directory != target and directory.startswith(target) and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+
+    def build_in_parallel(self, source, target, filepaths):
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        static_paths = [path for path in filepaths if self.is_static(path) and not self.minifies(path)]
+        minified_paths = [path for path in filepaths if self.is_static(path) and self.minifies(path)]
+        template_paths = [path for path in filepaths if self.is_template(path)]
+        chunksize = max(1, len(template_paths) // (self.jobs * 4))
+        self.template_renderer.data.preload()
+        with ThreadPoolExecutor(self.jobs) as threads:
+            with ProcessPoolExecutor(self.jobs, initializer=_init_worker, initargs=(self,)) as processes:
+                copied = threads.map(self.write_static, [source] * len(static_paths),
+                    [target] * len(static_paths), static_paths)
+                rendered = processes.map(_write_template, [source] * len(template_paths),
+                    [target] * len(template_paths), template_paths, chunksize=chunksize)
+                minified = processes.map(_write_static, [source] * len(minified_paths),
+                    [target] * len(minified_paths), minified_paths)
+                done = dict(zip(template_paths, rendered))
+                done.update(zip(static_paths, copied))
+                done.update(zip(minified_paths, minified))
+        for path in filepaths:
+            if path in done:
+                self.add_record(done[path])
+                self.echo('OK:', self.relative_path(source, path))
 
     def copy_static(self, source, target, path):
+        if self.writer is None:
+            self.add_record(self.write_static(source, target, path))
+        else:
+            self.writer.submit(self.write_static, source, target, path).add_done_callback(self.add_record_of)
+        self.echo('OK:', self.relative_path(source, path))
+
+    def write_static(self, source, target, path):
+        from .output_writer import write_file
+        from .profiler import Timer
+        from .static_files import copy_static_file
         relative_path = self.relative_path(source, path)
+        timer = Timer(relative_path, 'static')
         target_path = os.path.join(target, relative_path)
-        target_dir = os.path.dirname(target_path)
-        self.ensure_directory(target_dir)
-        copyfile(path, target_path)
-        self.echo('OK:', relative_path)
+        kind = self.minifier.kind_of(path) if self.minifier else None
+        if kind:
+            with open(path, 'rb') as f:
+                data = f.read()
+            timer.lap('copy')
+            write_file(target_path, self.minify_data(kind, data, timer))
+        else:
+            copy_static_file(path, target_path, self.static_mode)
+        if relative_path in self.assets:
+            fingerprinted_path = os.path.join(target, self.assets[relative_path])
+            copy_static_file(target_path, fingerprinted_path, 'hardlink')
+        timer.lap('copy')
+        return timer.stop(os.path.getsize(target_path))
 
     def render_template(self, source, target, path):
+        self.add_record(self.write_template(source, target, path))
+        self.echo('OK:', self.relative_path(source, path))
+
+    def write_template(self, source, target, path):
+        from .profiler import Timer
         relative_path = self.relative_path(source, path)
+        timer = Timer(relative_path, 'template')
         relative_path_without_extension = relative_path[:-5]
         target_path = os.path.join(target, relative_path)
-        target_dir = os.path.dirname(target_path)
-        self.ensure_directory(target_dir)
-        body = self.template_renderer.render_page(relative_path_without_extension)
-        with open(target_path, 'w') as f:
-            f.write(body)
-        self.echo('OK:', relative_path)
+        template = self.template_renderer.template_for_path(relative_path_without_extension)
+        timer.lap('resolve')
+        return self.write_rendered(target_path, template, None, timer)
+
+    def write_rendered(self, target_path, template, context, timer):
+        chunks = self.template_renderer.stream(template, context=context)
+        timer.lap('compile')
+        if self.minifier:
+            data = ''.join(chunks).encode('utf-8')
+            timer.lap('render')
+            return self.write_data(target_path, self.minify_data(self.minifier.kind_of(target_path), data, timer), timer)
+        first = next(chunks, '')
+        timer.lap('render')
+        second = next(chunks, None)
+        if second is None and self.writer is not None:
+            return self.write_data(target_path, first.encode('utf-8'), timer)
+        chunks = itertools.chain([first], [] if second is None else [second], chunks)
+        temp_path = target_path + '.jen-tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for chunk in chunks:
+                    timer.lap('render')
+                    f.write(chunk)
+                    timer.lap('write')
+            os.replace(temp_path, target_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return timer.stop(os.path.getsize(target_path))
+
+    def write_data(self, target_path, data, timer):
+        from .output_writer import write_file
+        if self.writer is not None:
+            self.writer.write(target_path, data)
+        else:
+            write_file(target_path, data)
+        timer.lap('write')
+        return timer.stop(len(data))
+
+    def minify_data(self, kind, data, timer):
+        minified = self.minifier.minify(kind, data)
+        timer.lap('minify')
+        timer.record['minified'] = (kind, len(data), len(minified))
+        return minified
+
+    def add_record(self, record):
+        if self.minify_report and record and 'minified' in record:
+            self.minify_report.add(*record['minified'])
+        if self.profiler:
+            self.profiler.add(record)
+
+    def add_records(self, records):
+        for record in records:
+            self.add_record(record)
+
+    def add_record_of(self, future):
+        if future.exception() is None:
+            self.add_record(future.result())
 
     def get_files_from_directory(self, directory):
         files = []
         for dirpath, subdirs, filenames in os.walk(directory):
-            for filename in filenames:
+            excluded = (self.cache_directory, self.target_directory)
+            subdirs[:] = sorted(d for d in subdirs if os.path.join(dirpath, d) not in excluded)
+            for filename in sorted(filenames):
                 filepath = os.path.join(dirpath, filename)
                 files.append(filepath)
         return files
@@ -61,11 +695,54 @@ class Build(CliCommand):
         return path.endswith('.html') and not filename.startswith('_')
 
     def is_static(self, path):
-        return not path.endswith('.html')
+        return not path.endswith('.html') and not self.is_data(path)
+
+    def is_data(self, path):
+        if self.data_directory is None:
+            return False
+        source = os.path.dirname(self.data_directory)
+        return path.startswith(self.data_directory + os.sep) or path == os.path.join(source, CONFIG)
 
     def relative_path(self, source, path):
         return path[len(source)+1:]
 
-    def ensure_directory(self, directory):
-        if not os.path.exists(directory):
-            os.makedirs(directory)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('template_renderer', None)
+        state.pop('manifest', None)
+        state.pop('profiler', None)
+        state.pop('writer', None)
+        state.pop('minify_report', None)
+        return state
+
+
+def is_inside(path, directory):
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+_worker = None
+
+
+def _init_worker(build):
+    global _worker
+    _worker = build
+
+
+def _write_template(source, target, path):
+    _init_renderer(source)
+    return _worker.write_template(source, target, path)
+
+
+def _write_static(source, target, path):
+    return _worker.write_static(source, target, path)
+
+
+def _write_pages(source, target, pages):
+    _init_renderer(source)
+    return _worker.write_pages(target, pages)
+
+
+def _init_renderer(source):
+    if not hasattr(_worker, 'template_renderer'):
+        _worker.template_renderer = TemplateRenderer(source, _worker.cache_directory)
+        _worker.template_renderer.assets = _worker.assets
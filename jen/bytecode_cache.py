@@ -0,0 +1,60 @@
+import os
+import tempfile
+
+from jinja2 import FileSystemBytecodeCache
+
+
+class BytecodeCache(FileSystemBytecodeCache):
+
+    def __init__(self, directory, max_size=100 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        super(BytecodeCache, self).__init__(directory, '%s.jinja')
+        self.max_size = max_size
+        self.size = sum(size for _, _, size in self._entries())
+
+    def load_bytecode(self, bucket):
+        super(BytecodeCache, self).load_bytecode(bucket)
+        if bucket.code is not None:
+            try:
+                os.utime(self._get_cache_filename(bucket))
+            except OSError:
+                pass
+
+    def dump_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        fd, temp_filename = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            self.size += os.path.getsize(temp_filename)
+            os.replace(temp_filename, filename)
+        except OSError:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            return
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        entries = sorted(self._entries())
+        self.size = sum(size for _, _, size in entries)
+        for _, filename, size in entries:
+            if self.size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            self.size -= size
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.jinja'):
+                filename = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, filename, stat.st_size))
+        return entries
@@ -1,3 +1,5 @@
+import importlib
+import re
 import sys
 
 
@@ -29,6 +31,9 @@ class CliApp(object):
     def command(self, command):
         self.commands.append(command)
 
+    def lazy_command(self, name, usage, description, path):
+        self.commands.append(LazyCommand(name, usage, description, path))
+
     def call(self):
         args = sys.argv[1:]
         self.run(args)
@@ -37,7 +42,9 @@ class CliApp(object):
         if args:
             name = args.pop(0)
             command = self._find_target_command(name)
-            if command:
+            if command and args == ['--help']:
+                self.print_command_help(command.load())
+            elif command:
                 command.call(*args)
             else:
                 self.echo('ERROR:', 'Unknown command "{}"'.format(name))
@@ -58,6 +65,24 @@ class CliApp(object):
         for command in self.commands:
             spaces = space_padding - len(command.usage)
             self.echo(command.usage, ' ' * spaces, command.description)
+            self.print_options(command, space_padding)
+        if any(isinstance(command, LazyCommand) for command in self.commands):
+            self.echo()
+            self.echo('Add --help after a command name to list its options.')
+
+    def print_command_help(self, command):
+        self.echo('USAGE:', command.usage)
+        self.echo()
+        self.echo(command.description)
+        if command.options:
+            self.echo()
+            space_padding = max([len(option) for option, _ in command.options]) + 4
+            self.print_options(command, space_padding)
+
+    def print_options(self, command, space_padding):
+        for option, description in command.options:
+            spaces = max(space_padding - len(option) - 2, 1)
+            self.echo('  ' + option, ' ' * spaces, description)
 
     def echo(self, *args):
         self.printer.echo(*args)
@@ -68,18 +93,45 @@ class CliCommand(object):
     name = None
     usage = None
     description = None
+    options = ()
     printer = global_printer
 
     def call(self, *args):
+        args, options = self.parse_args(args)
         try:
-            self.run(*args)
+            self.run(*args, **options)
         except TypeError as e:
             message = str(e)
-            message = message.replace('run()', '').strip()
+            message = re.sub(r'^[\w.]*run\(\)', '', message).strip()
             if self.usage:
                 self.echo('USAGE:', self.usage)
             self.echo('ERROR:', message)
 
+    def parse_args(self, args):
+        positional = []
+        options = {}
+        for arg in args:
+            if arg.startswith('--'):
+                name, equals, value = arg[2:].partition('=')
+                options[name.replace('-', '_')] = value if equals else True
+            else:
+                positional.append(arg)
+        return positional, options
+
+    def load(self):
+        return self
+
+    def int_option(self, name, value, default=None):
+        if value is True:
+            return default
+        try:
+            number = int(value)
+        except ValueError:
+            number = 0
+        if number < 1:
+            self.abort('ERROR:', '--{} must be a positive integer'.format(name.replace('_', '-')))
+        return number
+
     def echo(self, *args):
         self.printer.echo(*args)
 
@@ -88,3 +140,24 @@ class CliCommand(object):
             self.printer.echo(*args)
         self.printer.final_echo()
         sys.exit(1)
+
+
+class LazyCommand(object):
+
+    options = ()
+
+    def __init__(self, name, usage, description, path):
+        self.name = name
+        self.usage = usage
+        self.description = description
+        self.path = path
+        self.command = None
+
+    def load(self):
+        if self.command is None:
+            module_name, _, class_name = self.path.partition(':')
+            self.command = getattr(importlib.import_module(module_name), class_name)()
+        return self.command
+
+    def call(self, *args):
+        self.load().call(*args)
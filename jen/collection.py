@@ -0,0 +1,155 @@
+from collections import namedtuple
+import itertools
+import json
+import os
+import re
+
+from .data import DataContext, load, stream
+
+
+CONFIG = '_collections.json'
+
+IndexPage = namedtuple('IndexPage', 'number items count url previous_url next_url')
+
+
+class Collection(object):
+
+    per_page = 20
+
+    def __init__(self, directory, name, data, template, path, index=None, index_path=None, per_page=None):
+        self.directory = directory
+        self.name = name
+        self.data = data
+        self.template = template
+        self.path = path.strip('/')
+        self.index = index
+        self.index_path = (name if index_path is None else index_path).strip('/')
+        self.per_page = int(per_page or self.per_page)
+        self.routes = None
+
+    def data_file(self):
+        keys = self.data.split('.')
+        try:
+            return DataContext(self.directory, keys[:-1]).find(keys[-1])
+        except KeyError:
+            raise ValueError('collection "{}": no data file for "{}"'.format(self.name, self.data))
+
+    def sources(self):
+        return [CONFIG, os.path.relpath(self.data_file(), self.directory).replace(os.sep, '/')]
+
+    def templates(self):
+        return [self.template] + ([self.index] if self.index else [])
+
+    def records(self):
+        return stream(self.data_file())
+
+    def pages(self):
+        count = 0
+        for record in self.records():
+            count += 1
+            yield output_path(self.record_path(record)), self.template, {'record': record, 'collection': self}
+        if not self.index:
+            return
+        total = max(1, -(-count // self.per_page))
+        records = self.records()
+        for number in range(1, total + 1):
+            items = list(itertools.islice(records, self.per_page))
+            yield (output_path(self.index_page_path(number), index=number == 1), self.index,
+                {'page': self.index_page(number, items, total), 'collection': self})
+
+    def record_path(self, record):
+        try:
+            path = self.path.format_map(record).strip('/')
+        except (KeyError, TypeError) as error:
+            raise ValueError('collection "{}": cannot format "{}" with a record: {}'.format(self.name, self.path, error))
+        normalized = os.path.normpath(path)
+        if not path or normalized.startswith('..') or os.path.isabs(normalized):
+            raise ValueError('collection "{}": invalid path "{}"'.format(self.name, path))
+        return path
+
+    def url(self, record):
+        return '/' + self.record_path(record)
+
+    def index_page_path(self, number):
+        if number == 1:
+            return self.index_path
+        return '/'.join(part for part in (self.index_path, 'page', str(number)) if part)
+
+    def index_url(self, number):
+        return '/' + self.index_page_path(number)
+
+    def index_page(self, number, items, total):
+        return IndexPage(
+            number,
+            items,
+            total,
+            self.index_url(number),
+            self.index_url(number - 1) if number > 1 else None,
+            self.index_url(number + 1) if number < total else None,
+        )
+
+    def route(self, url):
+        try:
+            path = self.data_file()
+        except ValueError:
+            return None
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        routes = self.routes
+        if routes is None or routes[0] != key:
+            records = load(path)
+            urls = dict((self.url(record), number) for number, record in enumerate(records))
+            routes = self.routes = (key, records, urls)
+        _, records, urls = routes
+        number = urls.get(url)
+        if number is not None:
+            return self.template, {'record': records[number], 'collection': self}
+        if not self.index:
+            return None
+        total = max(1, -(-len(records) // self.per_page))
+        number = self.index_number(url)
+        if number is None or number > total:
+            return None
+        items = records[(number - 1) * self.per_page:number * self.per_page]
+        return self.index, {'page': self.index_page(number, items, total), 'collection': self}
+
+    def index_number(self, url):
+        if url.rstrip('/') == self.index_url(1).rstrip('/'):
+            return 1
+        match = re.match(re.escape(self.index_url(2)[:-1]) + r'([1-9][0-9]*)$', url)
+        if match and int(match.group(1)) > 1:
+            return int(match.group(1))
+        return None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['routes'] = None
+        return state
+
+    def fingerprint(self):
+        stats = []
+        for relative_path in self.sources():
+            stat = os.stat(os.path.join(self.directory, relative_path))
+            stats.append((relative_path, (stat.st_mtime_ns, stat.st_size)))
+        return tuple(stats)
+
+
+def load_collections(directory):
+    try:
+        with open(os.path.join(directory, CONFIG), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return {}
+    collections = {}
+    for name, options in sorted(config.items()):
+        try:
+            collections[name] = Collection(directory, name, **options)
+        except TypeError as error:
+            raise ValueError('{}: collection "{}": {}'.format(CONFIG, name, error))
+    return collections
+
+
+def output_path(path, index=False):
+    if index or not path:
+        return '/'.join(part for part in (path, 'index.html') if part)
+    return path + '.html'
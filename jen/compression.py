@@ -0,0 +1,82 @@
+import gzip
+import mimetypes
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = {
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+}
+
+EXTENSIONS = {
+    'gzip': '.gz',
+    'br': '.br',
+}
+
+
+def available_encodings():
+    if brotli:
+        return ['br', 'gzip']
+    return ['gzip']
+
+
+def is_compressible(mime):
+    if not mime:
+        return False
+    mime = mime.split(';')[0].strip()
+    return mime.startswith('text/') or mime in COMPRESSIBLE_TYPES
+
+
+def compress(data, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(data, 9, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(data)
+    raise ValueError('Unknown encoding "{}"'.format(encoding))
+
+
+def compress_stream(chunks, encoding):
+    compress_chunk, flush = stream_compressor(encoding)
+    for chunk in chunks:
+        data = compress_chunk(chunk)
+        if data:
+            yield data
+    yield flush()
+
+
+def stream_compressor(encoding):
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        flush = compressor.flush
+    elif encoding == 'br':
+        compressor = brotli.Compressor()
+        flush = compressor.finish
+    else:
+        raise ValueError('Unknown encoding "{}"'.format(encoding))
+    compress_chunk = getattr(compressor, 'compress', None) or compressor.process
+    return compress_chunk, flush
+
+
+def precompress_file(path, encodings, min_size=256):
+    mime, _ = mimetypes.guess_type(path)
+    if not is_compressible(mime) or os.path.getsize(path) < min_size:
+        return []
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    for encoding in encodings:
+        compressed = compress(data, encoding)
+        if len(compressed) < len(data):
+            variant_path = path + EXTENSIONS[encoding]
+            with open(variant_path, 'wb') as f:
+                f.write(compressed)
+            written.append(variant_path)
+    return written
@@ -0,0 +1,188 @@
+from threading import Lock
+import csv
+import json
+import os
+import re
+
+
+DIRECTORY = '_data'
+EXTENSIONS = ('.json', '.jsonl', '.csv', '.yaml', '.yml')
+WHITESPACE = re.compile(r'\s*')
+
+_cache = {}
+_lock = Lock()
+
+
+class DataContext(object):
+
+    preload_max_size = 16 * 1024 * 1024
+
+    def __init__(self, directory, keys=()):
+        self.directory = directory
+        self.keys = tuple(keys)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        path = self.path(name)
+        if os.path.isdir(path):
+            return DataContext(self.directory, self.keys + (name,))
+        return load(self.find(name))
+
+    def __iter__(self):
+        names = set()
+        try:
+            entries = list(os.scandir(self.path()))
+        except OSError:
+            return iter(())
+        for entry in entries:
+            name, extension = os.path.splitext(entry.name)
+            if entry.is_dir() or extension in EXTENSIONS:
+                names.add(entry.name if entry.is_dir() else name)
+        return iter(sorted(names))
+
+    def stream(self, name):
+        return stream(self.find(name))
+
+    def path(self, *names):
+        return os.path.join(self.directory, DIRECTORY, *(self.keys + names))
+
+    def find(self, name):
+        path = self.path(name)
+        for extension in EXTENSIONS:
+            if os.path.isfile(path + extension):
+                return path + extension
+        raise KeyError(name)
+
+    def preload(self):
+        for dirpath, _, filenames in os.walk(self.path()):
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                if os.path.splitext(filename)[1] in EXTENSIONS and os.path.getsize(path) <= self.preload_max_size:
+                    load(path)
+
+
+def load(path):
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    with _lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        value = parse(path)
+        _cache[path] = (key, value)
+        return value
+
+
+def parse(path):
+    extension = os.path.splitext(path)[1]
+    if extension == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    if extension in ('.yaml', '.yml'):
+        return load_yaml(path)
+    return list(stream(path))
+
+
+def stream(path, chunk_size=64 * 1024):
+    extension = os.path.splitext(path)[1]
+    if extension == '.json':
+        return stream_json(path, chunk_size)
+    if extension == '.jsonl':
+        return stream_json_lines(path)
+    if extension == '.csv':
+        return stream_csv(path)
+    return iter(load_yaml(path))
+
+
+def stream_csv(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def stream_json_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def stream_json(path, chunk_size=64 * 1024):
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        position = 0
+        eof = False
+        expect = '['
+        while True:
+            position = WHITESPACE.match(buffer, position).end()
+            if position == len(buffer):
+                if eof:
+                    raise ValueError('{}: unexpected end of JSON array'.format(path))
+                buffer = f.read(chunk_size)
+                position = 0
+                eof = not buffer
+                continue
+            char = buffer[position]
+            if expect == '[':
+                if char != '[':
+                    f.seek(0)
+                    yield from json.load(f)
+                    return
+                position += 1
+                expect = 'first'
+                continue
+            if char == ']' and expect in ('first', 'next'):
+                return
+            if expect == 'next':
+                if char != ',':
+                    raise ValueError('{}: expected "," or "]" at offset {}'.format(path, position))
+                position += 1
+                expect = 'value'
+                continue
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise
+                end = len(buffer)
+            delimiter = WHITESPACE.match(buffer, end).end()
+            if not eof and buffer[delimiter:delimiter + 1] not in (',', ']'):
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield value
+            position = end
+            expect = 'next'
+
+
+def load_yaml(path):
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError('PyYAML is required to read ' + path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+
+def is_data_path(relative_path):
+    return relative_path is not None and relative_path.split('/')[0] == DIRECTORY
+
+
+def candidate_paths(keys):
+    paths = []
+    for depth in range(1, len(keys) + 1):
+        base = '/'.join((DIRECTORY,) + tuple(keys[:depth]))
+        paths.extend(base + extension for extension in EXTENSIONS)
+    return paths
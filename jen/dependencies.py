@@ -0,0 +1,37 @@
+class DependencyGraph(object):
+
+    def __init__(self):
+        self.edges = {}
+
+    def add(self, template, dependencies):
+        self.edges[template] = list(dependencies)
+
+    def remove(self, template):
+        self.edges.pop(template, None)
+
+    def dependencies_of(self, template):
+        found = set()
+        pending = [template]
+        while pending:
+            for dependency in self.edges.get(pending.pop(), ()):
+                if dependency not in found:
+                    found.add(dependency)
+                    pending.append(dependency)
+        return found
+
+    def dependents_of(self, templates):
+        reverse = {}
+        for template, dependencies in self.edges.items():
+            for dependency in dependencies:
+                reverse.setdefault(dependency, []).append(template)
+        found = set()
+        pending = list(templates)
+        while pending:
+            for dependent in reverse.get(pending.pop(), ()):
+                if dependent not in found:
+                    found.add(dependent)
+                    pending.append(dependent)
+        return found
+
+    def is_dynamic(self, template):
+        return None in self.edges.get(template, ()) or None in self.dependencies_of(template)
@@ -0,0 +1,96 @@
+from threading import Condition, Thread
+import json
+
+from .watcher import watch
+
+
+SCRIPT = b'''<script>new EventSource("/_jen/events").onmessage = function (event) {
+  var changed = JSON.parse(event.data);
+  if (changed.assets.length || changed.pages.indexOf(location.pathname) >= 0) location.reload();
+};</script>'''
+
+
+class LiveReload(object):
+
+    path = '/_jen/events'
+    script = SCRIPT
+    heartbeat = 15
+    history_size = 100
+
+    def __init__(self, app):
+        self.app = app
+        self.version = 0
+        self.history = []
+        self.condition = Condition()
+        self.listeners = []
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.condition:
+            if self.thread is None:
+                self.thread = Thread(target=self.watch, name='jen-live-reload', daemon=True)
+                self.thread.start()
+
+    def watch(self):
+        watcher = watch(self.app.directory, excluded=[self.app.cache_directory])
+        try:
+            while True:
+                changed = watcher.wait()
+                if changed:
+                    self.publish(*self.app.invalidate(changed))
+        finally:
+            watcher.close()
+
+    def publish(self, pages, assets):
+        with self.condition:
+            self.version += 1
+            self.history.append((self.version, pages, assets))
+            del self.history[:-self.history_size]
+            self.condition.notify_all()
+            listeners = list(self.listeners)
+        for loop, callback in listeners:
+            try:
+                loop.call_soon_threadsafe(callback)
+            except RuntimeError:
+                pass
+
+    def subscribe(self, loop, callback):
+        with self.condition:
+            self.listeners.append((loop, callback))
+
+    def unsubscribe(self, loop, callback):
+        with self.condition:
+            self.listeners.remove((loop, callback))
+
+    def wait(self, version, timeout=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            pages = set()
+            assets = set()
+            for number, changed_pages, changed_assets in self.history:
+                if number > version:
+                    pages.update(changed_pages)
+                    assets.update(changed_assets)
+            return self.version, pages, assets
+
+    def events(self):
+        version = self.version
+        yield b'retry: 1000\n\n'
+        while True:
+            version, message = self.next_event(version)
+            yield message
+
+    def next_event(self, version, timeout=None):
+        new_version, pages, assets = self.wait(version, self.heartbeat if timeout is None else timeout)
+        if new_version == version:
+            return version, b': ping\n\n'
+        data = json.dumps({'pages': sorted(pages), 'assets': sorted(assets)})
+        return new_version, ('data: ' + data + '\n\n').encode('utf-8')
+
+    def inject(self, body):
+        index = body.rfind(b'</body>')
+        if index < 0:
+            return body + SCRIPT
+        return body[:index] + SCRIPT + body[index:]
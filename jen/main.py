@@ -1,12 +1,10 @@
 from .cli import CliApp
 
-from .run import Run
-from .build import Build
-
 
 app = CliApp()
-app.command(Run())
-app.command(Build())
+app.lazy_command('run', 'jen run <source>', 'Serves content from specified <source> directory', 'jen.run:Run')
+app.lazy_command('build', 'jen build <source> <target>',
+    'Build contents from <source> and output results to <target>', 'jen.build:Build')
 
 
 def run():
@@ -0,0 +1,44 @@
+import hashlib
+import json
+import os
+
+
+class Manifest(object):
+
+    filename = '.jen-manifest.json'
+
+    def __init__(self, files=None, collections=None):
+        self.files = files or {}
+        self.collections = collections or {}
+
+    @classmethod
+    def load(cls, directory):
+        try:
+            with open(os.path.join(directory, cls.filename), 'r') as f:
+                data = json.load(f)
+            return cls(data['files'], data.get('collections'))
+        except (OSError, ValueError, KeyError):
+            return cls()
+
+    def save(self, directory):
+        with open(os.path.join(directory, self.filename), 'w') as f:
+            json.dump({'files': self.files, 'collections': self.collections}, f, indent=1, sort_keys=True)
+
+    def track(self, previous, relative_path, path):
+        stat = os.stat(path)
+        entry = {'mtime': stat.st_mtime, 'size': stat.st_size}
+        old_entry = previous.files.get(relative_path)
+        if old_entry and old_entry['mtime'] == entry['mtime'] and old_entry['size'] == entry['size']:
+            self.files[relative_path] = dict(old_entry)
+            return False
+        entry['hash'] = file_hash(path)
+        self.files[relative_path] = dict(old_entry or {}, **entry)
+        return not old_entry or old_entry['hash'] != entry['hash']
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,149 @@
+from copy import deepcopy
+from threading import Lock, Thread
+import atexit
+import json
+import os
+import time
+
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+COUNTERS = (
+    ('requests', 'Requests handled'),
+    ('bytes_served', 'Response body bytes sent'),
+    ('render_errors', 'Requests that failed with an exception'),
+    ('page_cache_hits', 'Rendered pages served from the page cache'),
+    ('page_cache_misses', 'Rendered pages that had to be rendered'),
+    ('encoded_cache_hits', 'Compressed bodies served from the cache'),
+    ('encoded_cache_misses', 'Compressed bodies that had to be compressed'),
+)
+
+
+class Metrics(object):
+
+    path = '/_jen/metrics'
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.flushed_at = 0
+        self.histograms = {}
+        self.counters = dict((name, 0) for name, _ in COUNTERS)
+        self.collectors = []
+        self.lock = Lock()
+        self.flush_lock = Lock()
+        self.dirty = False
+        self.flusher_pid = None
+
+    def observe(self, branch, seconds):
+        with self.lock:
+            histogram = self.histograms.get(branch)
+            if histogram is None:
+                histogram = self.histograms[branch] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][index] += 1
+                    break
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            self.dirty = True
+        if self.directory:
+            self.start_flusher()
+            if time.monotonic() - self.flushed_at >= self.flush_interval:
+                self.flush()
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+            self.dirty = True
+
+    def set(self, name, value):
+        with self.lock:
+            self.counters[name] = value
+            self.dirty = True
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = deepcopy({'histograms': self.histograms, 'counters': self.counters})
+        for collector in self.collectors:
+            snapshot['counters'].update(collector())
+        return snapshot
+
+    def flush(self):
+        with self.flush_lock:
+            self.flushed_at = time.monotonic()
+            with self.lock:
+                self.dirty = False
+            filename = os.path.join(self.directory, '{}.json'.format(os.getpid()))
+            temp_filename = filename + '.tmp'
+            with open(temp_filename, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(temp_filename, filename)
+
+    def start_flusher(self):
+        pid = os.getpid()
+        with self.lock:
+            if self.flusher_pid == pid:
+                return
+            self.flusher_pid = pid
+        atexit.register(self.flush_if_dirty)
+        Thread(target=self.flush_periodically, name='jen-metrics', daemon=True).start()
+
+    def flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush_if_dirty()
+
+    def flush_if_dirty(self):
+        if self.dirty:
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def collect(self):
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, name), 'r') as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return merge(snapshots)
+
+    def render(self):
+        snapshot = self.collect()
+        lines = [
+            '# HELP jen_request_duration_seconds Time spent producing responses, by resolution branch.',
+            '# TYPE jen_request_duration_seconds histogram',
+        ]
+        for branch, histogram in sorted(snapshot['histograms'].items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram['buckets']):
+                cumulative += count
+                lines.append('jen_request_duration_seconds_bucket{{branch="{}",le="{}"}} {}'.format(branch, bound, cumulative))
+            lines.append('jen_request_duration_seconds_bucket{{branch="{}",le="+Inf"}} {}'.format(branch, histogram['count']))
+            lines.append('jen_request_duration_seconds_sum{{branch="{}"}} {}'.format(branch, histogram['sum']))
+            lines.append('jen_request_duration_seconds_count{{branch="{}"}} {}'.format(branch, histogram['count']))
+        for name, description in COUNTERS:
+            lines.append('# HELP jen_{}_total {}.'.format(name, description))
+            lines.append('# TYPE jen_{}_total counter'.format(name))
+            lines.append('jen_{}_total {}'.format(name, snapshot['counters'].get(name, 0)))
+        return '\n'.join(lines) + '\n'
+
+
+def merge(snapshots):
+    merged = {'histograms': {}, 'counters': dict((name, 0) for name, _ in COUNTERS)}
+    for snapshot in snapshots:
+        for name, value in snapshot['counters'].items():
+            merged['counters'][name] = merged['counters'].get(name, 0) + value
+        for branch, histogram in snapshot['histograms'].items():
+            target = merged['histograms'].setdefault(branch, {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0})
+            target['buckets'] = [a + b for a, b in zip(target['buckets'], histogram['buckets'])]
+            target['sum'] += histogram['sum']
+            target['count'] += histogram['count']
+    return merged
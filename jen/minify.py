@@ -0,0 +1,317 @@
+from collections import Counter
+from threading import Lock
+import hashlib
+import os
+import re
+
+from .output_writer import write_file
+
+
+VERSION = '2'
+
+KINDS = {
+    '.html': 'html',
+    '.htm': 'html',
+    '.css': 'css',
+    '.js': 'js',
+    '.mjs': 'js',
+}
+
+HTML_TOKEN = re.compile(
+    r'<!--.*?-->'
+    r'|<(pre|textarea|script|style)\b[^>]*>.*?</\1\s*>'
+    r'|<[A-Za-z/!?][^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*>'
+    r'|[^<]+'
+    r'|<', re.I | re.S)
+HTML_WHITESPACE = re.compile(r'[ \t\n\r\f]+')
+STYLE = re.compile(r'(<style\b[^>]*>)(.*?)(</style\s*>)', re.I | re.S)
+
+CSS_TOKEN = re.compile(
+    r'"(?:\\.|[^"\\])*"'
+    r'|\'(?:\\.|[^\'\\])*\''
+    r'|/\*.*?\*/'
+    r'|[ \t\n\r\f]+'
+    r'|[^"\'/ \t\n\r\f]+'
+    r'|.', re.S)
+CSS_SPACE_AFTER = set('{};,>:(/')
+CSS_SPACE_BEFORE = set('{};,>)')
+
+JS_PUNCTUATION = set('{}()[];,:=<>?!&|*%^~')
+JS_REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+JS_REGEX_KEYWORDS = set(['return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'void', 'throw', 'delete', 'new',
+    'instanceof', 'yield', 'await'])
+JS_STATEMENT_HEADS = set(['if', 'while', 'for', 'with'])
+JS_WORD = re.compile(r'[A-Za-z0-9_$\\\u0080-\uffff]+')
+
+
+def kind_of(path):
+    return KINDS.get(os.path.splitext(path)[1].lower())
+
+
+def minify_html(text):
+    parts = []
+    text_parts = []
+    for match in HTML_TOKEN.finditer(text):
+        token = match.group()
+        if token.startswith('<!--') and not token.startswith(('<!--[', '<!--!')):
+            continue
+        if token == '<' or not token.startswith('<'):
+            text_parts.append(token)
+            continue
+        parts.append(collapse_whitespace(''.join(text_parts)))
+        text_parts = []
+        if match.group(1) and match.group(1).lower() == 'style':
+            token = minify_style(token)
+        parts.append(token)
+    parts.append(collapse_whitespace(''.join(text_parts)))
+    return ''.join(parts).strip()
+
+
+def minify_style(element):
+    match = STYLE.match(element)
+    return match.group(1) + minify_css(match.group(2)) + match.group(3)
+
+
+def collapse_whitespace(text):
+    return HTML_WHITESPACE.sub(lambda match: '\n' if '\n' in match.group() else ' ', text)
+
+
+def minify_css(text):
+    parts = []
+    space = False
+    for token in CSS_TOKEN.findall(text):
+        if token.isspace() or (token.startswith('/*') and not token.startswith('/*!')):
+            space = True
+            continue
+        last = parts[-1][-1] if parts else ''
+        if space and last and last not in CSS_SPACE_AFTER and token[0] not in CSS_SPACE_BEFORE:
+            parts.append(' ')
+        space = False
+        if token[0] not in '"\'':
+            if token[0] == '}' and last == ';':
+                parts[-1] = parts[-1][:-1]
+            token = token.replace(';}', '}')
+        parts.append(token)
+    return ''.join(parts)
+
+
+def minify_js(text):
+    try:
+        return JsMinifier(text).minify()
+    except ValueError:
+        return text
+
+
+class JsMinifier(object):
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = []
+        self.last = ''
+        self.word = ''
+        self.parens = []
+        self.closed_head = False
+
+    def minify(self):
+        text = self.text
+        position = 0
+        space = ''
+        while position < len(text):
+            char = text[position]
+            if char in ' \t\n\r\f\v\u00a0\u2028\u2029\ufeff':
+                space = '\n' if char in '\n\r\u2028\u2029' or space == '\n' else ' '
+                position += 1
+                continue
+            if text.startswith('//', position):
+                end = text.find('\n', position)
+                position = len(text) if end == -1 else end
+                continue
+            if text.startswith('/*', position) and not text.startswith('/*!', position):
+                end = text.find('*/', position + 2)
+                if end == -1:
+                    raise ValueError('unterminated comment')
+                if '\n' in text[position:end]:
+                    space = '\n'
+                elif not space:
+                    space = ' '
+                position = end + 2
+                continue
+            if space:
+                self.add_space(space, char)
+                space = ''
+            is_word = False
+            if text.startswith('/*!', position):
+                end = text.find('*/', position + 3)
+                if end == -1:
+                    raise ValueError('unterminated comment')
+                end += 2
+            elif char in '"\'':
+                end = self.string_end(position)
+            elif char == '`':
+                end = self.template_end(position)
+            elif char == '/' and self.regex_allowed():
+                end = self.regex_end(position)
+            else:
+                match = JS_WORD.match(text, position)
+                is_word = match is not None
+                end = match.end() if is_word else position + 1
+            self.add(text[position:end], is_word)
+            position = end
+        return ''.join(self.parts).strip()
+
+    def add(self, token, is_word=False):
+        self.closed_head = False
+        if token == '(':
+            self.parens.append(self.word in JS_STATEMENT_HEADS)
+        elif token == ')':
+            if not self.parens:
+                raise ValueError('unbalanced parenthesis')
+            self.closed_head = self.parens.pop()
+        self.parts.append(token)
+        self.last = token[-1]
+        self.word = token if is_word else ''
+
+    def add_space(self, space, next_char):
+        if not self.parts:
+            return
+        if space == '\n':
+            self.parts.append('\n')
+        elif self.last not in JS_PUNCTUATION and next_char not in JS_PUNCTUATION:
+            self.parts.append(' ')
+
+    def regex_allowed(self):
+        return (not self.parts or self.last in JS_REGEX_AFTER or self.word in JS_REGEX_KEYWORDS or
+            (self.last == ')' and self.closed_head))
+
+    def string_end(self, position):
+        quote = self.text[position]
+        position += 1
+        while position < len(self.text):
+            char = self.text[position]
+            if char == '\\':
+                position += 2
+                continue
+            if char == quote:
+                return position + 1
+            if char == '\n':
+                break
+            position += 1
+        raise ValueError('unterminated string')
+
+    def template_end(self, position):
+        text = self.text
+        position += 1
+        while position < len(text):
+            char = text[position]
+            if char == '\\':
+                position += 2
+            elif char == '`':
+                return position + 1
+            elif text.startswith('${', position):
+                position = self.expression_end(position + 2)
+            else:
+                position += 1
+        raise ValueError('unterminated template literal')
+
+    def expression_end(self, position):
+        text = self.text
+        depth = 1
+        while position < len(text):
+            char = text[position]
+            if char in '"\'':
+                position = self.string_end(position)
+            elif char == '`':
+                position = self.template_end(position)
+            else:
+                if char == '{':
+                    depth += 1
+                elif char == '}':
+                    depth -= 1
+                    if depth == 0:
+                        return position + 1
+                position += 1
+        raise ValueError('unterminated template expression')
+
+    def regex_end(self, position):
+        text = self.text
+        position += 1
+        in_class = False
+        while position < len(text):
+            char = text[position]
+            if char == '\\':
+                position += 2
+                continue
+            if char == '\n':
+                break
+            if char == '[':
+                in_class = True
+            elif char == ']':
+                in_class = False
+            elif char == '/' and not in_class:
+                match = JS_WORD.match(text, position + 1)
+                return match.end() if match else position + 1
+            position += 1
+        raise ValueError('unterminated regular expression')
+
+
+MINIFIERS = {
+    'html': minify_html,
+    'css': minify_css,
+    'js': minify_js,
+}
+
+
+class Minifier(object):
+
+    version = VERSION
+
+    def __init__(self, cache_directory=None):
+        self.cache_directory = cache_directory
+
+    def kind_of(self, path):
+        return kind_of(path)
+
+    def minify(self, kind, data):
+        cache_path = self.cache_path(kind, data)
+        if cache_path:
+            try:
+                with open(cache_path, 'rb') as f:
+                    return f.read()
+            except OSError:
+                pass
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError:
+            return data
+        minified = MINIFIERS[kind](text).encode('utf-8')
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            write_file(cache_path, minified)
+        return minified
+
+    def cache_path(self, kind, data):
+        if not self.cache_directory:
+            return None
+        digest = hashlib.sha1(data).hexdigest()
+        return os.path.join(self.cache_directory, digest[:2], '{}-{}.{}'.format(digest[2:], VERSION, kind))
+
+
+class MinifyReport(object):
+
+    def __init__(self):
+        self.files = Counter()
+        self.before = Counter()
+        self.after = Counter()
+        self.lock = Lock()
+
+    def add(self, kind, before, after):
+        with self.lock:
+            self.files[kind] += 1
+            self.before[kind] += before
+            self.after[kind] += after
+
+    def report(self, echo, format_size):
+        for kind in sorted(self.files):
+            saved = self.before[kind] - self.after[kind]
+            ratio = saved * 100.0 / self.before[kind] if self.before[kind] else 0.0
+            echo('MINIFIED:', '{}: {} files, {} saved ({:.1f}%)'.format(kind, self.files[kind], format_size(saved), ratio))
@@ -0,0 +1,92 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+import os
+import shutil
+
+
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+
+class OutputWriter(object):
+
+    def __init__(self, threads=4, max_pending=64):
+        self.executor = ThreadPoolExecutor(threads)
+        self.slots = BoundedSemaphore(max_pending)
+        self.futures = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, function, *args):
+        self.raise_errors(done_only=True)
+        self.slots.acquire()
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+        return future
+
+    def write(self, path, data):
+        return self.submit(write_file, path, data)
+
+    def raise_errors(self, done_only=False):
+        while self.futures and (not done_only or self.futures[0].done()):
+            self.futures.popleft().result()
+
+    def close(self):
+        try:
+            self.raise_errors()
+        finally:
+            self.executor.shutdown()
+
+
+def write_file(path, data):
+    temp_path = path + '.jen-tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def create_directories(root, relative_paths):
+    directories = set(os.path.dirname(relative_path) for relative_path in relative_paths)
+    directories.add('')
+    for directory in sorted(directories):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+
+def staging_directory(target):
+    parent, name = os.path.split(target)
+    return os.path.join(parent, '.{}.jen-staging-{}'.format(name, os.getpid()))
+
+
+def swap_directories(staging, target):
+    if not os.path.lexists(target):
+        os.rename(staging, target)
+        return
+    if _exchange(staging, target):
+        shutil.rmtree(staging)
+        return
+    backup = staging + '-old'
+    os.rename(target, backup)
+    os.rename(staging, target)
+    shutil.rmtree(backup)
+
+
+def _exchange(first, second):
+    import ctypes
+    import ctypes.util
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError):
+        return False
+    result = renameat2(AT_FDCWD, os.fsencode(first), AT_FDCWD, os.fsencode(second), RENAME_EXCHANGE)
+    return result == 0
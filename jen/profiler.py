@@ -0,0 +1,129 @@
+from collections import Counter
+import json
+import os
+import threading
+import time
+
+from .data import is_data_path
+
+
+PHASES = ('resolve', 'compile', 'render', 'minify', 'write', 'copy')
+
+
+class Timer(object):
+
+    def __init__(self, path, kind):
+        self.record = {
+            'path': path,
+            'kind': kind,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'start': time.perf_counter(),
+            'bytes': 0,
+        }
+        self.last = self.record['start']
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.record[phase] = self.record.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def stop(self, size):
+        self.record['bytes'] = size
+        self.record['end'] = self.last
+        return self.record
+
+
+class BuildProfile(object):
+
+    def __init__(self):
+        self.records = []
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, record):
+        if record:
+            self.records.append(record)
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def total(self, record):
+        return sum(record.get(phase, 0.0) for phase in PHASES)
+
+    def slowest(self, top):
+        return sorted(self.records, key=self.total, reverse=True)[:top]
+
+    def most_included(self, graph, top):
+        counts = Counter()
+        for record in self.records:
+            if record['kind'] == 'template':
+                counts.update(template for template in graph.dependencies_of(record['path'])
+                    if template and not is_data_path(template))
+        return counts.most_common(top)
+
+    def report(self, echo, graph, top=10):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        total_bytes = sum(record['bytes'] for record in self.records)
+        echo('PROFILE:', '{} outputs, {} in {:.3f}s'.format(len(self.records), format_size(total_bytes), elapsed))
+        for phase in PHASES:
+            phase_total = sum(record.get(phase, 0.0) for record in self.records)
+            if phase_total:
+                echo('  {:<8} {:>10}'.format(phase, format_time(phase_total)))
+        echo()
+        echo('SLOWEST:')
+        for record in self.slowest(top):
+            phases = ', '.join('{} {}'.format(phase, format_time(record[phase])) for phase in PHASES if phase in record)
+            echo('  {:>10}  {}  ({}; {})'.format(format_time(self.total(record)), record['path'], phases,
+                format_size(record['bytes'])))
+        included = self.most_included(graph, top)
+        if included:
+            echo()
+            echo('MOST INCLUDED:')
+            for template, count in included:
+                echo('  {:>10}  {}'.format(count, template))
+
+    def trace_events(self):
+        events = []
+        for record in self.records:
+            start = record['start']
+            for phase in PHASES:
+                if phase in record:
+                    events.append({
+                        'name': phase,
+                        'cat': record['kind'],
+                        'ph': 'X',
+                        'ts': (start - self.started) * 1e6,
+                        'dur': record[phase] * 1e6,
+                        'pid': record['pid'],
+                        'tid': record['tid'],
+                        'args': {'path': record['path']},
+                    })
+                    start += record[phase]
+            events.append({
+                'name': record['path'],
+                'cat': record['kind'],
+                'ph': 'X',
+                'ts': (record['start'] - self.started) * 1e6,
+                'dur': (record['end'] - record['start']) * 1e6,
+                'pid': record['pid'],
+                'tid': record['tid'],
+                'args': {'bytes': record['bytes']},
+            })
+        return events
+
+    def write_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+
+
+def format_time(seconds):
+    return '{:.2f}ms'.format(seconds * 1000)
+
+
+def format_size(size):
+    if size < 1024:
+        return '{} B'.format(size)
+    if size < 1024 * 1024:
+        return '{:.1f} KB'.format(size / 1024)
+    return '{:.1f} MB'.format(size / 1024 / 1024)
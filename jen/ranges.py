@@ -0,0 +1,85 @@
+MAX_RANGES = 16
+
+
+def parse_ranges(header, size):
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    specs = [spec.strip() for spec in specs.split(',') if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.partition('-')
+        first = first.strip()
+        last = last.strip()
+        if not dash or not first + last or not all(part.isdigit() for part in (first, last) if part):
+            return None
+        if not first:
+            start = max(0, size - int(last))
+            end = size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        if start < size and start <= end:
+            ranges.append((start, end))
+    return merge_ranges(ranges)
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def content_range(start, end, size):
+    return 'bytes {}-{}/{}'.format(start, end, size)
+
+
+def part_header(boundary, mime, start, end, size):
+    return '\r\n--{}\r\nContent-Type: {}\r\nContent-Range: {}\r\n\r\n'.format(
+        boundary, mime, content_range(start, end, size)).encode('latin-1')
+
+
+def closing_boundary(boundary):
+    return '\r\n--{}--\r\n'.format(boundary).encode('latin-1')
+
+
+def multipart_length(ranges, boundary, mime, size):
+    parts = sum(len(part_header(boundary, mime, start, end, size)) + end - start + 1 for start, end in ranges)
+    return parts + len(closing_boundary(boundary))
+
+
+class FileRanges(object):
+
+    def __init__(self, f, ranges, chunk_size, mime=None, size=None, boundary=None):
+        self.f = f
+        self.ranges = ranges
+        self.chunk_size = chunk_size
+        self.mime = mime
+        self.size = size
+        self.boundary = boundary
+
+    def __iter__(self):
+        for start, end in self.ranges:
+            if self.boundary:
+                yield part_header(self.boundary, self.mime, start, end, self.size)
+            self.f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = self.f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        if self.boundary:
+            yield closing_boundary(self.boundary)
+
+    def close(self):
+        self.f.close()
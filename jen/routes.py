@@ -0,0 +1,118 @@
+from collections import namedtuple
+from threading import Lock
+import os
+import time
+
+from .collection import CONFIG, load_collections
+from .data import DIRECTORY
+
+
+Route = namedtuple('Route', 'template path size mtime_ns url context collection', defaults=(None, None, None))
+
+
+class RouteIndex(object):
+
+    def __init__(self, directory, excluded=(), interval=1.0):
+        self.directory = directory
+        self.excluded = set(os.path.realpath(path) for path in excluded if path)
+        self.excluded.add(os.path.realpath(os.path.join(directory, DIRECTORY)))
+        self.interval = interval
+        self.routes = {}
+        self.collections = {}
+        self.collections_stat = None
+        self.scanned_at = None
+        self.next_scan = 0
+        self.lock = Lock()
+
+    def get(self, path):
+        if time.monotonic() >= self.next_scan:
+            self.refresh()
+        return self.lookup(path)
+
+    def lookup(self, path):
+        route = self.routes.get(path)
+        if route is None and self.collections:
+            route = self.collection_route(path)
+        return route
+
+    def collection_route(self, path):
+        for collection in self.collections.values():
+            found = collection.route(path)
+            if found is None:
+                continue
+            template, context = found
+            full_path = os.path.join(self.directory, template)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                return None
+            return Route(template, full_path, stat.st_size, stat.st_mtime_ns, path, context, collection)
+        return None
+
+    def refresh(self):
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            started = time.monotonic()
+            self.routes = self.scan()
+            self.load_collections()
+            finished = time.monotonic()
+            self.scanned_at = finished
+            self.next_scan = finished + max(self.interval, (finished - started) * 20)
+        finally:
+            self.lock.release()
+
+    def invalidate(self):
+        self.next_scan = 0
+
+    def load_collections(self):
+        try:
+            stat = os.stat(os.path.join(self.directory, CONFIG))
+        except OSError:
+            self.collections = {}
+            self.collections_stat = None
+            return
+        if (stat.st_mtime_ns, stat.st_size) != self.collections_stat:
+            self.collections = load_collections(self.directory)
+            self.collections_stat = (stat.st_mtime_ns, stat.st_size)
+
+    def scan(self):
+        templates = {}
+        indexes = {}
+        statics = {}
+        for relative_path, stat in self._walk(self.directory, ''):
+            full_path = os.path.join(self.directory, relative_path)
+            if relative_path == CONFIG:
+                continue
+            if not relative_path.endswith('.html'):
+                statics['/' + relative_path] = Route(None, full_path, stat.st_size, stat.st_mtime_ns)
+                continue
+            route = Route(relative_path, full_path, stat.st_size, stat.st_mtime_ns)
+            name = relative_path[:-5]
+            if name.split('/')[-1].startswith('_'):
+                continue
+            templates['/' + name] = route
+            if name == 'index':
+                indexes['/'] = route
+            elif name.endswith('/index') and not name.split('/')[-2].startswith('_'):
+                indexes['/' + name[:-6]] = route
+        routes = statics
+        routes.update(indexes)
+        routes.update(templates)
+        return routes
+
+    def _walk(self, directory, prefix):
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            relative_path = prefix + entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not self.excluded or os.path.realpath(entry.path) not in self.excluded:
+                        yield from self._walk(entry.path, relative_path + '/')
+                elif entry.is_file():
+                    yield relative_path, entry.stat()
+            except OSError:
+                continue
@@ -1,9 +1,26 @@
+from collections import namedtuple
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+import gc
+import itertools
 import mimetypes
 import os.path
+import shutil
+import tempfile
+import time
+import uuid
 
 from gunicorn.app.base import BaseApplication
+from jinja2.exceptions import TemplateNotFound
 
+from . import compression
 from .cli import CliCommand
+from .data import is_data_path
+from .live_reload import LiveReload
+from .metrics import Metrics
+from .page_cache import PageCache
+from .ranges import FileRanges, content_range, multipart_length, parse_ranges
+from .routes import RouteIndex
 from .template_renderer import TemplateRenderer
 
 
@@ -12,74 +29,568 @@ class Run(CliCommand):
     name = 'run'
     usage = 'jen run <source>'
     description = 'Serves content from specified <source> directory'
+    options = (
+        ('--cache-dir=DIR', 'Keep compiled templates in DIR between runs'),
+        ('--page-cache=MB', 'Memory for rendered pages (default: 64)'),
+        ('--compress-min-size=BYTES', 'Smallest text response to compress (default: 1024)'),
+        ('--metrics', 'Collect request metrics and serve them on ' + Metrics.path),
+        ('--bind=ADDRESS', 'Address to listen on (default: 127.0.0.1:8000)'),
+        ('--workers=N', 'Number of worker processes (default: 1)'),
+        ('--threads=N', 'Number of threads per worker (default: 1)'),
+        ('--worker-class=CLASS', 'Gunicorn worker class, like sync, gthread or gevent'),
+        ('--preload', 'Load templates before forking workers, so they share memory'),
+        ('--stream', 'Stream rendered pages in chunks instead of caching whole bodies'),
+        ('--live-reload', 'Reload open pages in the browser when their sources change'),
+        ('--asgi', 'Serve with an asyncio ASGI app (uvicorn if installed) instead of gunicorn'),
+    )
 
-    def run(self, source):
+    def run(self, source, cache_dir=None, page_cache=64, compress_min_size=1024, metrics=False,
+            bind=None, workers=None, threads=None, worker_class=None, preload=False, stream=False, live_reload=False,
+            asgi=False):
         if not os.path.isdir(source):
             self.abort('ERROR:', 'source must be a valid directory')
-        server = GunicornApp(source)
-        server.run()
+        if asgi and (workers or worker_class):
+            self.abort('ERROR:', '--workers and --worker-class cannot be used with --asgi')
+        metrics_directory = tempfile.mkdtemp(prefix='jen-metrics-') if metrics else None
+        config = {
+            'bind': [bind] if bind else None,
+            'workers': self.int_option('workers', workers, os.cpu_count() or 1) if workers else None,
+            'threads': self.int_option('threads', threads, 1) if threads else None,
+            'worker_class': worker_class,
+            'preload_app': bool(preload),
+        }
+        if live_reload and not asgi and not config['threads'] and not worker_class:
+            config['threads'] = 8
+        options = {
+            'cache_directory': cache_dir,
+            'page_cache_size': self.int_option('page_cache', page_cache, 64) * 1024 * 1024,
+            'compress_min_size': self.int_option('compress_min_size', compress_min_size, 1024),
+            'metrics': Metrics(metrics_directory) if metrics else None,
+            'stream': bool(stream),
+            'live_reload': bool(live_reload),
+        }
+        master_pid = os.getpid()
+        try:
+            if asgi:
+                self.run_asgi(source, config, options)
+            else:
+                GunicornApp(source, config, **options).run()
+        finally:
+            if metrics_directory and os.getpid() == master_pid:
+                shutil.rmtree(metrics_directory, ignore_errors=True)
+
+    def run_asgi(self, source, config, options):
+        from .asgi import AsgiApp, parse_bind, serve
+        bind = config['bind'][0] if config['bind'] else None
+        try:
+            parse_bind(bind)
+        except ValueError as error:
+            self.abort('ERROR:', str(error))
+        app = AsgiApp(source, threads=config['threads'], **options)
+        if config['preload_app']:
+            app.warm()
+        serve(app, bind)
 
 
 class GunicornApp(BaseApplication):
 
-    def __init__(self, directory):
-        self.app = App(directory)
+    def __init__(self, directory, config=None, **options):
+        self.app = App(directory, **options)
+        self.config = config or {}
         super(GunicornApp, self).__init__()
 
     def load_config(self):
-        pass
+        for key, value in self.config.items():
+            if value is not None:
+                self.cfg.set(key, value)
 
     def load(self):
+        if self.cfg.preload_app:
+            self.app.warm()
+            if hasattr(gc, 'freeze'):
+                gc.freeze()
         return self.app
 
 
 class App(object):
 
-    def __init__(self, directory):
+    chunk_size = 64 * 1024
+    compress_max_size = 16 * 1024 * 1024
+
+    def __init__(self, directory, cache_directory=None, page_cache_size=64 * 1024 * 1024, compress_min_size=1024,
+            metrics=None, stream=False, live_reload=False):
         self.directory = directory
-        self.template_renderer = TemplateRenderer(directory)
+        self.cache_directory = cache_directory
+        self.stream = stream
+        self.template_renderer = TemplateRenderer(directory, cache_directory)
+        self.page_cache = PageCache(page_cache_size)
+        self.encoded_cache = PageCache(page_cache_size)
+        self.compress_min_size = compress_min_size
+        self.routes = RouteIndex(directory, excluded=[cache_directory])
+        self.metrics = metrics
+        if self.metrics:
+            self.metrics.collectors.append(self.cache_counters)
+        self.live_reload = LiveReload(self) if live_reload else None
 
     def __call__(self, env, start_response):
+        if self.live_reload is not None:
+            self.live_reload.start()
+            if env['PATH_INFO'] == self.live_reload.path:
+                start_response('200 OK', [('Content-Type', 'text/event-stream'), ('Cache-Control', 'no-cache')])
+                return self.live_reload.events()
+        if self.metrics is not None:
+            return self.measured_call(env, start_response)
+        _, response = self.handle(env, start_response)
+        return response
+
+    def handle(self, env, start_response):
         path = env['PATH_INFO']
-        response = self.try_template(start_response, path)
+        route = self.routes.get(path)
+        response = self.try_template(env, start_response, route)
         if response:
-            return response
-        response = self.try_static(start_response, path)
+            return 'try_template', response
+        response = self.try_static(env, start_response, route)
         if response:
-            return response
-        response = self.try_404(start_response, path)
+            return 'try_static', response
+        response = self.try_404(env, start_response, path)
         if response:
-            return response
-        return self.response(start_response, '404 Not Found')
+            return 'try_404', response
+        return 'not_found', self.response(start_response, '404 Not Found')
+
+    def measured_call(self, env, start_response):
+        if env['PATH_INFO'] == self.metrics.path:
+            body = self.metrics.render()
+            return self.response(start_response, '200 OK', 'text/plain; version=0.0.4', body)
+        started = time.perf_counter()
+        state = {'counted': self.is_head(env)}
+
+        def measured_start_response(status, headers, *args):
+            if status.startswith('304'):
+                state['counted'] = True
+            for name, value in headers:
+                if name == 'Content-Length' and not state['counted']:
+                    self.metrics.increment('bytes_served', int(value))
+                    state['counted'] = True
+            return start_response(status, headers, *args)
+
+        try:
+            branch, response = self.handle(env, measured_start_response)
+        except Exception:
+            self.metrics.increment('render_errors')
+            raise
+        self.metrics.increment('requests')
+        self.metrics.observe(branch, time.perf_counter() - started)
+        if not state['counted']:
+            return CountedBody(response, self.metrics)
+        return response
+
+    def warm(self):
+        self.template_renderer.data.preload()
+        self.routes.refresh()
+        templates = set(route.template for route in self.routes.routes.values() if route.template)
+        layouts = set()
+        for template in templates:
+            fingerprint = self.template_renderer.fingerprint(template) or ()
+            layouts.update(name for name, stat in fingerprint if stat and name not in templates)
+        capacity = self.template_renderer.cache_capacity()
+        for number, template in enumerate(sorted(layouts) + sorted(templates)):
+            if capacity is not None and number >= capacity:
+                break
+            try:
+                self.template_renderer.load(template)
+            except Exception:
+                continue
+
+    def cache_counters(self):
+        return {
+            'page_cache_hits': self.page_cache.hits,
+            'page_cache_misses': self.page_cache.misses,
+            'encoded_cache_hits': self.encoded_cache.hits,
+            'encoded_cache_misses': self.encoded_cache.misses,
+        }
+
+    def try_template(self, env, start_response, route):
+        if route and route.template and self.is_head(env):
+            head = self.head_template(env, route)
+            if head:
+                return self.head(start_response, *head)
+            return
+        if route and route.template and self.stream:
+            return self.stream_template(env, start_response, route)
+        if route and route.template:
+            try:
+                page = self.render(route)
+            except TemplateNotFound as error:
+                self.forget_deleted_route(route, error)
+                return
+            encoding = self.negotiate_encoding(env, 'text/html', len(page.body))
+            etag = self.encoded_etag(page.etag, encoding)
+            headers = self.validators(etag, page.last_modified) + self.encoding_headers('text/html', encoding)
+            if self.not_modified(env, etag, page.last_modified):
+                return self.response(start_response, '304 Not Modified', headers=headers)
+            body = self.encoded_body(self.page_key(route), page.etag, encoding, lambda: page.body)
+            return self.response(start_response, '200 OK', 'text/html', body, headers)
+
+    def forget_deleted_route(self, route, error):
+        if error.name != route.template and os.path.exists(route.path):
+            raise error
+        self.routes.invalidate()
+
+    def stream_template(self, env, start_response, route):
+        try:
+            fingerprint = self.fingerprint(route)
+            self.template_renderer.load(route.template)
+        except TemplateNotFound as error:
+            self.forget_deleted_route(route, error)
+            return
+        etag, last_modified = self.stream_validators(fingerprint)
+        encoding = self.negotiate_encoding(env, 'text/html', self.compress_min_size)
+        headers = self.encoding_headers('text/html', encoding)
+        if etag:
+            etag = self.encoded_etag(etag, encoding)
+            headers = self.validators(etag, last_modified) + headers
+            if self.not_modified(env, etag, last_modified):
+                return self.response(start_response, '304 Not Modified', headers=headers)
+        chunks = self.template_renderer.stream(route.template, self.chunk_size, route.context)
+        body = (chunk.encode('utf-8') for chunk in chunks)
+        if self.live_reload is not None:
+            body = itertools.chain(body, [self.live_reload.script])
+        if encoding:
+            body = compression.compress_stream(body, encoding)
+        start_response('200 OK', [('Content-Type', 'text/html')] + headers)
+        return body
 
-    def try_template(self, start_response, path):
-        if path != '/' and path.endswith('/'):
+    def try_static(self, env, start_response, route):
+        if not route or route.template:
             return
-        if self.template_renderer.has_page(path):
-            body = self.template_renderer.render_page(path)
-            return self.response(start_response, '200 OK', 'text/html', body)
-
-    def try_static(self, start_response, path):
-        full_path = os.path.join(self.directory, path.lstrip('/'))
-        if not full_path.endswith('.html') and os.path.exists(full_path) and not os.path.isdir(full_path):
-            with open(full_path, 'rb') as f:
-                body = f.read()
-            return self.response(start_response, '200 OK', self.guess_mime(full_path), body)
-
-    def try_404(self, start_response, path):
-        if '.' not in path and self.template_renderer.has_page('404'):
-            body = self.template_renderer.render_page('404')
-            return self.response(start_response, '404 Not Found', 'text/html', body)
+        mime = self.guess_mime(route.path)
+        encoding = None
+        if route.size <= self.compress_max_size and not self.wants_range(env):
+            encoding = self.negotiate_encoding(env, mime, route.size)
+        etag = self.static_etag(route.size, route.mtime_ns)
+        last_modified = route.mtime_ns / 1e9
+        headers = self.validators(self.encoded_etag(etag, encoding), last_modified) + self.encoding_headers(mime, encoding)
+        if self.not_modified(env, self.encoded_etag(etag, encoding), last_modified):
+            return self.response(start_response, '304 Not Modified', headers=headers)
+        if self.is_head(env):
+            return self.head(start_response, *self.head_static(route, mime, etag, encoding, headers))
+        if encoding:
+            try:
+                body = self.encoded_body(route.path, etag, encoding, lambda: self.read_file(route.path))
+            except OSError:
+                self.routes.invalidate()
+                return
+            return self.response(start_response, '200 OK', mime, body, headers)
+        try:
+            f = open(route.path, 'rb')
+        except OSError:
+            self.routes.invalidate()
+            return
+        file_stat = os.fstat(f.fileno())
+        etag = self.static_etag(file_stat.st_size, file_stat.st_mtime_ns)
+        headers = self.validators(etag, file_stat.st_mtime) + self.encoding_headers(mime, None)
+        headers.append(('Accept-Ranges', 'bytes'))
+        ranges = self.requested_ranges(env, file_stat.st_size, etag, file_stat.st_mtime)
+        if ranges is not None:
+            status, headers, body = self.partial(f, file_stat.st_size, ranges, mime, headers)
+            start_response(status, headers)
+            return body
+        start_response('200 OK', [
+            ('Content-Type', mime),
+            ('Content-Length', str(file_stat.st_size)),
+        ] + headers)
+        file_wrapper = env.get('wsgi.file_wrapper', FileChunks)
+        return file_wrapper(f, self.chunk_size)
+
+    def try_404(self, env, start_response, path):
+        route = self.routes.get('/404') if '.' not in path else None
+        if route and route.template and self.is_head(env):
+            return self.head(start_response, '404 Not Found', 'text/html', None, [])
+        if route and route.template:
+            page = self.render(route)
+            return self.response(start_response, '404 Not Found', 'text/html', page.body)
+
+    def is_head(self, env):
+        return env.get('REQUEST_METHOD', 'GET') == 'HEAD'
+
+    def head_template(self, env, route):
+        if not os.path.isfile(route.path):
+            self.routes.invalidate()
+            return None
+        fingerprint = self.fingerprint(route)
+        page = None if self.stream else self.page_cache.get(self.page_key(route), fingerprint)
+        if page is None and self.stream:
+            etag, last_modified = self.stream_validators(fingerprint)
+            encoding = self.negotiate_encoding(env, 'text/html', self.compress_min_size)
+            headers = self.encoding_headers('text/html', encoding)
+            if etag:
+                etag = self.encoded_etag(etag, encoding)
+                headers = self.validators(etag, last_modified) + headers
+                if self.not_modified(env, etag, last_modified):
+                    return '304 Not Modified', 'text/html', None, headers
+            return '200 OK', 'text/html', None, headers
+        if page is None:
+            headers = self.encoding_headers('text/html', None)
+            if fingerprint:
+                last_modified = max(mtime for _, (mtime, _) in fingerprint) / 1e9
+                headers = [('Last-Modified', formatdate(last_modified, usegmt=True))] + headers
+            return '200 OK', 'text/html', None, headers
+        encoding = self.negotiate_encoding(env, 'text/html', len(page.body))
+        etag = self.encoded_etag(page.etag, encoding)
+        headers = self.validators(etag, page.last_modified) + self.encoding_headers('text/html', encoding)
+        if self.not_modified(env, etag, page.last_modified):
+            return '304 Not Modified', 'text/html', None, headers
+        length = self.encoded_length(self.page_key(route), page.etag, encoding, len(page.body))
+        return '200 OK', 'text/html', length, headers
+
+    def head_static(self, route, mime, etag, encoding, headers):
+        length = self.encoded_length(route.path, etag, encoding, route.size)
+        if not encoding:
+            headers = headers + [('Accept-Ranges', 'bytes')]
+        return '200 OK', mime, length, headers
+
+    def encoded_length(self, key, etag, encoding, size):
+        if not encoding:
+            return size
+        body = self.encoded_cache.get((key, encoding), etag)
+        return len(body) if body is not None else None
+
+    def wants_range(self, env):
+        return 'HTTP_RANGE' in env and env.get('REQUEST_METHOD', 'GET') == 'GET'
+
+    def requested_ranges(self, env, size, etag, last_modified):
+        if not self.wants_range(env):
+            return None
+        if_range = env.get('HTTP_IF_RANGE')
+        if if_range and if_range != etag and if_range != formatdate(last_modified, usegmt=True):
+            return None
+        return parse_ranges(env['HTTP_RANGE'], size)
+
+    def partial(self, f, size, ranges, mime, headers):
+        if not ranges:
+            return '416 Range Not Satisfiable', [
+                ('Content-Type', 'text/plain'),
+                ('Content-Length', '0'),
+                ('Content-Range', 'bytes */{}'.format(size)),
+            ] + headers, FileRanges(f, ranges, self.chunk_size)
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            return '206 Partial Content', [
+                ('Content-Type', mime),
+                ('Content-Length', str(end - start + 1)),
+                ('Content-Range', content_range(start, end, size)),
+            ] + headers, FileRanges(f, ranges, self.chunk_size)
+        boundary = uuid.uuid4().hex
+        return '206 Partial Content', [
+            ('Content-Type', 'multipart/byteranges; boundary=' + boundary),
+            ('Content-Length', str(multipart_length(ranges, boundary, mime, size))),
+        ] + headers, FileRanges(f, ranges, self.chunk_size, mime, size, boundary)
+
+    def render(self, route):
+        key = self.page_key(route)
+        fingerprint = self.fingerprint(route)
+        page = self.page_cache.get(key, fingerprint)
+        if page is None:
+            page = self.page(self.template_renderer.render(route.template, route.context).encode('utf-8'), fingerprint)
+            self.page_cache.put(key, fingerprint, page, len(page.body))
+        return page
+
+    def page_key(self, route):
+        return route.url or route.template
+
+    def fingerprint(self, route):
+        fingerprint = self.template_renderer.fingerprint(route.template)
+        if fingerprint is None or route.collection is None:
+            return fingerprint
+        return tuple(sorted(fingerprint + route.collection.fingerprint()))
+
+    def page(self, body, fingerprint):
+        if self.live_reload is not None:
+            body = self.live_reload.inject(body)
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        last_modified = max(mtime for _, (mtime, _) in fingerprint) / 1e9 if fingerprint else None
+        return Page(body, etag, last_modified)
+
+    def stream_validators(self, fingerprint):
+        if not fingerprint:
+            return None, None
+        etag = 'W/"{}"'.format(hashlib.sha1(repr(fingerprint).encode('utf-8')).hexdigest())
+        last_modified = max(mtime for _, (mtime, _) in fingerprint) / 1e9
+        return etag, last_modified
+
+    def invalidate(self, paths):
+        routes = list(self.routes.routes.items())
+        self.routes.refresh()
+        routes.extend(self.routes.routes.items())
+        if None in paths:
+            self.page_cache.clear()
+            self.encoded_cache.clear()
+            self.template_renderer.invalidate()
+            return set(url for url, route in routes if route.template), set(['*'])
+        templates = set(path for path in paths if path.endswith('.html'))
+        data_paths = set(path for path in paths if is_data_path(path))
+        templates |= self.template_renderer.dependency_graph.dependents_of(templates | data_paths)
+        self.template_renderer.invalidate(templates)
+        assets = set()
+        for path in paths:
+            if path.endswith('.html') or path in data_paths:
+                continue
+            full_path = os.path.join(self.directory, path)
+            if os.path.isdir(full_path):
+                continue
+            assets.add('/' + path)
+            for encoding in compression.available_encodings():
+                self.encoded_cache.invalidate((full_path, encoding))
+        for template in templates:
+            self.page_cache.invalidate(template)
+            for encoding in compression.available_encodings():
+                self.encoded_cache.invalidate((template, encoding))
+        pages = set(url for url, route in routes if route.template in templates)
+        if self.collections_changed(set(paths) | templates):
+            assets.add('*')
+        return pages, assets
+
+    def collections_changed(self, paths):
+        for collection in self.routes.collections.values():
+            try:
+                inputs = set(collection.sources()) | set(collection.templates())
+            except ValueError:
+                continue
+            if inputs & paths:
+                return True
+        return False
+
+    def negotiate_encoding(self, env, mime, size):
+        if size < self.compress_min_size or not compression.is_compressible(mime):
+            return None
+        accepted = {}
+        for item in env.get('HTTP_ACCEPT_ENCODING', '').split(','):
+            name, _, params = item.partition(';')
+            quality = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip().lower()] = quality
+        best = None
+        for encoding in compression.available_encodings():
+            quality = accepted.get(encoding, accepted.get('*', 0.0))
+            if quality > 0 and (best is None or quality > best[1]):
+                best = (encoding, quality)
+        return best[0] if best else None
+
+    def encoded_body(self, key, etag, encoding, read):
+        if not encoding:
+            return read()
+        body = self.encoded_cache.get((key, encoding), etag)
+        if body is None:
+            body = compression.compress(read(), encoding)
+            self.encoded_cache.put((key, encoding), etag, body)
+        return body
+
+    def encoded_etag(self, etag, encoding):
+        if not encoding:
+            return etag
+        return etag[:-1] + '-' + encoding + '"'
+
+    def encoding_headers(self, mime, encoding):
+        if not compression.is_compressible(mime):
+            return []
+        if encoding:
+            return [('Content-Encoding', encoding), ('Vary', 'Accept-Encoding')]
+        return [('Vary', 'Accept-Encoding')]
+
+    def read_file(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def static_etag(self, size, mtime_ns):
+        return '"{:x}-{:x}"'.format(size, mtime_ns)
+
+    def validators(self, etag, last_modified):
+        headers = [('ETag', etag)]
+        if last_modified is not None:
+            headers.append(('Last-Modified', formatdate(last_modified, usegmt=True)))
+        return headers
+
+    def not_modified(self, env, etag, last_modified):
+        if env.get('REQUEST_METHOD', 'GET') not in ('GET', 'HEAD'):
+            return False
+        if_none_match = env.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or 'W/' + etag in tags
+        if_modified_since = env.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since and last_modified is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(last_modified) <= since
+        return False
 
     def guess_mime(self, path):
         mime, _ = mimetypes.guess_type(path)
         return mime or 'application/octet-stream'
 
-    def response(self, start_response, status, mime='text/html', data=''):
+    def response(self, start_response, status, mime='text/html', data='', headers=()):
         if isinstance(data, str):
             data = data.encode('utf-8')
+        if status.startswith('304'):
+            start_response(status, list(headers))
+            return iter([])
         start_response(status, [
             ('Content-Type', mime),
             ('Content-Length', str(len(data))),
-        ])
+        ] + list(headers))
         return iter([data])
+
+    def head(self, start_response, status, mime, length, headers):
+        start_response(*self.head_headers(status, mime, length, headers))
+        return iter([])
+
+    def head_headers(self, status, mime, length, headers):
+        if status.startswith('304'):
+            return status, list(headers)
+        start_headers = [('Content-Type', mime)]
+        if length is not None:
+            start_headers.append(('Content-Length', str(length)))
+        return status, start_headers + list(headers)
+
+
+Page = namedtuple('Page', 'body etag last_modified')
+
+
+class FileChunks(object):
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        while True:
+            chunk = self.f.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self.f.close()
+
+
+class CountedBody(object):
+
+    def __init__(self, body, metrics):
+        self.body = body
+        self.metrics = metrics
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.metrics.increment('bytes_served', len(chunk))
+            yield chunk
+
+    def close(self):
+        if hasattr(self.body, 'close'):
+            self.body.close()
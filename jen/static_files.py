@@ -0,0 +1,99 @@
+import errno
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+
+FICLONE = 0x40049409
+
+
+def copy_static_file(source_path, target_path, mode='copy'):
+    if is_up_to_date(source_path, target_path, mode):
+        return False
+    if mode == 'hardlink' and _try_link(os.link, source_path, target_path):
+        return True
+    if mode == 'symlink' and _try_link(os.symlink, source_path, target_path):
+        return True
+    if mode == 'reflink' and _reflink(source_path, target_path):
+        return True
+    _copy(source_path, target_path)
+    return True
+
+
+def is_up_to_date(source_path, target_path, mode='copy'):
+    try:
+        if mode == 'symlink':
+            return os.readlink(target_path) == source_path
+        target_stat = os.lstat(target_path)
+    except OSError:
+        return False
+    source_stat = os.stat(source_path)
+    if mode == 'hardlink' or os.path.samestat(source_stat, target_stat):
+        return mode == 'hardlink' and os.path.samestat(source_stat, target_stat)
+    return (source_stat.st_size == target_stat.st_size and source_stat.st_mtime_ns == target_stat.st_mtime_ns
+        and not os.path.islink(target_path))
+
+
+def _try_link(link, source_path, target_path):
+    temp_path = target_path + '.jen-tmp'
+    try:
+        link(source_path, temp_path)
+    except OSError as e:
+        if e.errno in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            return False
+        raise
+    os.replace(temp_path, target_path)
+    return True
+
+
+def _reflink(source_path, target_path):
+    if fcntl is None:
+        return False
+    temp_path = target_path + '.jen-tmp'
+    with open(source_path, 'rb') as source, open(temp_path, 'wb') as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            cloned = False
+        else:
+            cloned = True
+    if not cloned:
+        os.remove(temp_path)
+        return False
+    shutil.copystat(source_path, temp_path)
+    os.replace(temp_path, target_path)
+    return True
+
+
+def _copy(source_path, target_path):
+    temp_path = target_path + '.jen-tmp'
+    with open(source_path, 'rb') as source, open(temp_path, 'wb') as target:
+        if not _copy_file_range(source, target):
+            source.seek(0)
+            target.seek(0)
+            target.truncate()
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    shutil.copystat(source_path, temp_path)
+    os.replace(temp_path, target_path)
+
+
+def _copy_file_range(source, target):
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    size = os.fstat(source.fileno()).st_size
+    copied = 0
+    try:
+        while copied < size:
+            sent = os.copy_file_range(source.fileno(), target.fileno(), size - copied)
+            if sent == 0:
+                break
+            copied += sent
+    except OSError:
+        return False
+    return True
@@ -1,31 +1,96 @@
 import os.path
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from jinja2.exceptions import TemplateNotFound
+from jinja2 import Environment, FileSystemLoader, meta, nodes, select_autoescape
+from jinja2.exceptions import TemplateNotFound, TemplateSyntaxError
+
+from .bytecode_cache import BytecodeCache
+from .data import DataContext, candidate_paths, is_data_path
+from .dependencies import DependencyGraph
 
 
 class TemplateRenderer(object):
 
-    def __init__(self, directory):
+    def __init__(self, directory, cache_directory=None, enable_async=False):
         self.directory = directory
+        self.cache_directory = cache_directory
+        self.enable_async = enable_async
+        self.assets = {}
+        self.data = DataContext(directory)
         self.jinja_env = None
+        self.dependency_graph = DependencyGraph()
+        self._parsed = {}
 
     def has_page(self, path):
-        templates = self._templates_for_path(path)
-        for template in templates:
-            full_path = os.path.join(self.directory, template)
-            if os.path.exists(full_path):
-                return True
-        return False
+        return self.template_for_path(path) is not None
 
     def render_page(self, path):
+        template = self.template_for_path(path)
+        if template is None:
+            return None
+        return self.render(template)
+
+    def template_for_path(self, path):
         templates = self._templates_for_path(path)
         for template in templates:
             full_path = os.path.join(self.directory, template)
             if os.path.exists(full_path):
-                return self._render(template)
+                return template
         return None
 
+    def template_dependencies(self, template_identifier):
+        self._set_env_once()
+        source, _, _ = self.jinja_env.loader.get_source(self.jinja_env, template_identifier)
+        ast = self.jinja_env.parse(source, template_identifier)
+        return list(meta.find_referenced_templates(ast)) + data_dependencies(ast)
+
+    def uses_assets(self, template_identifier):
+        self._set_env_once()
+        source, _, _ = self.jinja_env.loader.get_source(self.jinja_env, template_identifier)
+        ast = self.jinja_env.parse(source, template_identifier)
+        return any(isinstance(call.node, nodes.Name) and call.node.name == 'asset' for call in ast.find_all(nodes.Call))
+
+    def asset(self, path):
+        relative_path = path.lstrip('/')
+        return '/' + self.assets.get(relative_path, relative_path)
+
+    def fingerprint(self, template_identifier):
+        stats = {}
+        pending = [template_identifier]
+        while pending:
+            template = pending.pop()
+            if template is None:
+                return None
+            if template in stats:
+                continue
+            stat = self._stat(template)
+            if is_data_path(template):
+                if stat is not None:
+                    stats[template] = stat
+                continue
+            stats[template] = stat
+            if stat is not None:
+                pending.extend(self._dependencies(template, stat))
+        return tuple(sorted(stats.items()))
+
+    def _stat(self, template_identifier):
+        try:
+            stat = os.stat(os.path.join(self.directory, template_identifier))
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _dependencies(self, template_identifier, stat):
+        parsed = self._parsed.get(template_identifier)
+        if parsed and parsed[0] == stat:
+            return parsed[1]
+        try:
+            dependencies = self.template_dependencies(template_identifier)
+        except (TemplateNotFound, TemplateSyntaxError):
+            dependencies = [None]
+        self._parsed[template_identifier] = (stat, dependencies)
+        self.dependency_graph.add(template_identifier, dependencies)
+        return dependencies
+
     def _templates_for_path(self, path):
         path = path.strip('/')
         last_bit = path.split('/')[-1]
@@ -35,14 +100,105 @@ class TemplateRenderer(object):
             return ['index.html']
         return [path + '.html', path + '/index.html']
 
-    def _render(self, template_identifier):
+    def render(self, template_identifier, context=None):
+        return self.load(template_identifier).render(context or {})
+
+    def stream(self, template_identifier, chunk_size=64 * 1024, context=None):
+        return buffered(self.load(template_identifier).generate(context or {}), chunk_size)
+
+    def invalidate(self, templates=None):
+        if templates is None:
+            self._parsed.clear()
+        for template in templates or ():
+            self._parsed.pop(template, None)
+        if not self.jinja_env or self.jinja_env.cache is None:
+            return
+        for key in list(self.jinja_env.cache.keys()):
+            if templates is None or key[1] in templates:
+                try:
+                    del self.jinja_env.cache[key]
+                except KeyError:
+                    pass
+
+    def cache_capacity(self):
         self._set_env_once()
-        template = self.jinja_env.get_template(template_identifier)
-        return template.render()
+        if self.jinja_env.cache is None:
+            return 0
+        return getattr(self.jinja_env.cache, 'capacity', None)
+
+    def load(self, template_identifier):
+        self._set_env_once()
+        return self.jinja_env.get_template(template_identifier)
 
     def _set_env_once(self):
         if self.jinja_env:
             return
         loader = FileSystemLoader(self.directory)
         autoescape = select_autoescape(default=True, default_for_string=True)
-        self.jinja_env = Environment(loader=loader, autoescape=autoescape)
+        bytecode_cache = None
+        if self.cache_directory:
+            cache_directory = self.cache_directory
+            if self.enable_async:
+                cache_directory = os.path.join(cache_directory, 'async')
+            bytecode_cache = BytecodeCache(cache_directory)
+        self.jinja_env = Environment(loader=loader, autoescape=autoescape, bytecode_cache=bytecode_cache,
+            enable_async=self.enable_async)
+        self.jinja_env.globals['asset'] = self.asset
+        self.jinja_env.globals['data'] = self.data
+
+
+def data_dependencies(ast):
+    dependencies = set()
+    names = sum(1 for name in ast.find_all(nodes.Name) if name.name == 'data' and name.ctx == 'load')
+    lookups = 0
+    for node in ast.find_all((nodes.Getattr, nodes.Getitem, nodes.Call)):
+        keys = data_keys(node)
+        if keys is None:
+            continue
+        if not isinstance(node, nodes.Call):
+            lookups += isinstance(node.node, nodes.Name)
+        if not keys:
+            return sorted(dependencies) + [None]
+        dependencies.update(candidate_paths(keys))
+    if names > lookups:
+        return sorted(dependencies) + [None]
+    return sorted(dependencies)
+
+
+def data_keys(node):
+    if isinstance(node, nodes.Call):
+        if not isinstance(node.node, nodes.Getattr) or node.node.attr != 'stream':
+            return None
+        keys = data_keys(node.node.node)
+        if keys is None or len(node.args) != 1 or not isinstance(node.args[0], nodes.Const):
+            return keys and []
+        return keys + [node.args[0].value]
+    chain = []
+    while isinstance(node, (nodes.Getattr, nodes.Getitem)):
+        chain.append(node)
+        node = node.node
+    if not isinstance(node, nodes.Name) or node.name != 'data':
+        return None
+    keys = []
+    for lookup in reversed(chain):
+        if isinstance(lookup, nodes.Getattr):
+            keys.append(lookup.attr)
+        elif isinstance(lookup.arg, nodes.Const) and isinstance(lookup.arg.value, str):
+            keys.append(lookup.arg.value)
+        else:
+            break
+    return keys
+
+
+def buffered(pieces, chunk_size):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
@@ -0,0 +1,174 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+EVENT = struct.Struct('iIII')
+
+
+def watch(directory, excluded=(), interval=0.5):
+    try:
+        return InotifyWatcher(directory, excluded)
+    except (OSError, AttributeError):
+        return PollingWatcher(directory, excluded, interval)
+
+
+class Watcher(object):
+
+    settle = 0.05
+
+    def __init__(self, directory, excluded=()):
+        self.directory = os.path.realpath(directory)
+        self.excluded = set(os.path.realpath(path) for path in excluded if path)
+
+    def wait(self, timeout=None):
+        changed = self.read(timeout)
+        while changed and None not in changed:
+            more = self.read(self.settle)
+            if not more:
+                break
+            changed |= more
+        return changed
+
+    def close(self):
+        pass
+
+    def is_excluded(self, path):
+        return bool(self.excluded) and os.path.realpath(path) in self.excluded
+
+    def walk(self, relative_directory=''):
+        try:
+            entries = list(os.scandir(os.path.join(self.directory, relative_directory)))
+        except OSError:
+            return
+        for entry in entries:
+            relative_path = os.path.join(relative_directory, entry.name)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not self.is_excluded(entry.path):
+                        yield relative_path, None
+                        yield from self.walk(relative_path)
+                elif entry.is_file():
+                    yield relative_path, entry.stat()
+            except OSError:
+                continue
+
+
+class PollingWatcher(Watcher):
+
+    def __init__(self, directory, excluded=(), interval=0.5):
+        super(PollingWatcher, self).__init__(directory, excluded)
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def read(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.scan()
+            changed = set(path for path in set(snapshot) | set(self.snapshot)
+                if snapshot.get(path) != self.snapshot.get(path))
+            self.snapshot = snapshot
+            if changed:
+                return changed
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return changed
+                time.sleep(min(self.interval, remaining))
+            else:
+                time.sleep(self.interval)
+
+    def scan(self):
+        return dict((path, (stat.st_mtime_ns, stat.st_size))
+            for path, stat in self.walk() if stat is not None)
+
+
+class InotifyWatcher(Watcher):
+
+    mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, directory, excluded=()):
+        super(InotifyWatcher, self).__init__(directory, excluded)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.directories = {}
+        self.add_tree('')
+
+    def add_tree(self, relative_directory):
+        added = set()
+        if not self.add_watch(relative_directory):
+            return added
+        for relative_path, stat in self.walk(relative_directory):
+            if stat is None:
+                self.add_watch(relative_path)
+            else:
+                added.add(relative_path)
+        return added
+
+    def add_watch(self, relative_directory):
+        path = os.path.join(self.directory, relative_directory)
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.mask)
+        if wd < 0:
+            return False
+        self.directories[wd] = relative_directory
+        return True
+
+    def read(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        changed = set()
+        if not readable:
+            return changed
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError as error:
+                if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return changed
+                raise
+            changed |= self.parse(data)
+
+    def parse(self, data):
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0'))
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                changed.add(None)
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            if wd not in self.directories:
+                continue
+            relative_path = os.path.join(self.directories[wd], name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self.is_excluded(os.path.join(self.directory, relative_path)):
+                    changed |= self.add_tree(relative_path)
+                changed.add(relative_path)
+            else:
+                changed.add(relative_path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
@@ -0,0 +1,300 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+import asyncio
+import gzip
+
+from jinja2.exceptions import TemplateNotFound
+
+from jen.asgi import AsgiApp, parse_bind
+from jen.asgi_server import AsgiServer
+from jen.live_reload import LiveReload
+from jen.metrics import Metrics
+from jen.run import Run
+from .output_buffer import OutputBuffer
+from .test_cli import CliTestCase
+
+
+class AsgiAppTestCase(TestCase):
+
+    def setUp(self):
+        self.app = AsgiApp('tests/site_example')
+
+    def tearDown(self):
+        self.app.executor.shutdown()
+
+    def get(self, path, method='GET', **headers):
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.app(scope, receive, send))
+        start = messages[0]
+        response_headers = dict((name.decode('latin-1'), value.decode('latin-1')) for name, value in start['headers'])
+        body = [message.get('body', b'') for message in messages[1:]]
+        return start['status'], response_headers, body
+
+    def test_get_simple_page(self):
+        status, headers, body = self.get('/simple')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-type'], 'text/html')
+        self.assertEqual(headers['content-length'], '28')
+        self.assertEqual(b''.join(body), b'<body><h1>Simple</h1></body>')
+
+    def test_pages_are_rendered_with_async_environment(self):
+        self.get('/simple')
+        self.assertTrue(self.app.template_renderer.jinja_env.is_async)
+
+    def test_get_index_page(self):
+        _, _, body = self.get('/')
+        self.assertEqual(b''.join(body), b'<body><h1>Index</h1></body>')
+
+    def test_static_content_is_read_in_chunks(self):
+        self.app.chunk_size = 4
+        status, headers, body = self.get('/robots.txt')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-type'], 'text/plain')
+        self.assertGreater(len(body), 2)
+        with open('tests/site_example/robots.txt', 'rb') as f:
+            self.assertEqual(b''.join(body), f.read())
+
+    def test_static_range_is_served_as_partial_content(self):
+        status, headers, body = self.get('/robots.txt', range='bytes=0-3')
+        self.assertEqual(status, 206)
+        self.assertEqual(headers['content-range'], 'bytes 0-3/26')
+        self.assertEqual(b''.join(body), b'User')
+
+    def test_unsatisfiable_range(self):
+        status, headers, body = self.get('/robots.txt', range='bytes=100-')
+        self.assertEqual(status, 416)
+        self.assertEqual(headers['content-range'], 'bytes */26')
+        self.assertEqual(b''.join(body), b'')
+
+    def test_head_static_content_has_length_without_body(self):
+        status, headers, body = self.get('/robots.txt', method='HEAD')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-length'], '26')
+        self.assertEqual(b''.join(body), b'')
+
+    def test_head_page_is_not_rendered(self):
+        with patch.object(self.app, 'render_page') as render_page:
+            status, headers, body = self.get('/simple', method='HEAD')
+        render_page.assert_not_called()
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-type'], 'text/html')
+        self.assertEqual(b''.join(body), b'')
+
+    def test_404_page(self):
+        self.app.executor.shutdown()
+        self.app = AsgiApp('tests/site_example/sub-with-404')
+        status, _, body = self.get('/missing')
+        self.assertEqual(status, 404)
+        self.assertEqual(b''.join(body), b'<body><h1>404 Not Found</h1></body>')
+
+    def test_missing_page(self):
+        status, _, body = self.get('/missing.css')
+        self.assertEqual(status, 404)
+        self.assertEqual(b''.join(body), b'')
+
+    def test_page_not_modified_with_matching_etag(self):
+        _, headers, _ = self.get('/simple')
+        status, _, body = self.get('/simple', **{'if-none-match': headers['etag']})
+        self.assertEqual(status, 304)
+        self.assertEqual(b''.join(body), b'')
+
+    def test_rendered_pages_are_served_from_cache(self):
+        self.get('/simple')
+        self.get('/simple')
+        self.assertEqual(self.app.page_cache.hits, 1)
+
+    def test_page_is_gzipped_when_accepted(self):
+        self.app.compress_min_size = 1
+        _, headers, body = self.get('/simple', **{'accept-encoding': 'gzip'})
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(body)), b'<body><h1>Simple</h1></body>')
+
+    def test_streamed_page_is_sent_in_chunks(self):
+        self.app.stream = True
+        self.app.chunk_size = 10
+        _, headers, body = self.get('/simple')
+        self.assertNotIn('content-length', headers)
+        self.assertGreater(len(body), 2)
+        self.assertEqual(b''.join(body), b'<body><h1>Simple</h1></body>')
+
+    def test_streamed_page_is_compressed_on_the_fly(self):
+        self.app.stream = True
+        self.app.compress_min_size = 1
+        _, headers, body = self.get('/simple', **{'accept-encoding': 'gzip'})
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(body)), b'<body><h1>Simple</h1></body>')
+
+    def test_metrics_are_served_on_reserved_path(self):
+        self.app.metrics = Metrics()
+        self.get('/simple')
+        _, _, body = self.get(Metrics.path)
+        self.assertIn(b'jen_requests_total 1', b''.join(body))
+
+    def test_streamed_bytes_are_counted_as_they_are_sent(self):
+        self.app.metrics = Metrics()
+        self.app.stream = True
+        self.get('/simple')
+        self.assertEqual(self.app.metrics.counters['bytes_served'], 28)
+
+    def test_live_reload_script_is_injected_into_streamed_pages(self):
+        self.app.executor.shutdown()
+        self.app = AsgiApp('tests/site_example', stream=True, live_reload=True)
+        self.app.live_reload.thread = Mock()
+        _, _, body = self.get('/simple')
+        self.assertEqual(b''.join(body), b'<body><h1>Simple</h1></body>' + LiveReload.script)
+
+    def test_live_reload_events_wait_on_the_event_loop(self):
+        self.app.executor.shutdown()
+        self.app = AsgiApp('tests/site_example', live_reload=True)
+        self.app.live_reload.thread = Mock()
+        self.app.executor = Mock(submit=Mock(side_effect=AssertionError('executor used')))
+        bodies = []
+
+        async def talk():
+            loop = asyncio.get_running_loop()
+            closed = asyncio.Event()
+
+            async def receive():
+                await closed.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                bodies.append(message.get('body'))
+                if message.get('body') == b'retry: 1000\n\n':
+                    loop.run_in_executor(None, self.app.live_reload.publish, set(['/simple']), set())
+                elif message.get('body', b'').startswith(b'data:'):
+                    closed.set()
+
+            scope = {'type': 'http', 'method': 'GET', 'path': LiveReload.path, 'headers': []}
+            await asyncio.wait_for(self.app(scope, receive, send), 5)
+
+        asyncio.run(talk())
+        self.assertIn(b'data: {"pages": ["/simple"], "assets": []}\n\n', bodies)
+        self.assertEqual(self.app.live_reload.listeners, [])
+
+    def test_lifespan_is_acknowledged(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+    def test_missing_include_is_an_error_not_a_deleted_page(self):
+        render_page = Mock(side_effect=TemplateNotFound('_missing.html'))
+        with patch.object(self.app, 'render_page', render_page):
+            with patch.object(self.app.routes, 'invalidate') as invalidate, self.assertRaises(TemplateNotFound):
+                self.get('/simple')
+        invalidate.assert_not_called()
+
+class AsgiServerTestCase(TestCase):
+
+    def setUp(self):
+        self.app = AsgiApp('tests/site_example')
+
+    def tearDown(self):
+        self.app.executor.shutdown()
+
+    def exchange(self, *requests):
+        async def talk():
+            server = await AsgiServer(self.app, '127.0.0.1', 0).start()
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b''.join(requests))
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return response
+        return asyncio.run(talk())
+
+    def test_requests_are_served_on_a_kept_alive_connection(self):
+        response = self.exchange(
+            b'GET /simple HTTP/1.1\r\nHost: localhost\r\n\r\n',
+            b'GET /robots.txt HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n',
+        )
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertIn(b'<body><h1>Simple</h1></body>HTTP/1.1 200 OK\r\n', response)
+        self.assertIn(b'Connection: close\r\n', response)
+
+    def test_closed_connections_are_not_reported(self):
+        async def app(scope, receive, send):
+            await receive()
+            disconnected = asyncio.ensure_future(receive())
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            disconnected.cancel()
+            raise ConnectionResetError()
+
+        async def drain():
+            pass
+
+        scope = {'method': 'GET', 'http_version': '1.1'}
+        writer = Mock(drain=drain)
+        with patch('jen.asgi_server.traceback.print_exc') as print_exc:
+            keep_alive = asyncio.run(AsgiServer(app).respond((scope, b'', True), writer))
+        self.assertFalse(keep_alive)
+        print_exc.assert_not_called()
+
+    def test_responses_without_length_are_chunked(self):
+        self.app.stream = True
+        response = self.exchange(b'GET /simple HTTP/1.1\r\nConnection: close\r\n\r\n')
+        self.assertIn(b'transfer-encoding: chunked', response.lower())
+        self.assertTrue(response.endswith(b'1c\r\n<body><h1>Simple</h1></body>\r\n0\r\n\r\n'))
+
+    def test_head_response_has_no_body(self):
+        response = self.exchange(
+            b'GET /simple HTTP/1.1\r\n\r\n',
+            b'HEAD /simple HTTP/1.1\r\nConnection: close\r\n\r\n',
+        )
+        head = response.split(b'</body>', 1)[1]
+        self.assertIn(b'content-length: 28\r\n', head)
+        self.assertTrue(head.endswith(b'\r\n\r\n'))
+
+    def test_errors_become_500_responses(self):
+        with patch.object(self.app, 'handle', side_effect=RuntimeError), OutputBuffer():
+            response = self.exchange(b'GET /simple HTTP/1.1\r\n\r\n')
+        self.assertTrue(response.startswith(b'HTTP/1.1 500 Internal Server Error\r\n'))
+
+
+class RunAsgiCommandTestCase(CliTestCase):
+
+    def test_command_serves_asgi_app(self):
+        with patch('jen.asgi.serve') as serve:
+            with OutputBuffer():
+                Run().run('tests/site_example', asgi=True, bind='0.0.0.0:9000', threads='4')
+        app, bind = serve.call_args[0]
+        self.assertIsInstance(app, AsgiApp)
+        self.assertEqual(app.executor._max_workers, 4)
+        self.assertEqual(bind, '0.0.0.0:9000')
+
+    def test_command_aborts_with_workers(self):
+        with OutputBuffer() as bf:
+            with self.assertRaises(SystemExit):
+                Run().run('tests/site_example', asgi=True, workers='2')
+        self.assert_output(bf.out, 'ERROR: --workers and --worker-class cannot be used with --asgi')
+
+    def test_bind_address_is_parsed(self):
+        self.assertEqual(parse_bind(None), ('127.0.0.1', 8000))
+        self.assertEqual(parse_bind('0.0.0.0:9000'), ('0.0.0.0', 9000))
+        self.assertEqual(parse_bind(':9000'), ('127.0.0.1', 9000))
+        with self.assertRaises(ValueError):
+            parse_bind('localhost')
@@ -0,0 +1,47 @@
+from shutil import rmtree
+from unittest import TestCase
+from unittest.mock import patch
+import os
+
+from jen.assets import AssetManifest, fingerprinted_path
+from jen.manifest import file_hash
+
+
+class AssetManifestTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-assets'
+
+    def setUp(self):
+        os.makedirs(self.directory + '/css')
+        with open(self.directory + '/css/theme.css', 'w') as f:
+            f.write('body {}')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_fingerprinted_path_keeps_directory_and_extension(self):
+        self.assertEqual(fingerprinted_path('css/theme.css', 'abc'), 'css/theme.abc.css')
+        self.assertEqual(fingerprinted_path('LICENSE', 'abc'), 'LICENSE.abc')
+
+    def test_update_hashes_files(self):
+        manifest = AssetManifest()
+        changed = manifest.update(AssetManifest(), self.directory, ['css/theme.css'])
+        digest = file_hash(self.directory + '/css/theme.css')
+        self.assertEqual(changed, ['css/theme.css'])
+        self.assertEqual(manifest.urls(), {'css/theme.css': 'css/theme.' + digest[:10] + '.css'})
+
+    def test_hashes_are_reused_when_size_and_mtime_match(self):
+        previous = AssetManifest()
+        previous.update(AssetManifest(), self.directory, ['css/theme.css'])
+        manifest = AssetManifest()
+        with patch('jen.assets.file_hash') as mock:
+            changed = manifest.update(previous, self.directory, ['css/theme.css'])
+        mock.assert_not_called()
+        self.assertEqual(changed, [])
+        self.assertEqual(manifest.files, previous.files)
+
+    def test_manifest_is_saved_and_loaded(self):
+        manifest = AssetManifest()
+        manifest.update(AssetManifest(), self.directory, ['css/theme.css'])
+        manifest.save(self.directory)
+        self.assertEqual(AssetManifest.load(self.directory).files, manifest.files)
@@ -0,0 +1,55 @@
+from shutil import rmtree
+from unittest import TestCase
+import json
+import os
+
+from benchmarks.main import RunBenchmarks, percentile
+from benchmarks.site_generator import SiteGenerator
+from jen.template_renderer import TemplateRenderer
+
+from .output_buffer import OutputBuffer
+
+
+class SiteGeneratorTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-benchmark-site'
+
+    def tearDown(self):
+        if os.path.exists(self.directory):
+            rmtree(self.directory)
+
+    def test_generated_pages_render_through_inheritance_and_includes(self):
+        SiteGenerator(pages=3, depth=2, includes=2, assets=1).generate(self.directory)
+        body = TemplateRenderer(self.directory).render_page('/section-0/page-2')
+        self.assertIn('<div class="level-2"><div class="level-1"></div><h1>Page 2</h1>', body)
+        self.assertIn('item-1', body)
+
+    def test_generated_assets_have_requested_size(self):
+        SiteGenerator(pages=1, assets=2, asset_size=1000).generate(self.directory)
+        self.assertEqual(os.path.getsize(self.directory + '/assets/style-1.css'), 1000)
+
+    def test_urls_cover_pages_and_assets(self):
+        urls = SiteGenerator(pages=2, assets=1).urls()
+        self.assertEqual(urls, ['/section-0/page-0', '/section-0/page-1', '/assets/style-0.css'])
+
+
+class RunBenchmarksTestCase(TestCase):
+
+    output = '/tmp/jen-tests-benchmark.json'
+
+    def tearDown(self):
+        if os.path.exists(self.output):
+            os.remove(self.output)
+
+    def test_results_are_written_as_json(self):
+        with OutputBuffer():
+            RunBenchmarks().run(self.output, pages=5, assets=2, requests=20, repeat=1)
+        with open(self.output, 'r') as f:
+            results = json.load(f)
+        self.assertEqual(results['site']['pages'], 5)
+        self.assertEqual(results['app']['requests'], 20)
+        self.assertLessEqual(results['build']['min'], results['build']['max'])
+
+    def test_percentile(self):
+        self.assertEqual(percentile(list(range(101)), 99), 99)
+        self.assertEqual(percentile([1, 2, 3], 50), 2)
@@ -1,7 +1,13 @@
-from shutil import rmtree
+from shutil import copytree, rmtree
+from unittest.mock import patch
+import json
 import os.path
+import pstats
+import time
 
+from jen.assets import AssetManifest
 from jen.build import Build
+from jen.manifest import Manifest
 
 from .test_cli import CliTestCase
 from .output_buffer import OutputBuffer
@@ -20,15 +26,22 @@ class BuildTestCase(CliTestCase):
         if os.path.exists(self.target):
             rmtree(self.target)
 
-    def run_command(self, source=None, target=None):
+    def run_command(self, source=None, target=None, **options):
         source = source or self.source
         target = target or self.target
         if self.buffer_output:
             with OutputBuffer() as bf:
-                self.command.run(source, target)
+                self.command.run(source, target, **options)
             return bf
         else:
-            self.command.run(source, target)
+            self.command.run(source, target, **options)
+
+    def read_target_files(self):
+        contents = {}
+        for path in self.command.get_files_from_directory(self.target):
+            with open(path, 'rb') as f:
+                contents[path] = f.read()
+        return contents
 
     def test_command_fails_if_source_directory_is_invalid(self):
         with self.assertRaises(SystemExit):
@@ -70,3 +83,489 @@ class BuildTestCase(CliTestCase):
         self.assertIn('OK: sub-without-index/simple.html', bf.out)
         self.assertIn('OK: robots.txt', bf.out)
         self.assertIn('OK: theme.css', bf.out)
+
+    def test_cache_directory_inside_source_is_not_copied(self):
+        cache_directory = os.path.join(self.source, '.jen-cache')
+        try:
+            self.run_command(cache_dir=cache_directory)
+            self.assertTrue(os.path.isdir(cache_directory))
+            self.assertFalse(os.path.exists(self.target + '/.jen-cache'))
+        finally:
+            rmtree(cache_directory)
+
+    def test_replace_swaps_new_build_into_existing_target(self):
+        os.makedirs(self.target)
+        with open(self.target + '/stale.html', 'w') as f:
+            f.write('stale')
+        self.run_command(replace=True)
+        self.assertNotIn('stale.html', os.listdir(self.target))
+        self.assertIn('index.html', os.listdir(self.target))
+        self.assertEqual([name for name in os.listdir('/tmp') if '.jen-staging-' in name], [])
+
+    def test_replace_refuses_to_overwrite_the_source(self):
+        source = '/tmp/jen-tests-overlap'
+        copytree(self.source, source)
+        try:
+            for target in (source, source + '/dist', '/tmp'):
+                with self.assertRaises(SystemExit):
+                    self.run_command(source=source, target=target, replace=True)
+            self.assertIn('_base.html', os.listdir(source))
+            self.assertFalse(os.path.exists(source + '/dist'))
+        finally:
+            rmtree(source)
+
+    def test_failed_build_keeps_existing_target(self):
+        os.makedirs(self.target)
+        with open(self.target + '/index.html', 'w') as f:
+            f.write('live')
+        with patch('jen.build.Build.render_template', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.run_command(replace=True)
+        self.assertEqual(os.listdir(self.target), ['index.html'])
+        self.assertEqual([name for name in os.listdir('/tmp') if '.jen-staging-' in name], [])
+
+    def test_output_directories_are_created_once(self):
+        with patch('jen.output_writer.os.makedirs', wraps=os.makedirs) as makedirs:
+            self.run_command()
+        self.assertEqual(makedirs.call_count, 4)
+
+    def test_command_fails_if_static_mode_is_unknown(self):
+        with self.assertRaises(SystemExit):
+            self.run_command(static_mode='move')
+
+    def test_static_files_can_be_hardlinked(self):
+        self.run_command(static_mode='hardlink')
+        self.assertTrue(os.path.samefile(self.target + '/theme.css', self.source + '/theme.css'))
+
+    def test_static_files_can_be_symlinked(self):
+        self.run_command(static_mode='symlink')
+        self.assertTrue(os.path.islink(self.target + '/theme.css'))
+
+    def test_profile_reports_slowest_outputs_and_most_included_templates(self):
+        bf = self.run_command(profile='2')
+        self.assertIn('PROFILE: 7 outputs', bf.out)
+        self.assertEqual(bf.out.split('SLOWEST:')[1].split('MOST INCLUDED:')[0].count('ms  '), 2)
+        self.assertIn('4  _base.html', bf.out)
+
+    def test_profile_tolerates_broken_unused_partial(self):
+        source = '/tmp/jen-tests-source'
+        copytree(self.source, source)
+        try:
+            with open(source + '/_broken.html', 'w') as f:
+                f.write('{% block %}')
+            bf = self.run_command(source=source, profile='2')
+            self.assertIn('PROFILE: 7 outputs', bf.out)
+        finally:
+            rmtree(source)
+
+    def test_failed_profile_report_keeps_the_build(self):
+        with patch('jen.profiler.BuildProfile.report', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.run_command(profile='2')
+        self.assertIn('index.html', os.listdir(self.target))
+
+    def test_profile_output_can_be_a_trace(self):
+        trace = '/tmp/jen-tests-trace.json'
+        try:
+            self.run_command(profile_output=trace, jobs='2')
+            with open(trace, 'r') as f:
+                events = json.load(f)['traceEvents']
+            self.assertIn('index.html', [event['name'] for event in events])
+        finally:
+            os.remove(trace)
+
+    def test_profile_output_can_be_a_cprofile_dump(self):
+        stats = '/tmp/jen-tests-build.pstats'
+        try:
+            self.run_command(profile_output=stats)
+            self.assertTrue(pstats.Stats(stats).total_calls > 0)
+        finally:
+            os.remove(stats)
+
+    def test_command_fails_if_jobs_is_not_a_positive_integer(self):
+        with self.assertRaises(SystemExit):
+            self.run_command(jobs='zero')
+
+    def test_parallel_build_output_is_identical_to_serial_build(self):
+        self.run_command()
+        serial = self.read_target_files()
+        rmtree(self.target)
+        self.run_command(jobs='4')
+        self.assertEqual(self.read_target_files(), serial)
+
+    def test_parallel_build_outputs_generated_file_names_in_serial_order(self):
+        serial = self.run_command().out
+        rmtree(self.target)
+        self.command = Build()
+        parallel = self.run_command(jobs='4').out
+        self.assertEqual(parallel, serial)
+
+
+class IncrementalBuildTestCase(CliTestCase):
+
+    source = '/tmp/jen-tests-source'
+    target = '/tmp/jen-tests-dist'
+
+    def setUp(self):
+        copytree('tests/site_example', self.source)
+        self.rebuild()
+
+    def tearDown(self):
+        rmtree(self.source)
+        if os.path.exists(self.target):
+            rmtree(self.target)
+
+    def rebuild(self):
+        with OutputBuffer() as bf:
+            Build().run(self.source, self.target, incremental=True)
+        return bf
+
+    def test_incremental_build_refuses_to_overwrite_the_source(self):
+        for target in (self.source, self.source + '/dist'):
+            with OutputBuffer():
+                with self.assertRaises(SystemExit):
+                    Build().run(self.source, target, incremental=True)
+        with open(self.source + '/simple.html', 'r') as f:
+            self.assertIn('{% extends', f.read())
+        self.assertFalse(os.path.exists(self.source + '/dist'))
+
+    def test_target_is_not_walked_as_a_source(self):
+        build = Build()
+        build.target_directory = self.source + '/dist'
+        os.makedirs(build.target_directory)
+        with open(build.target_directory + '/a.html', 'w') as f:
+            f.write('output')
+        files = build.get_files_from_directory(self.source)
+        self.assertNotIn(self.source + '/dist/a.html', files)
+        self.assertIn(self.source + '/simple.html', files)
+
+    def touch(self, relative_path, text):
+        path = os.path.join(self.source, relative_path)
+        with open(path, 'w') as f:
+            f.write(text)
+        mtime = time.time() + 10
+        os.utime(path, (mtime, mtime))
+
+    def test_first_incremental_build_writes_manifest(self):
+        manifest = Manifest.load(self.target)
+        self.assertIn('index.html', manifest.files)
+        self.assertEqual(manifest.files['index.html']['dependencies'], ['_base.html'])
+
+    def test_unchanged_source_rebuilds_nothing(self):
+        bf = self.rebuild()
+        self.assertEqual(bf.out, '')
+
+    def test_touched_file_with_same_content_is_not_rebuilt(self):
+        with open(os.path.join(self.source, 'simple.html'), 'r') as f:
+            text = f.read()
+        self.touch('simple.html', text)
+        bf = self.rebuild()
+        self.assertEqual(bf.out, '')
+
+    def test_changed_leaf_page_is_the_only_rebuilt_output(self):
+        self.touch('simple.html', "{% extends '_base.html' %}{% block body %}Changed{% endblock %}")
+        bf = self.rebuild()
+        self.assert_output(bf.out, 'OK: simple.html')
+        with open(self.target + '/simple.html', 'r') as f:
+            self.assertEqual(f.read(), '<body>Changed</body>')
+
+    def test_changed_base_template_rebuilds_dependent_pages(self):
+        self.touch('_base.html', '<main>{% block body %}{% endblock %}</main>')
+        bf = self.rebuild()
+        self.assert_output(bf.out, """
+            OK: index.html
+            OK: simple.html
+            OK: sub-with-index/index.html
+            OK: sub-without-index/simple.html
+        """)
+
+    def test_changed_static_file_is_copied(self):
+        self.touch('theme.css', 'body {}')
+        bf = self.rebuild()
+        self.assert_output(bf.out, 'OK: theme.css')
+
+    def test_missing_output_is_rebuilt(self):
+        os.remove(self.target + '/robots.txt')
+        bf = self.rebuild()
+        self.assert_output(bf.out, 'OK: robots.txt')
+
+    def test_removed_sources_are_pruned_from_target(self):
+        rmtree(os.path.join(self.source, 'sub-with-404'))
+        bf = self.rebuild()
+        self.assert_output(bf.out, 'REMOVED: sub-with-404/404.html')
+        self.assertFalse(os.path.exists(self.target + '/sub-with-404'))
+
+    def test_broken_unused_partial_is_treated_as_dynamic(self):
+        self.touch('_broken.html', '{% block %}')
+        bf = self.rebuild()
+        self.assertEqual(bf.out, '')
+        self.assertEqual(Manifest.load(self.target).files['_broken.html']['dependencies'], [None])
+
+    def test_new_include_dependency_is_tracked(self):
+        self.touch('_footer.html', '<footer></footer>')
+        self.touch('simple.html', "{% include '_footer.html' %}")
+        self.rebuild()
+        self.touch('_footer.html', '<footer>New</footer>')
+        bf = self.rebuild()
+        self.assert_output(bf.out, 'OK: simple.html')
+
+    def test_pages_with_dynamic_dependencies_are_always_rebuilt(self):
+        self.touch('simple.html', "{% set name = '_base.html' %}{% include name %}")
+        self.rebuild()
+        bf = self.rebuild()
+        self.assert_output(bf.out, 'OK: simple.html')
+
+
+class WatchBuildTestCase(CliTestCase):
+
+    source = '/tmp/jen-tests-source'
+    target = '/tmp/jen-tests-dist'
+
+    def setUp(self):
+        copytree('tests/site_example', self.source)
+        self.command = Build()
+        with OutputBuffer():
+            with patch('jen.watcher.watch') as watch:
+                watch.return_value.wait.side_effect = KeyboardInterrupt
+                self.command.run(self.source, self.target, watch=True)
+        self.graph = self.command.template_graph(self.source)
+
+    def tearDown(self):
+        rmtree(self.source)
+        if os.path.exists(self.target):
+            rmtree(self.target)
+
+    def rebuild(self, *changed):
+        with OutputBuffer() as bf:
+            self.command.rebuild(self.source, self.target, set(changed), self.graph)
+        return bf
+
+    def touch(self, relative_path, text):
+        path = os.path.join(self.source, relative_path)
+        with open(path, 'w') as f:
+            f.write(text)
+        mtime = time.time() + 10
+        os.utime(path, (mtime, mtime))
+
+    def read(self, relative_path):
+        with open(os.path.join(self.target, relative_path), 'r') as f:
+            return f.read()
+
+    def test_watch_builds_target_first(self):
+        self.assertEqual(self.read('simple.html'), '<body><h1>Simple</h1></body>')
+
+    def test_changed_page_is_the_only_rendered_output(self):
+        self.touch('simple.html', "{% extends '_base.html' %}{% block body %}Changed{% endblock %}")
+        bf = self.rebuild('simple.html')
+        self.assert_output(bf.out, 'OK: simple.html')
+        self.assertEqual(self.read('simple.html'), '<body>Changed</body>')
+
+    def test_changed_layout_renders_dependent_pages(self):
+        self.touch('_base.html', '<main>{% block body %}{% endblock %}</main>')
+        bf = self.rebuild('_base.html')
+        self.assert_output(bf.out, """
+            OK: index.html
+            OK: simple.html
+            OK: sub-with-index/index.html
+            OK: sub-without-index/simple.html
+        """)
+        self.assertEqual(self.read('simple.html'), '<main><h1>Simple</h1></main>')
+
+    def test_copied_directory_is_built_file_by_file(self):
+        copytree(self.source + '/sub-with-index', self.source + '/copied')
+        bf = self.rebuild('copied')
+        self.assert_output(bf.out, 'OK: copied/index.html')
+        self.assertEqual(self.read('copied/index.html'), self.read('sub-with-index/index.html'))
+
+    def test_deleted_directory_removes_its_outputs(self):
+        rmtree(self.source + '/sub-with-index')
+        bf = self.rebuild('sub-with-index')
+        self.assert_output(bf.out, 'REMOVED: sub-with-index/index.html')
+        self.assertFalse(os.path.exists(self.target + '/sub-with-index'))
+
+    def test_broken_partial_does_not_stop_watch_from_starting(self):
+        self.touch('_broken.html', '{% if %}')
+        with OutputBuffer() as bf:
+            with patch('jen.watcher.watch') as watch:
+                watch.return_value.wait.side_effect = KeyboardInterrupt
+                self.command.watch(self.source, self.target)
+        self.assertIn('Watching', bf.out)
+
+    def test_new_include_is_tracked_between_rebuilds(self):
+        self.touch('_footer.html', '<footer></footer>')
+        self.touch('simple.html', "{% include '_footer.html' %}")
+        self.rebuild('_footer.html', 'simple.html')
+        self.touch('_footer.html', '<footer>New</footer>')
+        bf = self.rebuild('_footer.html')
+        self.assert_output(bf.out, 'OK: simple.html')
+        self.assertEqual(self.read('simple.html'), '<footer>New</footer>')
+
+    def test_changed_static_file_is_copied(self):
+        self.touch('theme.css', 'body {}')
+        bf = self.rebuild('theme.css')
+        self.assert_output(bf.out, 'OK: theme.css')
+        self.assertEqual(self.read('theme.css'), 'body {}')
+
+    def test_removed_sources_are_removed_from_target(self):
+        os.remove(os.path.join(self.source, 'robots.txt'))
+        os.remove(os.path.join(self.source, 'sub-with-404/404.html'))
+        bf = self.rebuild('robots.txt', 'sub-with-404/404.html')
+        self.assert_output(bf.out, """
+            REMOVED: robots.txt
+            REMOVED: sub-with-404/404.html
+        """)
+        self.assertFalse(os.path.exists(self.target + '/sub-with-404'))
+
+    def test_template_errors_are_reported_without_stopping(self):
+        self.touch('simple.html', '{% block %}')
+        bf = self.rebuild('simple.html')
+        self.assertIn('ERROR: simple.html', bf.out)
+
+    def test_outputs_are_replaced_atomically(self):
+        with patch('jen.build.os.replace', wraps=os.replace) as replace:
+            self.touch('simple.html', 'Changed')
+            self.rebuild('simple.html')
+        replace.assert_called_once_with(self.target + '/simple.html.jen-tmp', self.target + '/simple.html')
+
+
+class PrecompressBuildTestCase(CliTestCase):
+
+    source = '/tmp/jen-tests-source'
+    target = '/tmp/jen-tests-dist'
+
+    def setUp(self):
+        copytree('tests/site_example', self.source)
+        with open(self.source + '/big.css', 'w') as f:
+            f.write('body { color: red; }\n' * 100)
+
+    def tearDown(self):
+        rmtree(self.source)
+        if os.path.exists(self.target):
+            rmtree(self.target)
+
+    def build(self, **options):
+        with OutputBuffer() as bf:
+            Build().run(self.source, self.target, **options)
+        return bf
+
+    def test_compressible_outputs_get_gzip_variant(self):
+        self.build(precompress=True)
+        self.assertTrue(os.path.exists(self.target + '/big.css.gz'))
+
+    def test_small_outputs_are_not_compressed(self):
+        self.build(precompress=True)
+        self.assertFalse(os.path.exists(self.target + '/theme.css.gz'))
+        self.assertFalse(os.path.exists(self.target + '/index.html.gz'))
+
+    def test_outputs_are_not_compressed_by_default(self):
+        self.build()
+        self.assertFalse(os.path.exists(self.target + '/big.css.gz'))
+
+    def test_incremental_build_records_compressed_variants(self):
+        self.build(precompress=True, incremental=True)
+        manifest = Manifest.load(self.target)
+        self.assertEqual(manifest.files['big.css']['compressed'], ['big.css.gz'])
+
+    def test_incremental_build_does_not_compress_unchanged_outputs_again(self):
+        self.build(precompress=True, incremental=True)
+        with patch('jen.compression.precompress_file') as mock:
+            self.build(precompress=True, incremental=True)
+        mock.assert_not_called()
+
+    def test_incremental_build_compresses_existing_outputs_when_enabled(self):
+        self.build(incremental=True)
+        self.build(precompress=True, incremental=True)
+        self.assertTrue(os.path.exists(self.target + '/big.css.gz'))
+
+    def test_incremental_build_removes_variants_when_disabled(self):
+        self.build(precompress=True, incremental=True)
+        self.build(incremental=True)
+        self.assertFalse(os.path.exists(self.target + '/big.css.gz'))
+
+    def test_incremental_build_removes_stale_variant_of_rewritten_output(self):
+        self.build(precompress=True, incremental=True)
+        with open(self.source + '/big.css', 'w') as f:
+            f.write('a')
+        self.build(precompress=True, incremental=True)
+        self.assertFalse(os.path.exists(self.target + '/big.css.gz'))
+
+    def test_removed_source_prunes_its_variants(self):
+        self.build(precompress=True, incremental=True)
+        os.remove(self.source + '/big.css')
+        self.build(precompress=True, incremental=True)
+        self.assertFalse(os.path.exists(self.target + '/big.css.gz'))
+
+
+class FingerprintBuildTestCase(CliTestCase):
+
+    source = '/tmp/jen-tests-source'
+    target = '/tmp/jen-tests-dist'
+
+    def setUp(self):
+        copytree('tests/site_example', self.source)
+        self.write('simple.html', "<link href=\"{{ asset('theme.css') }}\">")
+
+    def tearDown(self):
+        rmtree(self.source)
+        if os.path.exists(self.target):
+            rmtree(self.target)
+
+    def build(self, **options):
+        with OutputBuffer() as bf:
+            Build().run(self.source, self.target, fingerprint=True, **options)
+        return bf
+
+    def write(self, relative_path, text):
+        path = os.path.join(self.source, relative_path)
+        with open(path, 'w') as f:
+            f.write(text)
+        mtime = time.time() + 10
+        os.utime(path, (mtime, mtime))
+
+    def read(self, relative_path):
+        with open(os.path.join(self.target, relative_path), 'r') as f:
+            return f.read()
+
+    def assets(self):
+        return AssetManifest.load(self.target).urls()
+
+    def test_static_files_are_written_under_fingerprinted_names(self):
+        self.build()
+        fingerprinted = self.assets()['theme.css']
+        self.assertRegex(fingerprinted, r'^theme\.[0-9a-f]{10}\.css$')
+        self.assertEqual(self.read(fingerprinted), self.read('theme.css'))
+
+    def test_templates_link_to_fingerprinted_assets(self):
+        self.build()
+        self.assertEqual(self.read('simple.html'), '<link href="/{}">'.format(self.assets()['theme.css']))
+
+    def test_parallel_build_links_to_fingerprinted_assets(self):
+        self.build(jobs='2')
+        self.assertEqual(self.read('simple.html'), '<link href="/{}">'.format(self.assets()['theme.css']))
+
+    def test_changed_asset_rerenders_pages_using_it(self):
+        self.build(incremental=True)
+        old = self.assets()['theme.css']
+        self.write('theme.css', 'body { color: red; }')
+        bf = self.build(incremental=True)
+        new = self.assets()['theme.css']
+        self.assert_output(bf.out, """
+            OK: simple.html
+            OK: theme.css
+        """)
+        self.assertEqual(self.read('simple.html'), '<link href="/{}">'.format(new))
+        self.assertFalse(os.path.exists(os.path.join(self.target, old)))
+
+    def test_unchanged_assets_are_not_hashed_again(self):
+        self.build(incremental=True)
+        with patch('jen.assets.file_hash') as mock:
+            bf = self.build(incremental=True)
+        mock.assert_not_called()
+        self.assertEqual(bf.out, '')
+
+    def test_disabling_fingerprints_restores_plain_urls(self):
+        self.build(incremental=True)
+        with OutputBuffer():
+            Build().run(self.source, self.target, incremental=True)
+        self.assertEqual(self.read('simple.html'), '<link href="/theme.css">')
+        self.assertFalse(os.path.exists(os.path.join(self.target, AssetManifest.filename)))
@@ -0,0 +1,46 @@
+from shutil import rmtree
+from unittest import TestCase
+from unittest.mock import patch
+import os
+
+from jinja2 import Environment
+
+from jen.bytecode_cache import BytecodeCache
+from jen.template_renderer import TemplateRenderer
+
+
+class BytecodeCacheTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-cache'
+
+    def tearDown(self):
+        if os.path.exists(self.directory):
+            rmtree(self.directory)
+
+    def cache_files(self):
+        return [name for name in os.listdir(self.directory) if name.endswith('.jinja')]
+
+    def test_renderer_stores_compiled_templates_in_cache_directory(self):
+        renderer = TemplateRenderer('tests/site_example', self.directory)
+        renderer.render_page('/simple')
+        self.assertEqual(len(self.cache_files()), 2)
+
+    def test_renderer_loads_compiled_templates_from_cache_directory(self):
+        TemplateRenderer('tests/site_example', self.directory).render_page('/simple')
+        renderer = TemplateRenderer('tests/site_example', self.directory)
+        with patch.object(Environment, 'compile', side_effect=AssertionError('compiled again')):
+            self.assertEqual(renderer.render_page('/simple'), '<body><h1>Simple</h1></body>')
+
+    def test_cache_evicts_oldest_entries_when_size_limit_is_exceeded(self):
+        renderer = TemplateRenderer('tests/site_example', self.directory)
+        renderer._set_env_once()
+        renderer.jinja_env.bytecode_cache.max_size = 1
+        renderer.render_page('/simple')
+        renderer.render_page('/')
+        self.assertLessEqual(len(self.cache_files()), 1)
+
+    def test_cache_size_is_computed_from_existing_entries(self):
+        TemplateRenderer('tests/site_example', self.directory).render_page('/simple')
+        cache = BytecodeCache(self.directory)
+        expected = sum(os.path.getsize(os.path.join(self.directory, name)) for name in self.cache_files())
+        self.assertEqual(cache.size, expected)
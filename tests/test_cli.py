@@ -77,6 +77,27 @@ class CliAppTestCase(CliTestCase):
         self.assertIn(SayHello.usage, bf.out)
         self.assertIn(SayHello.description, bf.out)
 
+    def test_app_help_lists_command_options(self):
+        self.app.command(SayHello())
+        bf = self.call('app')
+        self.assertIn('--greeting=TEXT', bf.out)
+        self.assertIn('Greeting to use', bf.out)
+
+    def test_lazy_command_is_imported_only_when_called(self):
+        self.app.lazy_command('hello', SayHello.usage, SayHello.description, 'tests.test_cli:SayHello')
+        bf = self.call('app')
+        self.assertIn(SayHello.usage, bf.out)
+        self.assertIsNone(self.app.commands[0].command)
+        bf = self.call('app hello John')
+        self.assert_output(bf.out, 'Hello John')
+        self.assertIsInstance(self.app.commands[0].command, SayHello)
+
+    def test_command_help_lists_options(self):
+        self.app.lazy_command('hello', SayHello.usage, SayHello.description, 'tests.test_cli:SayHello')
+        bf = self.call('app hello --help')
+        self.assertIn('USAGE: ' + SayHello.usage, bf.out)
+        self.assertIn('--greeting=TEXT', bf.out)
+
     def test_app_aborts_call_with_message_if_specified_command_is_unknown(self):
         self.app.command(SayHello())
         bf = self.call('app foo')
@@ -100,6 +121,41 @@ class CliCommandTestCase(CliTestCase):
             ERROR: missing 1 required positional argument: 'name'
         """)
 
+    def test_can_be_called_with_options(self):
+        command = SayHello()
+        with OutputBuffer() as bf:
+            command.call('John', '--greeting=Hi')
+        self.assert_output(bf.out, 'Hi John')
+
+    def test_option_without_value_is_true(self):
+        command = SayHello()
+        self.assertEqual(command.parse_args(['John', '--loud']), (['John'], {'loud': True}))
+
+    def test_option_names_use_underscores(self):
+        command = SayHello()
+        self.assertEqual(command.parse_args(['--dry-run=no']), ([], {'dry_run': 'no'}))
+
+    def test_prints_usage_and_error_if_called_with_unknown_option(self):
+        command = SayHello()
+        with OutputBuffer() as bf:
+            command.call('John', '--foo')
+        self.assertIn("unexpected keyword argument 'foo'", bf.out)
+
+    def test_int_option_parses_value(self):
+        command = CliCommand()
+        self.assertEqual(command.int_option('jobs', '4'), 4)
+
+    def test_int_option_uses_default_when_flag_has_no_value(self):
+        command = CliCommand()
+        self.assertEqual(command.int_option('jobs', True, 2), 2)
+
+    def test_int_option_aborts_if_value_is_invalid(self):
+        command = CliCommand()
+        with OutputBuffer() as bf:
+            with self.assertRaises(SystemExit):
+                command.int_option('max_jobs', '0')
+        self.assert_output(bf.out, 'ERROR: --max-jobs must be a positive integer')
+
     def test_command_can_echo(self):
         command = CliCommand()
         with OutputBuffer() as bf:
@@ -125,6 +181,9 @@ class SayHello(CliCommand):
     name = 'hello'
     usage = 'app hello <name>'
     description = 'Says hello to the specified name.'
+    options = (
+        ('--greeting=TEXT', 'Greeting to use instead of "Hello"'),
+    )
 
-    def run(self, name):
-        self.echo('Hello ' + name)
+    def run(self, name, greeting='Hello'):
+        self.echo(greeting + ' ' + name)
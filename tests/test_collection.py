@@ -0,0 +1,195 @@
+from shutil import rmtree
+from unittest import TestCase
+from unittest.mock import Mock
+import json
+import os
+import time
+import types
+
+from jen import data
+from jen.build import Build
+from jen.collection import Collection, load_collections
+from jen.run import App
+from .output_buffer import OutputBuffer
+
+
+class CollectionTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-collection'
+    target = '/tmp/jen-tests-collection-dist'
+
+    def setUp(self):
+        data._cache.clear()
+        self.write('_data/products.csv', 'id,name\n' + ''.join('{0},Product {0}\n'.format(i) for i in range(1, 6)))
+        self.write('_product.html', '{{ record.name }}')
+        self.write('_products.html', '{{ page.number }}/{{ page.count }}:'
+            '{% for item in page.items %}{{ collection.url(item) }} {% endfor %}'
+            '{{ page.previous_url }} {{ page.next_url }}')
+        self.write('index.html', 'Home')
+        self.write('_collections.json', json.dumps({'products': {
+            'data': 'products', 'template': '_product.html', 'path': 'products/{id}',
+            'index': '_products.html', 'per_page': 2,
+        }}))
+
+    def tearDown(self):
+        rmtree(self.directory)
+        if os.path.exists(self.target):
+            rmtree(self.target)
+
+    def write(self, relative_path, text):
+        path = os.path.join(self.directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+        mtime = time.time() + 10
+        os.utime(path, (mtime, mtime))
+
+    def read(self, relative_path):
+        with open(os.path.join(self.target, relative_path), 'r') as f:
+            return f.read()
+
+    def collection(self):
+        return load_collections(self.directory)['products']
+
+
+class CollectionPagesTestCase(CollectionTestCase):
+
+    def test_pages_are_generated_lazily(self):
+        pages = self.collection().pages()
+        self.assertIsInstance(pages, types.GeneratorType)
+        relative_path, template, context = next(pages)
+        self.assertEqual((relative_path, template), ('products/1.html', '_product.html'))
+        self.assertEqual(context['record'], {'id': '1', 'name': 'Product 1'})
+
+    def test_records_are_followed_by_index_pages(self):
+        paths = [relative_path for relative_path, _, _ in self.collection().pages()]
+        self.assertEqual(paths[5:], ['products/index.html', 'products/page/2.html', 'products/page/3.html'])
+
+    def test_index_pages_link_to_each_other(self):
+        pages = [context['page'] for _, template, context in self.collection().pages() if template == '_products.html']
+        self.assertEqual([len(page.items) for page in pages], [2, 2, 1])
+        self.assertEqual((pages[0].previous_url, pages[0].next_url), (None, '/products/page/2'))
+        self.assertEqual((pages[2].previous_url, pages[2].next_url), ('/products/page/2', None))
+
+    def test_record_paths_must_stay_inside_the_site(self):
+        collection = Collection(self.directory, 'products', 'products', '_product.html', '{name}')
+        with self.assertRaises(ValueError):
+            collection.record_path({'name': '../outside'})
+        with self.assertRaises(ValueError):
+            collection.record_path({'other': 'field'})
+
+    def test_unknown_options_are_reported(self):
+        self.write('_collections.json', json.dumps({'products': {'data': 'products', 'colour': 'red'}}))
+        with self.assertRaises(ValueError):
+            load_collections(self.directory)
+
+    def test_routes_resolve_records_and_index_pages(self):
+        collection = self.collection()
+        self.assertEqual(collection.route('/products/3')[1]['record']['name'], 'Product 3')
+        self.assertEqual(collection.route('/products')[1]['page'].number, 1)
+        self.assertEqual(collection.route('/products/page/3')[1]['page'].number, 3)
+        self.assertIsNone(collection.route('/products/page/4'))
+        self.assertIsNone(collection.route('/products/page/1'))
+        self.assertIsNone(collection.route('/products/9'))
+
+
+class CollectionBuildTestCase(CollectionTestCase):
+
+    def build(self, **options):
+        with OutputBuffer() as bf:
+            Build().run(self.directory, self.target, **options)
+        return bf
+
+    def test_build_writes_record_and_index_pages(self):
+        bf = self.build()
+        self.assertIn('OK: products (8 pages)', bf.out)
+        self.assertEqual(self.read('products/4.html'), 'Product 4')
+        self.assertEqual(self.read('products/index.html'), '1/3:/products/1 /products/2 None /products/page/2')
+        self.assertEqual(self.read('products/page/3.html'), '3/3:/products/5 /products/page/2 None')
+        self.assertFalse(os.path.exists(os.path.join(self.target, '_collections.json')))
+
+    def test_parallel_build_writes_the_same_pages(self):
+        batch_size = Build.collection_batch_size
+        Build.collection_batch_size = 3
+        try:
+            self.build(jobs=2)
+        finally:
+            Build.collection_batch_size = batch_size
+        self.assertEqual(self.read('products/5.html'), 'Product 5')
+        self.assertEqual(self.read('products/page/2.html'), '2/3:/products/3 /products/4 /products /products/page/3')
+
+    def test_missing_data_aborts_the_build(self):
+        self.write('_collections.json', json.dumps({'products': {
+            'data': 'missing', 'template': '_product.html', 'path': '{id}'}}))
+        with OutputBuffer() as bf:
+            with self.assertRaises(SystemExit):
+                Build().run(self.directory, self.target)
+        self.assertIn('ERROR: collection "products": no data file for "missing"', bf.out)
+
+    def test_incremental_build_skips_unchanged_collections(self):
+        self.build(incremental=True)
+        bf = self.build(incremental=True)
+        self.assertEqual(bf.out, '')
+
+    def test_incremental_build_rebuilds_collection_and_prunes_removed_records(self):
+        self.build(incremental=True)
+        self.write('_data/products.csv', 'id,name\n1,Renamed\n')
+        bf = self.build(incremental=True)
+        self.assertIn('OK: products (2 pages)', bf.out)
+        self.assertIn('REMOVED: products/5.html', bf.out)
+        self.assertIn('REMOVED: products/page/3.html', bf.out)
+        self.assertEqual(self.read('products/1.html'), 'Renamed')
+        self.assertFalse(os.path.exists(os.path.join(self.target, 'products/2.html')))
+
+    def test_incremental_build_rebuilds_collection_when_template_changes(self):
+        self.build(incremental=True)
+        self.write('_product.html', '<b>{{ record.name }}</b>')
+        bf = self.build(incremental=True)
+        self.assertIn('OK: products (8 pages)', bf.out)
+        self.assertEqual(self.read('products/2.html'), '<b>Product 2</b>')
+
+
+class CollectionAppTestCase(CollectionTestCase):
+
+    def setUp(self):
+        super(CollectionAppTestCase, self).setUp()
+        self.app = App(self.directory)
+
+    def get(self, path):
+        start_response = Mock()
+        body = b''.join(self.app({'PATH_INFO': path}, start_response))
+        return start_response.call_args[0][0], body
+
+    def test_record_pages_are_served(self):
+        self.assertEqual(self.get('/products/2'), ('200 OK', b'Product 2'))
+
+    def test_index_pages_are_served(self):
+        status, body = self.get('/products/page/2')
+        self.assertEqual(status, '200 OK')
+        self.assertTrue(body.startswith(b'2/3:/products/3 /products/4'))
+
+    def test_unknown_records_are_not_found(self):
+        self.assertEqual(self.get('/products/99')[0], '404 Not Found')
+        self.assertEqual(self.get('/products/page/4')[0], '404 Not Found')
+
+    def test_config_is_not_served(self):
+        self.assertEqual(self.get('/_collections.json')[0], '404 Not Found')
+
+    def test_pages_are_cached_per_record(self):
+        self.get('/products/1')
+        self.get('/products/2')
+        self.assertEqual(self.get('/products/1'), ('200 OK', b'Product 1'))
+        self.assertEqual(self.app.page_cache.hits, 1)
+
+    def test_pages_are_rendered_again_when_data_changes(self):
+        self.get('/products/1')
+        self.write('_data/products.csv', 'id,name\n1,Renamed\n')
+        self.assertEqual(self.get('/products/1'), ('200 OK', b'Renamed'))
+        self.assertEqual(self.get('/products/2')[0], '404 Not Found')
+
+    def test_changed_collection_inputs_reload_every_page(self):
+        self.get('/products/1')
+        _, assets = self.app.invalidate(['_data/products.csv'])
+        self.assertIn('*', assets)
+        _, assets = self.app.invalidate(['index.html'])
+        self.assertNotIn('*', assets)
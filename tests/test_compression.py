@@ -0,0 +1,74 @@
+from shutil import rmtree
+from unittest import TestCase
+from unittest.mock import patch
+import gzip
+import os
+
+from jen import compression
+
+
+class CompressionTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-compression'
+
+    def setUp(self):
+        os.makedirs(self.directory)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_text_types_are_compressible(self):
+        self.assertTrue(compression.is_compressible('text/html'))
+        self.assertTrue(compression.is_compressible('text/css; charset=utf-8'))
+        self.assertTrue(compression.is_compressible('image/svg+xml'))
+        self.assertTrue(compression.is_compressible('application/json'))
+
+    def test_binary_types_are_not_compressible(self):
+        self.assertFalse(compression.is_compressible('image/png'))
+        self.assertFalse(compression.is_compressible(None))
+
+    def test_gzip_output_is_deterministic(self):
+        self.assertEqual(compression.compress(b'a' * 100, 'gzip'), compression.compress(b'a' * 100, 'gzip'))
+
+    def test_gzip_stream_decompresses_to_joined_chunks(self):
+        chunks = [b'<p>first</p>', b'', b'<p>second</p>']
+        compressed = b''.join(compression.compress_stream(chunks, 'gzip'))
+        self.assertEqual(gzip.decompress(compressed), b'<p>first</p><p>second</p>')
+
+    def test_unknown_stream_encoding_fails(self):
+        with self.assertRaises(ValueError):
+            list(compression.compress_stream([b'a'], 'zstd'))
+
+    def test_unknown_encoding_fails(self):
+        with self.assertRaises(ValueError):
+            compression.compress(b'a', 'zstd')
+
+    def test_brotli_is_only_available_when_installed(self):
+        with patch('jen.compression.brotli', None):
+            self.assertEqual(compression.available_encodings(), ['gzip'])
+
+    def test_precompress_writes_smaller_variant(self):
+        path = self.write('theme.css', b'body { color: red; }\n' * 100)
+        self.assertEqual(compression.precompress_file(path, ['gzip']), [path + '.gz'])
+        with open(path + '.gz', 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), b'body { color: red; }\n' * 100)
+
+    def test_precompress_skips_files_below_min_size(self):
+        path = self.write('theme.css', b'body { color: red; }\n' * 100)
+        self.assertEqual(compression.precompress_file(path, ['gzip'], min_size=10000), [])
+        self.assertFalse(os.path.exists(path + '.gz'))
+
+    def test_precompress_skips_incompressible_types(self):
+        path = self.write('image.png', b'\x00' * 1000)
+        self.assertEqual(compression.precompress_file(path, ['gzip']), [])
+
+    def test_precompress_skips_variant_that_is_not_smaller(self):
+        path = self.write('random.txt', os.urandom(1000))
+        self.assertEqual(compression.precompress_file(path, ['gzip']), [])
+        self.assertFalse(os.path.exists(path + '.gz'))
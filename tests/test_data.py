@@ -0,0 +1,199 @@
+from shutil import rmtree
+from unittest import TestCase
+from unittest.mock import Mock, patch
+import json
+import os
+import time
+import types
+
+from jen import data
+from jen.build import Build
+from jen.data import DataContext, stream_json
+from jen.run import App
+from jen.template_renderer import TemplateRenderer
+from .output_buffer import OutputBuffer
+
+
+class DataTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-data'
+
+    def setUp(self):
+        data._cache.clear()
+        self.write('_data/site.json', json.dumps({'title': 'Shop'}))
+        self.write('_data/products.csv', 'name,price\nPen,2\nInk,5\n')
+        self.write('_data/shop/orders.jsonl', '{"id": 1}\n\n{"id": 2}\n')
+        self.write('_data/sizes.json', '[1, 2.5, {"name": "big"}]')
+        self.context = DataContext(self.directory)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def write(self, relative_path, text):
+        path = os.path.join(self.directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def touch(self, relative_path, text):
+        path = self.write(relative_path, text)
+        mtime = time.time() + 10
+        os.utime(path, (mtime, mtime))
+
+
+class DataContextTestCase(DataTestCase):
+
+    def test_files_are_loaded_by_name(self):
+        self.assertEqual(self.context.site, {'title': 'Shop'})
+        self.assertEqual(self.context['products'], [{'name': 'Pen', 'price': '2'}, {'name': 'Ink', 'price': '5'}])
+
+    def test_directories_are_namespaces(self):
+        self.assertEqual(self.context.shop.orders, [{'id': 1}, {'id': 2}])
+
+    def test_missing_names(self):
+        with self.assertRaises(AttributeError):
+            self.context.missing
+        with self.assertRaises(KeyError):
+            self.context['missing']
+
+    def test_names_can_be_listed(self):
+        self.assertEqual(list(self.context), ['products', 'shop', 'site', 'sizes'])
+
+    def test_files_are_parsed_once(self):
+        self.context.site
+        with patch('jen.data.parse') as parse:
+            self.assertEqual(DataContext(self.directory).site, {'title': 'Shop'})
+        parse.assert_not_called()
+
+    def test_changed_files_are_parsed_again(self):
+        self.context.site
+        self.touch('_data/site.json', json.dumps({'title': 'New'}))
+        self.assertEqual(self.context.site, {'title': 'New'})
+
+    def test_streams_are_not_materialized_or_cached(self):
+        rows = self.context.stream('products')
+        self.assertIsInstance(rows, types.GeneratorType)
+        self.assertEqual(next(rows), {'name': 'Pen', 'price': '2'})
+        self.assertEqual(data._cache, {})
+
+    def test_nested_streams(self):
+        self.assertEqual(list(self.context.shop.stream('orders')), [{'id': 1}, {'id': 2}])
+
+    def test_yaml_files_need_pyyaml(self):
+        self.write('_data/menu.yml', '- home\n- about\n')
+        with patch.dict('sys.modules', {'yaml': None}):
+            with self.assertRaises(ImportError):
+                self.context.menu
+
+    def test_preload_parses_every_file(self):
+        self.context.preload()
+        self.assertEqual(len(data._cache), 4)
+
+    def test_preload_skips_large_files(self):
+        self.context.preload_max_size = 20
+        self.context.preload()
+        self.assertEqual(list(data._cache), [os.path.join(self.directory, '_data', 'site.json')])
+
+
+class StreamJsonTestCase(DataTestCase):
+
+    def test_array_items_are_read_in_chunks(self):
+        path = os.path.join(self.directory, '_data/sizes.json')
+        for chunk_size in [1, 2, 3, 1024]:
+            self.assertEqual(list(stream_json(path, chunk_size)), [1, 2.5, {'name': 'big'}])
+
+    def test_other_documents_are_iterated(self):
+        path = os.path.join(self.directory, '_data/site.json')
+        self.assertEqual(list(stream_json(path, 1)), ['title'])
+
+    def test_truncated_array_is_an_error(self):
+        path = self.write('_data/broken.json', '[1, 2')
+        with self.assertRaises(ValueError):
+            list(stream_json(path, 1))
+
+
+class DataTemplateTestCase(DataTestCase):
+
+    def setUp(self):
+        super(DataTemplateTestCase, self).setUp()
+        self.renderer = TemplateRenderer(self.directory)
+
+    def test_data_is_a_template_global(self):
+        self.write('page.html', '{{ data.site.title }}:{% for p in data.stream("products") %}{{ p.name }}{% endfor %}')
+        self.assertEqual(self.renderer.render('page.html'), 'Shop:PenInk')
+
+    def test_data_lookups_are_dependencies(self):
+        self.write('page.html', '{{ data.shop["orders"][0].id }}')
+        dependencies = self.renderer.template_dependencies('page.html')
+        self.assertIn('_data/shop.json', dependencies)
+        self.assertIn('_data/shop/orders.jsonl', dependencies)
+        self.assertNotIn(None, dependencies)
+
+    def test_streams_are_dependencies(self):
+        self.write('page.html', '{% for p in data.stream("products") %}{% endfor %}')
+        self.assertIn('_data/products.csv', self.renderer.template_dependencies('page.html'))
+
+    def test_dynamic_data_lookups_are_dynamic_dependencies(self):
+        for source in ['{{ data[name] }}', '{% set d = data %}', '{{ data.stream(name) }}']:
+            self.write('page.html', source)
+            self.renderer.invalidate()
+            self.assertIn(None, self.renderer.template_dependencies('page.html'), source)
+
+    def test_fingerprint_covers_data_files(self):
+        self.write('page.html', '{{ data.site.title }}')
+        fingerprint = self.renderer.fingerprint('page.html')
+        self.touch('_data/site.json', '{}')
+        self.assertNotEqual(self.renderer.fingerprint('page.html'), fingerprint)
+
+
+class DataSiteTestCase(DataTestCase):
+
+    target = '/tmp/jen-tests-data-dist'
+
+    def setUp(self):
+        super(DataSiteTestCase, self).setUp()
+        self.write('index.html', '{{ data.site.title }}')
+        self.write('other.html', 'Other')
+
+    def tearDown(self):
+        super(DataSiteTestCase, self).tearDown()
+        if os.path.exists(self.target):
+            rmtree(self.target)
+
+    def build(self, **options):
+        with OutputBuffer() as bf:
+            Build().run(self.directory, self.target, **options)
+        return bf
+
+    def get(self, app, path):
+        start_response = Mock()
+        body = b''.join(app({'PATH_INFO': path}, start_response))
+        return start_response.call_args[0][0], body
+
+    def test_data_directory_is_not_built(self):
+        self.build()
+        self.assertFalse(os.path.exists(os.path.join(self.target, '_data')))
+        with open(os.path.join(self.target, 'index.html'), 'r') as f:
+            self.assertEqual(f.read(), 'Shop')
+
+    def test_changed_data_rebuilds_pages_that_use_it(self):
+        self.build(incremental=True)
+        self.touch('_data/site.json', json.dumps({'title': 'New'}))
+        bf = self.build(incremental=True)
+        self.assertEqual(bf.out.split(), ['OK:', 'index.html'])
+
+    def test_data_directory_is_not_served(self):
+        status, _ = self.get(App(self.directory), '/_data/site.json')
+        self.assertEqual(status, '404 Not Found')
+
+    def test_cached_pages_are_rendered_again_when_data_changes(self):
+        app = App(self.directory)
+        self.get(app, '/')
+        self.touch('_data/site.json', json.dumps({'title': 'New'}))
+        _, body = self.get(app, '/')
+        self.assertEqual(body, b'New')
+
+    def test_warm_preloads_data(self):
+        App(self.directory).warm()
+        self.assertIn(os.path.join(self.directory, '_data', 'site.json'), data._cache)
@@ -0,0 +1,100 @@
+from shutil import copytree, rmtree
+from unittest import TestCase
+from unittest.mock import Mock
+import json
+import os
+import time
+
+from jen.live_reload import LiveReload
+from jen.run import App
+
+
+class LiveReloadTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-source'
+
+    def setUp(self):
+        copytree('tests/site_example', self.directory)
+        self.app = App(self.directory, live_reload=True)
+        self.app.live_reload.thread = Mock()
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def get(self, path):
+        return b''.join(self.app({'PATH_INFO': path}, Mock()))
+
+    def write(self, relative_path, text):
+        path = os.path.join(self.directory, relative_path)
+        with open(path, 'w') as f:
+            f.write(text)
+        mtime = time.time() + 10
+        os.utime(path, (mtime, mtime))
+
+    def test_script_is_injected_into_pages(self):
+        self.assertEqual(self.get('/simple'), b'<body><h1>Simple</h1>' + LiveReload.script + b'</body>')
+
+    def test_script_is_not_injected_without_live_reload(self):
+        app = App(self.directory)
+        self.assertEqual(b''.join(app({'PATH_INFO': '/simple'}, Mock())), b'<body><h1>Simple</h1></body>')
+
+    def test_changed_page_invalidates_only_itself(self):
+        self.get('/simple')
+        self.get('/')
+        pages, assets = self.app.invalidate(set(['simple.html']))
+        self.assertEqual(pages, set(['/simple']))
+        self.assertEqual(assets, set())
+        self.assertEqual(list(self.app.page_cache.entries), ['index.html'])
+
+    def test_changed_layout_invalidates_its_dependents(self):
+        self.get('/simple')
+        self.get('/')
+        pages, _ = self.app.invalidate(set(['_base.html']))
+        self.assertEqual(pages, set(['/simple', '/', '/index']))
+        self.assertEqual(self.app.page_cache.entries, {})
+
+    def test_changed_static_file_is_reported_as_asset(self):
+        pages, assets = self.app.invalidate(set(['theme.css']))
+        self.assertEqual(pages, set())
+        self.assertEqual(assets, set(['/theme.css']))
+
+    def test_lost_events_flush_everything(self):
+        self.get('/simple')
+        pages, assets = self.app.invalidate(set([None]))
+        self.assertIn('/simple', pages)
+        self.assertEqual(assets, set(['*']))
+        self.assertEqual(self.app.page_cache.entries, {})
+
+    def test_changes_are_published_as_events(self):
+        live_reload = self.app.live_reload
+        live_reload.publish(set(['/simple']), set())
+        live_reload.publish(set(['/']), set(['/theme.css']))
+        version, message = live_reload.next_event(0)
+        self.assertEqual(version, 2)
+        self.assertTrue(message.startswith(b'data: '))
+        self.assertEqual(json.loads(message[6:].decode('utf-8')), {
+            'pages': ['/', '/simple'],
+            'assets': ['/theme.css'],
+        })
+
+    def test_heartbeat_is_sent_without_changes(self):
+        self.app.live_reload.heartbeat = 0.01
+        self.assertEqual(self.app.live_reload.next_event(0), (0, b': ping\n\n'))
+
+    def test_events_endpoint_streams_server_sent_events(self):
+        start_response = Mock()
+        events = self.app({'PATH_INFO': LiveReload.path}, start_response)
+        self.assertEqual(start_response.call_args[0][0], '200 OK')
+        self.assertIn(('Content-Type', 'text/event-stream'), start_response.call_args[0][1])
+        self.assertEqual(next(events), b'retry: 1000\n\n')
+        self.app.live_reload.publish(set(['/simple']), set())
+        self.assertEqual(next(events), b'data: {"pages": ["/simple"], "assets": []}\n\n')
+
+    def test_watcher_thread_publishes_changes(self):
+        self.app.live_reload.thread = None
+        self.app.live_reload.start()
+        time.sleep(0.2)
+        self.write('simple.html', 'Changed')
+        version, pages, _ = self.app.live_reload.wait(0, 5)
+        self.assertEqual(version, 1)
+        self.assertEqual(pages, set(['/simple']))
@@ -1,9 +1,26 @@
-from jen.main import run
+from benchmarks.main import import_times
+from jen.build import Build
+from jen.main import app, run
+from jen.run import Run
 
 from .test_cli import CliTestCase
 from .output_buffer import OutputBuffer
 
 
+OPTIONAL_BUILD_MODULES = [
+    'jen.assets',
+    'jen.compression',
+    'jen.minify',
+    'jen.output_writer',
+    'jen.profiler',
+    'jen.static_files',
+    'jen.watcher',
+    'ctypes',
+    'gzip',
+    'yaml',
+]
+
+
 class MainTestCase(CliTestCase):
 
     def test_main_app_has_all_commands(self):
@@ -11,3 +28,28 @@ class MainTestCase(CliTestCase):
             run()
         self.assertIn('jen run', bf.out)
         self.assertIn('jen build', bf.out)
+
+    def test_lazy_commands_match_their_classes(self):
+        for command_class in [Run, Build]:
+            command = app._find_target_command(command_class.name)
+            self.assertIsInstance(command.load(), command_class)
+            self.assertEqual(command.usage, command_class.usage)
+            self.assertEqual(command.description, command_class.description)
+
+
+class StartupTestCase(CliTestCase):
+
+    def test_help_does_not_import_commands_or_their_dependencies(self):
+        imported = import_times('import jen.main; jen.main.app.run([])')
+        for module in ['jen.run', 'jen.build', 'gunicorn', 'jinja2']:
+            self.assertNotIn(module, imported)
+
+    def test_build_does_not_import_the_server_stack(self):
+        imported = import_times('import jen.build')
+        for module in ['jen.run', 'gunicorn', 'multiprocessing', 'cProfile']:
+            self.assertNotIn(module, imported)
+
+    def test_build_imports_optional_features_on_use(self):
+        imported = import_times('import jen.build')
+        for module in OPTIONAL_BUILD_MODULES:
+            self.assertNotIn(module, imported)
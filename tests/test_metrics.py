@@ -0,0 +1,102 @@
+from shutil import rmtree
+from unittest import TestCase
+from unittest.mock import patch
+import json
+import os
+import tempfile
+import time
+
+from jen.metrics import Metrics, merge
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_observations_are_counted_in_first_matching_bucket(self):
+        self.metrics.observe('try_static', 0.003)
+        histogram = self.metrics.snapshot()['histograms']['try_static']
+        self.assertEqual(histogram['count'], 1)
+        self.assertEqual(histogram['buckets'][3], 1)
+        self.assertEqual(sum(histogram['buckets']), 1)
+
+    def test_observations_above_last_bucket_only_count_in_total(self):
+        self.metrics.observe('try_template', 60)
+        histogram = self.metrics.snapshot()['histograms']['try_template']
+        self.assertEqual(sum(histogram['buckets']), 0)
+        self.assertEqual(histogram['count'], 1)
+
+    def test_collectors_add_counters_to_snapshot(self):
+        self.metrics.collectors.append(lambda: {'page_cache_hits': 7})
+        self.assertEqual(self.metrics.snapshot()['counters']['page_cache_hits'], 7)
+
+    def test_render_uses_prometheus_text_format(self):
+        self.metrics.observe('try_static', 0.003)
+        self.metrics.increment('bytes_served', 10)
+        text = self.metrics.render()
+        self.assertIn('# TYPE jen_request_duration_seconds histogram', text)
+        self.assertIn('jen_request_duration_seconds_bucket{branch="try_static",le="0.0025"} 0', text)
+        self.assertIn('jen_request_duration_seconds_bucket{branch="try_static",le="0.005"} 1', text)
+        self.assertIn('jen_request_duration_seconds_bucket{branch="try_static",le="+Inf"} 1', text)
+        self.assertIn('jen_request_duration_seconds_count{branch="try_static"} 1', text)
+        self.assertIn('jen_bytes_served_total 10', text)
+
+    def test_merge_adds_counters_and_histograms(self):
+        first = Metrics()
+        first.observe('try_static', 0.003)
+        first.increment('requests')
+        second = Metrics()
+        second.observe('try_static', 0.003)
+        second.increment('requests', 2)
+        merged = merge([first.snapshot(), second.snapshot()])
+        self.assertEqual(merged['counters']['requests'], 3)
+        self.assertEqual(merged['histograms']['try_static']['count'], 2)
+
+
+class SharedMetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.metrics = Metrics(self.directory)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def read_snapshot(self):
+        with open(os.path.join(self.directory, '{}.json'.format(os.getpid())), 'r') as f:
+            return json.load(f)
+
+    def test_collect_merges_snapshots_of_all_workers(self):
+        other = Metrics()
+        other.increment('requests', 5)
+        with open(os.path.join(self.directory, '99999.json'), 'w') as f:
+            json.dump(other.snapshot(), f)
+        self.metrics.increment('requests', 2)
+        self.assertEqual(self.metrics.collect()['counters']['requests'], 7)
+
+    def test_observe_flushes_snapshot_to_directory(self):
+        self.metrics.observe('try_static', 0.001)
+        with open(os.path.join(self.directory, '{}.json'.format(os.getpid())), 'r') as f:
+            self.assertEqual(json.load(f)['histograms']['try_static']['count'], 1)
+
+    def test_dirty_snapshot_is_flushed_without_new_requests(self):
+        self.metrics.flush_interval = 0.01
+        self.metrics.observe('try_static', 0.001)
+        self.metrics.increment('bytes_served', 10)
+        deadline = time.monotonic() + 5
+        while self.read_snapshot()['counters']['bytes_served'] != 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.read_snapshot()['counters']['bytes_served'], 10)
+
+    def test_snapshot_is_flushed_at_exit(self):
+        with patch('jen.metrics.atexit.register') as register, patch('jen.metrics.Thread'):
+            self.metrics.observe('try_static', 0.001)
+        self.metrics.increment('requests')
+        register.call_args[0][0]()
+        self.assertEqual(self.read_snapshot()['counters']['requests'], 1)
+
+    def test_unreadable_snapshots_are_ignored(self):
+        with open(os.path.join(self.directory, '99999.json'), 'w') as f:
+            f.write('{')
+        self.assertEqual(self.metrics.collect()['counters']['requests'], 0)
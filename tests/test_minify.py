@@ -0,0 +1,202 @@
+from shutil import rmtree
+from unittest import TestCase
+from unittest.mock import patch
+import json
+import os
+
+from jen.assets import AssetManifest
+from jen.build import Build
+from jen.manifest import Manifest
+from jen.minify import Minifier, minify_css, minify_html, minify_js
+from .output_buffer import OutputBuffer
+
+
+class MinifyHtmlTestCase(TestCase):
+
+    def test_whitespace_between_tags_is_collapsed(self):
+        self.assertEqual(minify_html('<ul>\n    <li>a</li>\n    <li>b</li>\n</ul>\n'), '<ul>\n<li>a</li>\n<li>b</li>\n</ul>')
+
+    def test_whitespace_in_text_is_collapsed_to_one_space(self):
+        self.assertEqual(minify_html('<p>Hello   <b>world</b> \t!</p>'), '<p>Hello <b>world</b> !</p>')
+
+    def test_comments_are_removed(self):
+        self.assertEqual(minify_html('<p>a</p>\n  <!-- note -->\n  <p>b</p>'), '<p>a</p>\n<p>b</p>')
+
+    def test_conditional_comments_are_kept(self):
+        html = '<!--[if IE]><p>old</p><![endif]-->'
+        self.assertEqual(minify_html(html), html)
+
+    def test_preformatted_elements_are_kept(self):
+        html = '<pre>\n  a   b\n</pre><textarea>  x\n\n  y </textarea>'
+        self.assertEqual(minify_html(html), html)
+
+    def test_inline_scripts_are_kept(self):
+        html = '<script>\n    var a  =  "  b  ";  // c\n</script>'
+        self.assertEqual(minify_html(html), html)
+
+    def test_inline_styles_are_minified(self):
+        self.assertEqual(minify_html('<style>\n  a { color: red; }\n</style>'), '<style>a{color:red}</style>')
+
+    def test_attributes_are_kept(self):
+        html = '<p title="a  >  b" data-x=\'  c  \'>text</p>'
+        self.assertEqual(minify_html(html), html)
+
+    def test_less_than_sign_in_text(self):
+        self.assertEqual(minify_html('<p>a <  b</p>'), '<p>a < b</p>')
+
+
+class MinifyCssTestCase(TestCase):
+
+    def test_whitespace_and_comments_are_removed(self):
+        css = '/* header */\na , b > i {\n    color : red;\n    margin: 0 auto;\n}\n'
+        self.assertEqual(minify_css(css), 'a,b>i{color :red;margin:0 auto}')
+
+    def test_strings_are_kept(self):
+        self.assertEqual(minify_css('a { content: " ; } /* x */ "; }'), 'a{content:" ; } /* x */ "}')
+
+    def test_significant_spaces_are_kept(self):
+        css = '@media screen and (min-width: 10px) { a :hover { width: calc(1px + 2px) !important; } }'
+        self.assertEqual(minify_css(css), '@media screen and (min-width:10px){a :hover{width:calc(1px + 2px) !important}}')
+
+    def test_license_comments_are_kept(self):
+        self.assertEqual(minify_css('/*! MIT */\na { }'), '/*! MIT */a{}')
+
+
+class MinifyJsTestCase(TestCase):
+
+    def test_comments_and_indentation_are_removed(self):
+        js = '// helper\nfunction f(a, b) {\n    /* sum */\n    return a + b;  \n}\n'
+        self.assertEqual(minify_js(js), 'function f(a,b){\nreturn a + b;\n}')
+
+    def test_line_breaks_are_kept(self):
+        self.assertEqual(minify_js('a = 1\nb = 2\n\n\nc()'), 'a=1\nb=2\nc()')
+
+    def test_strings_templates_and_regular_expressions_are_kept(self):
+        js = 'var s = "a  // b", t = `x  ${ y + `z  ${w}` }  /* v */`, r = /[/]"\'  /g;'
+        self.assertEqual(minify_js(js), 'var s="a  // b",t=`x  ${ y + `z  ${w}` }  /* v */`,r=/[/]"\'  /g;')
+
+    def test_spaces_between_operators_are_kept(self):
+        self.assertEqual(minify_js('a - -b + ++c'), 'a - -b + ++c')
+
+    def test_regular_expression_after_statement_head_is_kept(self):
+        self.assertEqual(minify_js('if (ok) /a  b/.test(s)'), 'if(ok)/a  b/.test(s)')
+        self.assertEqual(minify_js('x = f(a) / 2'), 'x=f(a)/ 2')
+
+    def test_unparsable_input_is_left_unchanged(self):
+        js = 'var s = "unterminated\n  x'
+        self.assertEqual(minify_js(js), js)
+
+
+class MinifierTestCase(TestCase):
+
+    cache_directory = '/tmp/jen-tests-minify-cache'
+
+    def tearDown(self):
+        if os.path.exists(self.cache_directory):
+            rmtree(self.cache_directory)
+
+    def test_minifies_bytes(self):
+        self.assertEqual(Minifier().minify('css', b'a {  }'), b'a{}')
+
+    def test_binary_data_is_left_unchanged(self):
+        self.assertEqual(Minifier().minify('css', b'\xff  a'), b'\xff  a')
+
+    def test_results_are_cached_by_content_hash(self):
+        minifier = Minifier(self.cache_directory)
+        minifier.minify('css', b'a {  }')
+        with open(minifier.cache_path('css', b'a {  }'), 'wb') as f:
+            f.write(b'cached')
+        self.assertEqual(minifier.minify('css', b'a {  }'), b'cached')
+        self.assertEqual(minifier.minify('css', b'b {  }'), b'b{}')
+
+
+class MinifyBuildTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-minify'
+    target = '/tmp/jen-tests-minify-dist'
+
+    def setUp(self):
+        self.write('index.html', '<html>\n    <body>\n        <p>Hello</p>\n    </body>\n</html>\n')
+        self.write('css/site.css', 'a {\n    color: red;\n}\n')
+        self.write('app.js', '// app\nrun();\n')
+        self.write('notes.txt', 'keep   this\n')
+
+    def tearDown(self):
+        rmtree(self.directory)
+        if os.path.exists(self.target):
+            rmtree(self.target)
+
+    def write(self, relative_path, text):
+        path = os.path.join(self.directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def read(self, relative_path, directory=None):
+        with open(os.path.join(directory or self.target, relative_path), 'r') as f:
+            return f.read()
+
+    def build(self, **options):
+        with OutputBuffer() as bf:
+            Build().run(self.directory, self.target, **options)
+        return bf
+
+    def test_build_minifies_pages_and_assets(self):
+        self.build(minify=True)
+        self.assertEqual(self.read('index.html'), '<html>\n<body>\n<p>Hello</p>\n</body>\n</html>')
+        self.assertEqual(self.read('css/site.css'), 'a{color:red}')
+        self.assertEqual(self.read('app.js'), 'run();')
+        self.assertEqual(self.read('notes.txt'), 'keep   this\n')
+
+    def test_build_reports_bytes_saved_per_type(self):
+        bf = self.build(minify=True)
+        self.assertIn('MINIFIED: css: 1 files, 10 B saved (45.5%)', bf.out)
+        self.assertIn('MINIFIED: js: 1 files, 8 B saved (57.1%)', bf.out)
+        self.assertIn('MINIFIED: html:', bf.out)
+
+    def test_build_without_minify_keeps_outputs(self):
+        bf = self.build()
+        self.assertEqual(self.read('css/site.css'), 'a {\n    color: red;\n}\n')
+        self.assertNotIn('MINIFIED', bf.out)
+
+    def test_parallel_build_minifies_in_workers(self):
+        self.build(minify=True, jobs=2)
+        self.assertEqual(self.read('index.html'), '<html>\n<body>\n<p>Hello</p>\n</body>\n</html>')
+        self.assertEqual(self.read('css/site.css'), 'a{color:red}')
+
+    def test_hardlinked_sources_are_never_minified_in_place(self):
+        self.build(incremental=True, static_mode='hardlink')
+        self.build(incremental=True, static_mode='hardlink', minify=True)
+        self.assertEqual(self.read('css/site.css'), 'a{color:red}')
+        self.assertEqual(self.read('css/site.css', self.directory), 'a {\n    color: red;\n}\n')
+        self.assertEqual(os.stat(os.path.join(self.directory, 'notes.txt')).st_nlink, 2)
+
+    def test_incremental_build_rebuilds_outputs_when_minify_is_toggled(self):
+        self.build(incremental=True)
+        bf = self.build(incremental=True, minify=True)
+        self.assertIn('OK: index.html', bf.out)
+        self.assertNotIn('OK: notes.txt', bf.out)
+        self.assertEqual(self.read('app.js'), 'run();')
+        bf = self.build(incremental=True, minify=True)
+        self.assertNotIn('OK:', bf.out)
+        self.build(incremental=True)
+        self.assertEqual(self.read('app.js'), '// app\nrun();\n')
+        self.assertNotIn('minified', Manifest.load(self.target).files['app.js'])
+
+    def test_fingerprints_follow_the_minified_content(self):
+        self.build(fingerprint=True)
+        plain = AssetManifest.load(self.target).files['css/site.css']['path']
+        self.build(fingerprint=True, minify=True, replace=True)
+        minified = AssetManifest.load(self.target).files['css/site.css']['path']
+        self.assertNotEqual(minified, plain)
+        self.assertEqual(self.read(minified), 'a{color:red}')
+        with patch('jen.minify.Minifier.version', 'next'):
+            self.build(fingerprint=True, minify=True, replace=True)
+        self.assertNotEqual(AssetManifest.load(self.target).files['css/site.css']['path'], minified)
+
+    def test_collection_pages_are_minified(self):
+        self.write('_data/items.json', json.dumps([{'id': 1}]))
+        self.write('_item.html', '<p>\n    {{ record.id }}\n</p>\n')
+        self.write('_collections.json', json.dumps({'items': {'data': 'items', 'template': '_item.html', 'path': '{id}'}}))
+        self.build(minify=True)
+        self.assertEqual(self.read('1.html'), '<p>\n1\n</p>')
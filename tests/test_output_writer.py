@@ -0,0 +1,91 @@
+from shutil import rmtree
+from threading import Event
+from unittest import TestCase
+from unittest.mock import patch
+import os
+
+from jen.output_writer import OutputWriter, create_directories, staging_directory, swap_directories
+
+
+class OutputWriterTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-output'
+
+    def setUp(self):
+        os.makedirs(self.directory)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def read(self, relative_path):
+        with open(os.path.join(self.directory, relative_path), 'rb') as f:
+            return f.read()
+
+    def test_files_are_written_by_the_pool(self):
+        with OutputWriter(threads=2) as writer:
+            for number in range(10):
+                writer.write(os.path.join(self.directory, '{}.html'.format(number)), b'page')
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted('{}.html'.format(n) for n in range(10)))
+        self.assertEqual(self.read('3.html'), b'page')
+
+    def test_pending_writes_are_bounded(self):
+        release = Event()
+        writer = OutputWriter(threads=1, max_pending=2)
+        writer.submit(release.wait)
+        writer.submit(release.wait)
+        self.assertFalse(writer.slots.acquire(blocking=False))
+        release.set()
+        writer.close()
+        self.assertTrue(writer.slots.acquire(blocking=False))
+
+    def test_errors_are_raised_on_close(self):
+        writer = OutputWriter()
+        writer.write(os.path.join(self.directory, 'missing', 'index.html'), b'page')
+        with self.assertRaises(FileNotFoundError):
+            writer.close()
+
+    def test_directories_are_created_once(self):
+        with patch('jen.output_writer.os.makedirs') as makedirs:
+            create_directories(self.directory, ['a/b/1.html', 'a/b/2.html', 'a/3.html', '4.html'])
+        self.assertEqual([call[0][0] for call in makedirs.call_args_list], [
+            self.directory + '/',
+            self.directory + '/a',
+            self.directory + '/a/b',
+        ])
+
+    def test_staging_directory_is_a_hidden_sibling(self):
+        staging = staging_directory('/srv/site/dist')
+        self.assertEqual(os.path.dirname(staging), '/srv/site')
+        self.assertTrue(os.path.basename(staging).startswith('.dist.jen-staging-'))
+
+
+class SwapDirectoriesTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-output'
+
+    def setUp(self):
+        os.makedirs(self.directory + '/staging')
+        os.makedirs(self.directory + '/target')
+        with open(self.directory + '/staging/new.html', 'w') as f:
+            f.write('new')
+        with open(self.directory + '/target/old.html', 'w') as f:
+            f.write('old')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def swap(self):
+        swap_directories(self.directory + '/staging', self.directory + '/target')
+        self.assertEqual(os.listdir(self.directory), ['target'])
+        self.assertEqual(os.listdir(self.directory + '/target'), ['new.html'])
+
+    def test_staging_directory_replaces_target(self):
+        self.swap()
+
+    def test_swap_falls_back_to_renames(self):
+        with patch('jen.output_writer._exchange', return_value=False):
+            self.swap()
+
+    def test_staging_directory_is_renamed_when_there_is_no_target(self):
+        rmtree(self.directory + '/target')
+        self.swap()
@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+from jen.page_cache import PageCache
+
+
+class PageCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.cache = PageCache(max_size=10)
+
+    def test_get_returns_stored_body_for_same_fingerprint(self):
+        self.cache.put('index.html', 'a', b'body')
+        self.assertEqual(self.cache.get('index.html', 'a'), b'body')
+
+    def test_get_misses_when_fingerprint_changed(self):
+        self.cache.put('index.html', 'a', b'body')
+        self.assertIsNone(self.cache.get('index.html', 'b'))
+
+    def test_counts_hits_and_misses(self):
+        self.cache.get('index.html', 'a')
+        self.cache.put('index.html', 'a', b'body')
+        self.cache.get('index.html', 'a')
+        self.cache.get('index.html', 'a')
+        self.assertEqual(self.cache.stats(), {'hits': 2, 'misses': 1, 'entries': 1, 'size': 4})
+
+    def test_least_recently_used_entries_are_evicted_past_max_size(self):
+        self.cache.put('a', 1, b'aaaa')
+        self.cache.put('b', 1, b'bbbb')
+        self.cache.get('a', 1)
+        self.cache.put('c', 1, b'cccc')
+        self.assertIsNone(self.cache.get('b', 1))
+        self.assertEqual(self.cache.get('a', 1), b'aaaa')
+        self.assertEqual(self.cache.size, 8)
+
+    def test_bodies_larger_than_max_size_are_not_stored(self):
+        self.cache.put('a', 1, b'a' * 11)
+        self.assertEqual(self.cache.size, 0)
+
+    def test_entries_without_fingerprint_are_not_stored(self):
+        self.cache.put('a', None, b'aaaa')
+        self.assertEqual(self.cache.entries, {})
+
+    def test_invalidate_removes_entry(self):
+        self.cache.put('a', 1, b'aaaa')
+        self.cache.invalidate('a')
+        self.assertIsNone(self.cache.get('a', 1))
+        self.assertEqual(self.cache.size, 0)
@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from jen.dependencies import DependencyGraph
+from jen.profiler import BuildProfile, Timer, format_size
+
+
+class BuildProfileTestCase(TestCase):
+
+    def setUp(self):
+        self.profile = BuildProfile()
+        self.profile.add({'path': 'a.html', 'kind': 'template', 'render': 0.5, 'write': 0.1, 'bytes': 10,
+            'start': 1.0, 'end': 1.6, 'pid': 1, 'tid': 1})
+        self.profile.add({'path': 'b.html', 'kind': 'template', 'render': 0.1, 'bytes': 20,
+            'start': 1.0, 'end': 1.1, 'pid': 1, 'tid': 1})
+        self.profile.add({'path': 'c.css', 'kind': 'static', 'copy': 0.2, 'bytes': 30,
+            'start': 1.0, 'end': 1.2, 'pid': 1, 'tid': 2})
+
+    def test_timer_records_phases_and_size(self):
+        timer = Timer('a.html', 'template')
+        timer.lap('render')
+        record = timer.stop(5)
+        self.assertEqual(record['path'], 'a.html')
+        self.assertEqual(record['bytes'], 5)
+        self.assertGreaterEqual(record['render'], 0)
+        self.assertEqual(record['end'], record['start'] + record['render'])
+
+    def test_slowest_outputs_are_sorted_by_total_time(self):
+        self.assertEqual([record['path'] for record in self.profile.slowest(2)], ['a.html', 'c.css'])
+
+    def test_most_included_templates_count_transitive_dependencies(self):
+        graph = DependencyGraph()
+        graph.add('a.html', ['_page.html'])
+        graph.add('b.html', ['_base.html', None])
+        graph.add('_page.html', ['_base.html'])
+        self.assertEqual(self.profile.most_included(graph, 10), [('_base.html', 2), ('_page.html', 1)])
+
+    def test_report_lists_slowest_outputs(self):
+        lines = []
+        self.profile.report(lambda *args: lines.append(' '.join(args)), DependencyGraph(), top=1)
+        self.assertTrue(lines[0].startswith('PROFILE: 3 outputs, 60 B'))
+        self.assertIn('a.html', '\n'.join(lines))
+        self.assertNotIn('b.html', '\n'.join(lines))
+
+    def test_trace_events_include_phases_and_outputs(self):
+        events = self.profile.trace_events()
+        names = [event['name'] for event in events]
+        self.assertEqual(names, ['render', 'write', 'a.html', 'render', 'b.html', 'copy', 'c.css'])
+        self.assertTrue(all(event['ph'] == 'X' for event in events))
+
+    def test_format_size(self):
+        self.assertEqual(format_size(10), '10 B')
+        self.assertEqual(format_size(2048), '2.0 KB')
+        self.assertEqual(format_size(3 * 1024 * 1024), '3.0 MB')
@@ -0,0 +1,56 @@
+from io import BytesIO
+from unittest import TestCase
+
+from jen.ranges import FileRanges, multipart_length, parse_ranges
+
+
+class ParseRangesTestCase(TestCase):
+
+    def test_single_range(self):
+        self.assertEqual(parse_ranges('bytes=0-9', 100), [(0, 9)])
+
+    def test_open_ended_range(self):
+        self.assertEqual(parse_ranges('bytes=90-', 100), [(90, 99)])
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_ranges('bytes=-10', 100), [(90, 99)])
+
+    def test_end_is_clamped_to_size(self):
+        self.assertEqual(parse_ranges('bytes=50-500', 100), [(50, 99)])
+
+    def test_overlapping_and_adjacent_ranges_are_merged(self):
+        self.assertEqual(parse_ranges('bytes=20-29, 0-9,10-14,25-40', 100), [(0, 14), (20, 40)])
+
+    def test_unsatisfiable_ranges_are_dropped(self):
+        self.assertEqual(parse_ranges('bytes=0-1,200-300', 100), [(0, 1)])
+        self.assertEqual(parse_ranges('bytes=100-', 100), [])
+
+    def test_invalid_headers_are_ignored(self):
+        for header in ['items=0-1', 'bytes=', 'bytes=a-b', 'bytes=5-1', 'bytes=-', 'bytes=5']:
+            self.assertIsNone(parse_ranges(header, 100), header)
+
+    def test_too_many_ranges_are_ignored(self):
+        header = 'bytes=' + ','.join('{}-{}'.format(i * 2, i * 2) for i in range(17))
+        self.assertIsNone(parse_ranges(header, 100))
+
+
+class FileRangesTestCase(TestCase):
+
+    def test_reads_only_requested_window(self):
+        f = BytesIO(b'0123456789')
+        chunks = list(FileRanges(f, [(2, 6)], 2))
+        self.assertEqual(chunks, [b'23', b'45', b'6'])
+
+    def test_multipart_body_has_a_part_per_range(self):
+        ranges = [(0, 1), (8, 9)]
+        body = b''.join(FileRanges(BytesIO(b'0123456789'), ranges, 4, 'text/plain', 10, 'xyz'))
+        self.assertEqual(body,
+            b'\r\n--xyz\r\nContent-Type: text/plain\r\nContent-Range: bytes 0-1/10\r\n\r\n01'
+            b'\r\n--xyz\r\nContent-Type: text/plain\r\nContent-Range: bytes 8-9/10\r\n\r\n89'
+            b'\r\n--xyz--\r\n')
+        self.assertEqual(len(body), multipart_length(ranges, 'xyz', 'text/plain', 10))
+
+    def test_close_closes_file(self):
+        f = BytesIO(b'0123456789')
+        FileRanges(f, [(0, 1)], 4).close()
+        self.assertTrue(f.closed)
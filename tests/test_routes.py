@@ -0,0 +1,71 @@
+from shutil import copytree, rmtree
+from unittest import TestCase
+import os
+
+from jen.routes import RouteIndex
+
+
+class RouteIndexTestCase(TestCase):
+
+    def setUp(self):
+        self.routes = RouteIndex('tests/site_example')
+
+    def template(self, path):
+        route = self.routes.get(path)
+        return route.template if route else None
+
+    def test_simple_path(self):
+        self.assertEqual(self.template('/simple'), 'simple.html')
+
+    def test_index_path(self):
+        self.assertEqual(self.template('/'), 'index.html')
+        self.assertEqual(self.template('/index'), 'index.html')
+
+    def test_subdirectory_paths(self):
+        self.assertEqual(self.template('/sub-without-index/simple'), 'sub-without-index/simple.html')
+        self.assertEqual(self.template('/sub-with-index'), 'sub-with-index/index.html')
+        self.assertEqual(self.template('/sub-with-index/index'), 'sub-with-index/index.html')
+
+    def test_paths_ending_on_slash_are_not_routed(self):
+        self.assertIsNone(self.routes.get('/simple/'))
+        self.assertIsNone(self.routes.get('/sub-with-index/'))
+
+    def test_templates_starting_with_underscore_are_not_routed(self):
+        self.assertIsNone(self.routes.get('/_base'))
+
+    def test_static_files_are_routed_with_metadata(self):
+        route = self.routes.get('/robots.txt')
+        stat = os.stat('tests/site_example/robots.txt')
+        self.assertIsNone(route.template)
+        self.assertEqual(route.path, 'tests/site_example/robots.txt')
+        self.assertEqual((route.size, route.mtime_ns), (stat.st_size, stat.st_mtime_ns))
+
+    def test_html_files_are_not_routed_as_static(self):
+        self.assertIsNone(self.routes.get('/simple.html'))
+
+    def test_excluded_directories_are_not_routed(self):
+        routes = RouteIndex('tests/site_example', excluded=['tests/site_example/sub-with-404'])
+        self.assertIsNone(routes.get('/sub-with-404/404'))
+
+
+class RouteIndexRefreshTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-source'
+
+    def setUp(self):
+        copytree('tests/site_example', self.directory)
+        self.routes = RouteIndex(self.directory, interval=60)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_index_is_only_scanned_once_per_interval(self):
+        self.routes.get('/')
+        open(os.path.join(self.directory, 'new.txt'), 'w').close()
+        self.assertIsNone(self.routes.get('/new.txt'))
+
+    def test_invalidated_index_is_scanned_on_next_lookup(self):
+        self.routes.get('/')
+        open(os.path.join(self.directory, 'new.txt'), 'w').close()
+        self.routes.invalidate()
+        self.assertIsNotNone(self.routes.get('/new.txt'))
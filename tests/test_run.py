@@ -1,11 +1,48 @@
+from email.utils import formatdate
+from shutil import copytree, rmtree
 from unittest import TestCase
 from unittest.mock import patch, Mock
+import gzip
+import hashlib
+import os
+import time
 
-from jen.run import Run, App
+from jinja2.exceptions import TemplateNotFound
+
+from jen.metrics import Metrics
+from jen.run import Run, App, GunicornApp
 from .test_cli import CliTestCase
 from .output_buffer import OutputBuffer
 
 
+def read_body(body):
+    try:
+        return b''.join(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+class AppRequestMixin(object):
+
+    app_options = {}
+
+    def setUp(self):
+        self.app = App('tests/site_example', **self.app_options)
+
+    def request(self, path, **headers):
+        env = {'PATH_INFO': path}
+        env.update(headers)
+        start_response = Mock()
+        body = self.app(env, start_response)
+        status, response_headers = start_response.call_args[0]
+        return status, dict(response_headers), body
+
+    def get(self, path, **headers):
+        status, response_headers, body = self.request(path, **headers)
+        return status, response_headers, read_body(body)
+
+
 class RunCommandTestCase(CliTestCase):
 
     def setUp(self):
@@ -34,18 +71,74 @@ class RunCommandTestCase(CliTestCase):
                 self.command.run('tests/site_example')
         mock.assert_called_once_with()
 
+    def test_server_options_are_mapped_to_gunicorn_settings(self):
+        server = GunicornApp('tests/site_example', {
+            'bind': ['0.0.0.0:9000'], 'workers': 4, 'threads': 8, 'worker_class': 'gthread', 'preload_app': True,
+        })
+        self.assertEqual(server.cfg.bind, ['0.0.0.0:9000'])
+        self.assertEqual(server.cfg.workers, 4)
+        self.assertEqual(server.cfg.threads, 8)
+        self.assertEqual(server.cfg.worker_class_str, 'gthread')
+        self.assertTrue(server.cfg.preload_app)
+
+    def test_command_passes_server_options_to_gunicorn_app(self):
+        with patch('jen.run.GunicornApp') as mock:
+            with OutputBuffer():
+                self.command.run('tests/site_example', workers='2', preload=True)
+        config = mock.call_args[0][1]
+        self.assertEqual(config['workers'], 2)
+        self.assertIsNone(config['threads'])
+        self.assertTrue(config['preload_app'])
+
+    def test_command_aborts_if_workers_is_invalid(self):
+        with OutputBuffer() as bf:
+            with self.assertRaises(SystemExit):
+                self.command.run('tests/site_example', workers='many')
+        self.assert_output(bf.out, 'ERROR: --workers must be a positive integer')
+
+    def test_default_server_settings_are_kept(self):
+        server = GunicornApp('tests/site_example')
+        self.assertEqual(server.cfg.workers, 1)
+        self.assertFalse(server.cfg.preload_app)
+
+    def test_preloaded_app_is_warmed_before_forking(self):
+        server = GunicornApp('tests/site_example', {'preload_app': True})
+        with patch.object(server.app, 'warm') as warm:
+            self.assertEqual(server.load(), server.app)
+        warm.assert_called_once_with()
+
+    def test_app_is_not_warmed_without_preload(self):
+        server = GunicornApp('tests/site_example')
+        with patch.object(server.app, 'warm') as warm:
+            server.load()
+        warm.assert_not_called()
+
+    def test_command_passes_cache_directory_to_app(self):
+        with patch('jen.run.App') as mock:
+            with OutputBuffer():
+                self.command.run('tests/site_example', cache_dir='/tmp/jen-cache')
+        mock.assert_called_once_with('tests/site_example', cache_directory='/tmp/jen-cache',
+            page_cache_size=64 * 1024 * 1024, compress_min_size=1024, metrics=None, stream=False,
+            live_reload=False)
+
 
 class RunAppTestCase(TestCase):
 
     def setUp(self):
         self.app = App('tests/site_example')
 
+    def assert_response_starts_with(self, start_response, status, headers):
+        start_response.assert_called_once()
+        actual_status, actual_headers = start_response.call_args[0]
+        self.assertEqual(actual_status, status)
+        self.assertEqual(actual_headers[:len(headers)], headers)
+
     def test_get_simple_page(self):
         env = {'PATH_INFO': '/simple'}
         start_response = Mock()
         body = self.app(env, start_response)
-        self.assertEqual(b''.join(body), b'<body><h1>Simple</h1></body>')
-        start_response.assert_called_once_with('200 OK', [
+        self.assertEqual(read_body(body), b'<body><h1>Simple</h1></body>')
+        self.assert_response_starts_with(start_response, '200 OK', [
             ('Content-Type', 'text/html'),
             ('Content-Length', '28'),
         ])
@@ -54,8 +147,8 @@ class RunAppTestCase(TestCase):
         env = {'PATH_INFO': '/'}
         start_response = Mock()
         body = self.app(env, start_response)
-        self.assertEqual(b''.join(body), b'<body><h1>Index</h1></body>')
-        start_response.assert_called_once_with('200 OK', [
+        self.assertEqual(read_body(body), b'<body><h1>Index</h1></body>')
+        self.assert_response_starts_with(start_response, '200 OK', [
             ('Content-Type', 'text/html'),
             ('Content-Length', '27'),
         ])
@@ -64,7 +157,7 @@ class RunAppTestCase(TestCase):
         env = {'PATH_INFO': '/missing'}
         start_response = Mock()
         body = self.app(env, start_response)
-        self.assertEqual(b''.join(body), b'')
+        self.assertEqual(read_body(body), b'')
         start_response.assert_called_once_with('404 Not Found', [
             ('Content-Type', 'text/html'),
             ('Content-Length', '0'),
@@ -74,8 +167,8 @@ class RunAppTestCase(TestCase):
         env = {'PATH_INFO': '/robots.txt'}
         start_response = Mock()
         body = self.app(env, start_response)
-        self.assertEqual(b''.join(body), b'User-agent: *\nDisallow: /\n')
-        start_response.assert_called_once_with('200 OK', [
+        self.assertEqual(read_body(body), b'User-agent: *\nDisallow: /\n')
+        self.assert_response_starts_with(start_response, '200 OK', [
             ('Content-Type', 'text/plain'),
             ('Content-Length', '26'),
         ])
@@ -84,18 +177,36 @@ class RunAppTestCase(TestCase):
         env = {'PATH_INFO': '/theme.css'}
         start_response = Mock()
         body = self.app(env, start_response)
-        self.assertEqual(b''.join(body), b'body { background-color: black; }\n')
-        start_response.assert_called_once_with('200 OK', [
+        self.assertEqual(read_body(body), b'body { background-color: black; }\n')
+        self.assert_response_starts_with(start_response, '200 OK', [
             ('Content-Type', 'text/css'),
             ('Content-Length', '34'),
         ])
 
+    def test_static_content_is_streamed_in_chunks(self):
+        env = {'PATH_INFO': '/robots.txt'}
+        self.app.chunk_size = 10
+        body = self.app(env, Mock())
+        self.assertEqual(list(body), [b'User-agent', b': *\nDisall', b'ow: /\n'])
+        body.close()
+        self.assertTrue(body.f.closed)
+
+    def test_static_content_uses_server_file_wrapper(self):
+        file_wrapper = Mock()
+        env = {'PATH_INFO': '/robots.txt', 'wsgi.file_wrapper': file_wrapper}
+        body = self.app(env, Mock())
+        self.assertEqual(body, file_wrapper.return_value)
+        f, chunk_size = file_wrapper.call_args[0]
+        self.assertEqual(f.name, 'tests/site_example/robots.txt')
+        self.assertEqual(chunk_size, self.app.chunk_size)
+        f.close()
+
     def test_static_content_try_does_not_fail_when_target_is_directory(self):
         app = App('tests/site_example/sub-without-index')
         env = {'PATH_INFO': '/'}
         start_response = Mock()
         body = app(env, start_response)
-        self.assertEqual(b''.join(body), b'')
+        self.assertEqual(read_body(body), b'')
         start_response.assert_called_once_with('404 Not Found', [
             ('Content-Type', 'text/html'),
             ('Content-Length', '0'),
@@ -106,7 +217,7 @@ class RunAppTestCase(TestCase):
         env = {'PATH_INFO': '/missing'}
         start_response = Mock()
         body = app(env, start_response)
-        self.assertEqual(b''.join(body), b'<body><h1>404 Not Found</h1></body>')
+        self.assertEqual(read_body(body), b'<body><h1>404 Not Found</h1></body>')
         start_response.assert_called_once_with('404 Not Found', [
             ('Content-Type', 'text/html'),
             ('Content-Length', '35'),
@@ -117,7 +228,7 @@ class RunAppTestCase(TestCase):
         env = {'PATH_INFO': '/missing.txt'}
         start_response = Mock()
         body = app(env, start_response)
-        self.assertEqual(b''.join(body), b'')
+        self.assertEqual(read_body(body), b'')
         start_response.assert_called_once_with('404 Not Found', [
             ('Content-Type', 'text/html'),
             ('Content-Length', '0'),
@@ -128,7 +239,7 @@ class RunAppTestCase(TestCase):
         env = {'PATH_INFO': '/simple/'}
         start_response = Mock()
         body = app(env, start_response)
-        self.assertEqual(b''.join(body), b'')
+        self.assertEqual(read_body(body), b'')
         start_response.assert_called_once_with('404 Not Found', [
             ('Content-Type', 'text/html'),
             ('Content-Length', '0'),
@@ -139,8 +250,378 @@ class RunAppTestCase(TestCase):
         env = {'PATH_INFO': '/robots.txt/'}
         start_response = Mock()
         body = app(env, start_response)
-        self.assertEqual(b''.join(body), b'')
+        self.assertEqual(read_body(body), b'')
         start_response.assert_called_once_with('404 Not Found', [
             ('Content-Type', 'text/html'),
             ('Content-Length', '0'),
         ])
+
+
+class RunAppConditionalRequestTestCase(AppRequestMixin, TestCase):
+
+    def test_static_content_has_validators(self):
+        _, headers, _ = self.get('/robots.txt')
+        stat = os.stat('tests/site_example/robots.txt')
+        self.assertEqual(headers['ETag'], '"{:x}-{:x}"'.format(stat.st_size, stat.st_mtime_ns))
+        self.assertEqual(headers['Last-Modified'], formatdate(stat.st_mtime, usegmt=True))
+
+    def test_page_etag_is_content_hash(self):
+        _, headers, body = self.get('/simple')
+        self.assertEqual(headers['ETag'], '"{}"'.format(hashlib.sha1(body).hexdigest()))
+
+    def test_page_last_modified_is_latest_dependency_change(self):
+        _, headers, _ = self.get('/simple')
+        mtime = max(os.stat('tests/site_example/' + name).st_mtime for name in ['simple.html', '_base.html'])
+        self.assertEqual(headers['Last-Modified'], formatdate(int(mtime), usegmt=True))
+
+    def test_static_content_not_modified_with_matching_etag(self):
+        _, headers, _ = self.get('/robots.txt')
+        with patch('jen.run.open') as mock:
+            status, _, body = self.get('/robots.txt', HTTP_IF_NONE_MATCH=headers['ETag'])
+        mock.assert_not_called()
+        self.assertEqual(status, '304 Not Modified')
+        self.assertEqual(body, b'')
+
+    def test_static_content_not_modified_since_last_modified(self):
+        _, headers, _ = self.get('/robots.txt')
+        status, _, _ = self.get('/robots.txt', HTTP_IF_MODIFIED_SINCE=headers['Last-Modified'])
+        self.assertEqual(status, '304 Not Modified')
+
+    def test_static_content_modified_since_older_date(self):
+        status, _, _ = self.get('/robots.txt', HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 1990 00:00:00 GMT')
+        self.assertEqual(status, '200 OK')
+
+    def test_etag_takes_precedence_over_modified_since(self):
+        _, headers, _ = self.get('/robots.txt')
+        status, _, _ = self.get('/robots.txt', HTTP_IF_NONE_MATCH='"other"',
+            HTTP_IF_MODIFIED_SINCE=headers['Last-Modified'])
+        self.assertEqual(status, '200 OK')
+
+    def test_page_not_modified_with_matching_etag_is_not_rendered_again(self):
+        _, headers, _ = self.get('/simple')
+        with patch.object(self.app.template_renderer, 'render') as render:
+            status, response_headers, body = self.get('/simple', HTTP_IF_NONE_MATCH='"a", ' + headers['ETag'])
+        render.assert_not_called()
+        self.assertEqual(status, '304 Not Modified')
+        self.assertEqual(response_headers['ETag'], headers['ETag'])
+        self.assertEqual(body, b'')
+
+    def test_invalid_modified_since_is_ignored(self):
+        status, _, _ = self.get('/simple', HTTP_IF_MODIFIED_SINCE='yesterday')
+        self.assertEqual(status, '200 OK')
+
+    def test_conditional_headers_are_ignored_for_post(self):
+        status, _, _ = self.get('/simple', REQUEST_METHOD='POST', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(status, '200 OK')
+
+
+class RunAppRangeTestCase(AppRequestMixin, TestCase):
+
+    def test_static_content_accepts_ranges(self):
+        _, headers, _ = self.get('/robots.txt')
+        self.assertEqual(headers['Accept-Ranges'], 'bytes')
+
+    def test_single_range_is_served_as_partial_content(self):
+        status, headers, body = self.get('/robots.txt', HTTP_RANGE='bytes=0-3')
+        self.assertEqual(status, '206 Partial Content')
+        self.assertEqual(headers['Content-Range'], 'bytes 0-3/26')
+        self.assertEqual(headers['Content-Length'], '4')
+        self.assertEqual(body, b'User')
+
+    def test_multiple_ranges_are_served_as_multipart(self):
+        status, headers, body = self.get('/robots.txt', HTTP_RANGE='bytes=0-3,-2')
+        self.assertEqual(status, '206 Partial Content')
+        mime, _, boundary = headers['Content-Type'].partition('; boundary=')
+        self.assertEqual(mime, 'multipart/byteranges')
+        self.assertEqual(headers['Content-Length'], str(len(body)))
+        self.assertIn(b'Content-Range: bytes 0-3/26\r\n\r\nUser', body)
+        self.assertIn(b'Content-Range: bytes 24-25/26\r\n\r\n/\n', body)
+        self.assertTrue(body.endswith(('--' + boundary + '--\r\n').encode('latin-1')))
+
+    def test_unsatisfiable_range(self):
+        status, headers, body = self.get('/robots.txt', HTTP_RANGE='bytes=100-')
+        self.assertEqual(status, '416 Range Not Satisfiable')
+        self.assertEqual(headers['Content-Range'], 'bytes */26')
+        self.assertEqual(body, b'')
+
+    def test_invalid_range_is_ignored(self):
+        status, _, body = self.get('/robots.txt', HTTP_RANGE='lines=1-2')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(len(body), 26)
+
+    def test_range_is_served_when_if_range_matches(self):
+        _, headers, _ = self.get('/robots.txt')
+        status, _, body = self.get('/robots.txt', HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=headers['ETag'])
+        self.assertEqual(status, '206 Partial Content')
+        self.assertEqual(body, b'User')
+
+    def test_full_content_is_served_when_if_range_does_not_match(self):
+        status, _, body = self.get('/robots.txt', HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(len(body), 26)
+
+    def test_range_disables_compression(self):
+        self.app.compress_min_size = 10
+        status, headers, body = self.get('/theme.css', HTTP_RANGE='bytes=0-3', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(status, '206 Partial Content')
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(body, b'body')
+
+    def test_pages_ignore_ranges(self):
+        status, _, body = self.get('/simple', HTTP_RANGE='bytes=0-3')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(body, b'<body><h1>Simple</h1></body>')
+
+
+class RunAppHeadTestCase(AppRequestMixin, TestCase):
+
+    def test_head_static_content_is_not_read(self):
+        _, get_headers, _ = self.get('/robots.txt')
+        with patch('jen.run.open') as mock:
+            status, headers, body = self.get('/robots.txt', REQUEST_METHOD='HEAD')
+        mock.assert_not_called()
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers, get_headers)
+        self.assertEqual(body, b'')
+
+    def test_head_cached_page_is_not_rendered(self):
+        _, get_headers, _ = self.get('/simple')
+        with patch.object(self.app.template_renderer, 'render') as render:
+            status, headers, body = self.get('/simple', REQUEST_METHOD='HEAD')
+        render.assert_not_called()
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers, get_headers)
+        self.assertEqual(body, b'')
+
+    def test_head_uncached_page_is_not_rendered(self):
+        with patch.object(self.app.template_renderer, 'render') as render:
+            status, headers, body = self.get('/simple', REQUEST_METHOD='HEAD')
+        render.assert_not_called()
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Type'], 'text/html')
+        self.assertNotIn('Content-Length', headers)
+        self.assertIn('Last-Modified', headers)
+        self.assertEqual(body, b'')
+
+    def test_head_cached_page_can_be_revalidated(self):
+        _, headers, _ = self.get('/simple')
+        status, _, _ = self.get('/simple', REQUEST_METHOD='HEAD', HTTP_IF_NONE_MATCH=headers['ETag'])
+        self.assertEqual(status, '304 Not Modified')
+
+    def test_head_missing_page(self):
+        status, _, body = self.get('/missing', REQUEST_METHOD='HEAD')
+        self.assertEqual(status, '404 Not Found')
+        self.assertEqual(body, b'')
+
+
+class RunAppCompressionTestCase(AppRequestMixin, TestCase):
+
+    app_options = {'compress_min_size': 10}
+
+    def test_page_is_gzipped_when_accepted(self):
+        _, headers, body = self.get('/simple', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(headers['Content-Length'], str(len(body)))
+        self.assertEqual(gzip.decompress(body), b'<body><h1>Simple</h1></body>')
+
+    def test_static_text_is_gzipped_when_accepted(self):
+        _, headers, body = self.get('/theme.css', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), b'body { background-color: black; }\n')
+
+    def test_response_is_not_compressed_without_accept_encoding(self):
+        _, headers, body = self.get('/simple')
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(body, b'<body><h1>Simple</h1></body>')
+
+    def test_encoding_with_zero_quality_is_not_used(self):
+        _, headers, _ = self.get('/simple', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_wildcard_accepts_available_encoding(self):
+        _, headers, _ = self.get('/simple', HTTP_ACCEPT_ENCODING='*')
+        self.assertIn(headers['Content-Encoding'], ['gzip', 'br'])
+
+    def test_responses_below_threshold_are_not_compressed(self):
+        self.app.compress_min_size = 1000
+        _, headers, _ = self.get('/simple', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_compressed_variant_has_its_own_etag(self):
+        _, plain, _ = self.get('/theme.css')
+        _, compressed, _ = self.get('/theme.css', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['ETag'], plain['ETag'][:-1] + '-gzip"')
+        status, _, _ = self.get('/theme.css', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=compressed['ETag'])
+        self.assertEqual(status, '304 Not Modified')
+
+    def test_compressed_bodies_are_cached(self):
+        self.get('/simple', HTTP_ACCEPT_ENCODING='gzip')
+        with patch('jen.compression.compress') as compress:
+            _, _, body = self.get('/simple', HTTP_ACCEPT_ENCODING='gzip')
+        compress.assert_not_called()
+        self.assertEqual(gzip.decompress(body), b'<body><h1>Simple</h1></body>')
+
+    def test_binary_content_is_not_compressed(self):
+        app = App('tests/site_example', compress_min_size=1)
+        app.guess_mime = lambda path: 'image/png'
+        self.app = app
+        _, headers, _ = self.get('/robots.txt', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertNotIn('Vary', headers)
+
+
+class RunAppWarmTestCase(TestCase):
+
+    def test_warm_compiles_pages_and_layouts(self):
+        app = App('tests/site_example')
+        app.warm()
+        cached = [key[1] for key in app.template_renderer.jinja_env.cache.keys()]
+        self.assertIn('_base.html', cached)
+        self.assertIn('simple.html', cached)
+        self.assertIn('sub-with-404/404.html', cached)
+
+    def test_warm_skips_broken_templates(self):
+        app = App('tests/site_example')
+        with patch.object(app.template_renderer, 'load', side_effect=ValueError()):
+            app.warm()
+
+
+class RunAppStreamTestCase(AppRequestMixin, TestCase):
+
+    app_options = {'stream': True, 'compress_min_size': 1}
+
+    def test_page_is_streamed_without_content_length(self):
+        status, headers, body = self.request('/simple')
+        self.assertEqual(status, '200 OK')
+        self.assertNotIn('Content-Length', headers)
+        self.assertEqual(read_body(body), b'<body><h1>Simple</h1></body>')
+
+    def test_page_is_rendered_in_chunks(self):
+        self.app.chunk_size = 10
+        _, _, body = self.request('/simple')
+        chunks = list(body)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(chunks), b'<body><h1>Simple</h1></body>')
+
+    def test_streamed_page_is_not_cached(self):
+        _, _, body = self.request('/simple')
+        read_body(body)
+        self.assertEqual(self.app.page_cache.entries, {})
+
+    def test_streamed_page_has_weak_etag_and_can_be_revalidated(self):
+        _, headers, _ = self.request('/simple')
+        self.assertTrue(headers['ETag'].startswith('W/"'))
+        with patch.object(self.app.template_renderer, 'stream') as stream:
+            status, _, body = self.request('/simple', HTTP_IF_NONE_MATCH=headers['ETag'])
+        self.assertEqual(status, '304 Not Modified')
+        self.assertEqual(read_body(body), b'')
+        stream.assert_not_called()
+
+    def test_streamed_page_is_compressed_on_the_fly(self):
+        _, headers, body = self.request('/simple', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(read_body(body)), b'<body><h1>Simple</h1></body>')
+
+
+class RunAppMetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.app = App('tests/site_example', metrics=Metrics())
+
+    def get(self, path):
+        start_response = Mock()
+        body = read_body(self.app({'PATH_INFO': path}, start_response))
+        return start_response.call_args[0][0], body
+
+    def test_metrics_are_served_on_reserved_path(self):
+        self.get('/simple')
+        self.get('/simple')
+        self.get('/robots.txt')
+        self.get('/missing')
+        status, body = self.get('/_jen/metrics')
+        text = body.decode('utf-8')
+        self.assertEqual(status, '200 OK')
+        self.assertIn('jen_request_duration_seconds_count{branch="try_template"} 2', text)
+        self.assertIn('jen_request_duration_seconds_count{branch="try_static"} 1', text)
+        self.assertIn('jen_request_duration_seconds_count{branch="not_found"} 1', text)
+        self.assertIn('jen_requests_total 4', text)
+        self.assertIn('jen_bytes_served_total 82', text)
+        self.assertIn('jen_page_cache_hits_total 1', text)
+
+    def test_streamed_bytes_are_counted_as_they_are_sent(self):
+        self.app.stream = True
+        self.get('/simple')
+        self.assertEqual(self.app.metrics.counters['bytes_served'], 28)
+
+    def test_render_errors_are_counted(self):
+        with patch.object(self.app.template_renderer, 'render', side_effect=ValueError()):
+            with self.assertRaises(ValueError):
+                self.get('/simple')
+        self.assertEqual(self.app.metrics.counters['render_errors'], 1)
+
+    def test_reserved_path_is_not_served_without_metrics(self):
+        app = App('tests/site_example')
+        start_response = Mock()
+        app({'PATH_INFO': '/_jen/metrics'}, start_response)
+        self.assertEqual(start_response.call_args[0][0], '404 Not Found')
+
+
+class RunAppPageCacheTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-source'
+
+    def setUp(self):
+        copytree('tests/site_example', self.directory)
+        self.app = App(self.directory)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def get(self, path):
+        return read_body(self.app({'PATH_INFO': path}, Mock()))
+
+    def write(self, relative_path, text):
+        path = os.path.join(self.directory, relative_path)
+        with open(path, 'w') as f:
+            f.write(text)
+        mtime = time.time() + 10
+        os.utime(path, (mtime, mtime))
+
+    def test_rendered_pages_are_served_from_cache(self):
+        self.get('/simple')
+        with patch.object(self.app.template_renderer, 'render') as render:
+            self.assertEqual(self.get('/simple'), b'<body><h1>Simple</h1></body>')
+        render.assert_not_called()
+        self.assertEqual(self.app.page_cache.hits, 1)
+        self.assertEqual(self.app.page_cache.misses, 1)
+
+    def test_cached_page_is_invalidated_when_template_changes(self):
+        self.get('/simple')
+        self.write('simple.html', "{% extends '_base.html' %}{% block body %}Changed{% endblock %}")
+        self.assertEqual(self.get('/simple'), b'<body>Changed</body>')
+
+    def test_cached_page_is_invalidated_when_base_template_changes(self):
+        self.get('/simple')
+        self.write('_base.html', '<main>{% block body %}{% endblock %}</main>')
+        self.assertEqual(self.get('/simple'), b'<main><h1>Simple</h1></main>')
+
+    def test_pages_with_dynamic_dependencies_are_not_cached(self):
+        self.write('simple.html', "{% set name = '_base.html' %}{% include name %}")
+        self.get('/simple')
+        self.assertEqual(self.app.page_cache.entries, {})
+
+    def test_deleted_template_is_not_found_before_next_scan(self):
+        self.get('/simple')
+        os.remove(os.path.join(self.directory, 'simple.html'))
+        start_response = Mock()
+        self.app({'PATH_INFO': '/simple'}, start_response)
+        self.assertEqual(start_response.call_args[0][0], '404 Not Found')
+
+    def test_missing_include_is_an_error_not_a_deleted_page(self):
+        self.write('simple.html', "{% include '_missing.html' %}")
+        with patch.object(self.app.routes, 'invalidate') as invalidate:
+            with self.assertRaises(TemplateNotFound):
+                self.get('/simple')
+        invalidate.assert_not_called()
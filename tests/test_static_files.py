@@ -0,0 +1,80 @@
+from shutil import rmtree
+from unittest import TestCase
+from unittest.mock import patch
+import os
+
+from jen.static_files import copy_static_file, is_up_to_date
+
+
+class CopyStaticFileTestCase(TestCase):
+
+    directory = '/tmp/jen-tests-static'
+
+    def setUp(self):
+        os.makedirs(self.directory)
+        self.source = os.path.join(self.directory, 'source.css')
+        self.target = os.path.join(self.directory, 'target.css')
+        with open(self.source, 'w') as f:
+            f.write('body {}')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def read_target(self):
+        with open(self.target, 'r') as f:
+            return f.read()
+
+    def test_copy_writes_same_contents_and_mtime(self):
+        self.assertTrue(copy_static_file(self.source, self.target))
+        self.assertEqual(self.read_target(), 'body {}')
+        self.assertEqual(os.stat(self.target).st_mtime_ns, os.stat(self.source).st_mtime_ns)
+        self.assertFalse(os.path.samefile(self.source, self.target))
+
+    def test_copy_falls_back_when_copy_file_range_fails(self):
+        with patch('os.copy_file_range', side_effect=OSError()):
+            copy_static_file(self.source, self.target)
+        self.assertEqual(self.read_target(), 'body {}')
+
+    def test_copy_is_skipped_when_target_matches_size_and_mtime(self):
+        copy_static_file(self.source, self.target)
+        self.assertFalse(copy_static_file(self.source, self.target))
+
+    def test_copy_replaces_target_with_different_contents(self):
+        copy_static_file(self.source, self.target)
+        with open(self.source, 'w') as f:
+            f.write('html {}')
+        self.assertTrue(copy_static_file(self.source, self.target))
+        self.assertEqual(self.read_target(), 'html {}')
+
+    def test_hardlink_shares_the_source_file(self):
+        copy_static_file(self.source, self.target, 'hardlink')
+        self.assertTrue(os.path.samefile(self.source, self.target))
+        self.assertFalse(copy_static_file(self.source, self.target, 'hardlink'))
+
+    def test_symlink_points_to_the_source_file(self):
+        copy_static_file(self.source, self.target, 'symlink')
+        self.assertEqual(os.readlink(self.target), self.source)
+        self.assertTrue(is_up_to_date(self.source, self.target, 'symlink'))
+
+    def test_reflink_falls_back_to_copy_when_unsupported(self):
+        copy_static_file(self.source, self.target, 'reflink')
+        self.assertEqual(self.read_target(), 'body {}')
+        self.assertFalse(os.path.samefile(self.source, self.target))
+
+    def test_copy_over_hardlink_makes_an_independent_file(self):
+        copy_static_file(self.source, self.target, 'hardlink')
+        self.assertTrue(copy_static_file(self.source, self.target))
+        self.assertFalse(os.path.samefile(self.source, self.target))
+        with open(self.source, 'r') as f:
+            self.assertEqual(f.read(), 'body {}')
+
+    def test_hardlink_replaces_matching_copy(self):
+        copy_static_file(self.source, self.target)
+        self.assertTrue(copy_static_file(self.source, self.target, 'hardlink'))
+        self.assertTrue(os.path.samefile(self.source, self.target))
+
+    def test_copy_over_symlink_replaces_the_link(self):
+        copy_static_file(self.source, self.target, 'symlink')
+        copy_static_file(self.source, self.target)
+        self.assertFalse(os.path.islink(self.target))
+        self.assertEqual(self.read_target(), 'body {}')
@@ -1,5 +1,5 @@
 from unittest import TestCase
-from jen.template_renderer import TemplateRenderer
+from jen.template_renderer import TemplateRenderer, buffered
 
 
 class TemplateRendererTestCase(TestCase):
@@ -80,3 +80,56 @@ class RenderPageTestCase(TemplateRendererTestCase):
     def test_ignore_pages_that_starts_with_underscore(self):
         rendered = self.renderer.render_page('/_base')
         self.assertEqual(rendered, None)
+
+
+class FingerprintTestCase(TemplateRendererTestCase):
+
+    def test_fingerprint_includes_template_and_its_dependencies(self):
+        fingerprint = self.renderer.fingerprint('simple.html')
+        self.assertEqual([template for template, _ in fingerprint], ['_base.html', 'simple.html'])
+
+    def test_fingerprint_is_stable(self):
+        self.assertEqual(self.renderer.fingerprint('simple.html'), self.renderer.fingerprint('simple.html'))
+
+    def test_fingerprint_records_dependency_graph(self):
+        self.renderer.fingerprint('simple.html')
+        self.assertEqual(self.renderer.dependency_graph.dependents_of(['_base.html']), {'simple.html'})
+
+
+class TemplateDependenciesTestCase(TemplateRendererTestCase):
+
+    def test_extended_template_is_a_dependency(self):
+        self.assertEqual(self.renderer.template_dependencies('simple.html'), ['_base.html'])
+
+    def test_template_without_references_has_no_dependencies(self):
+        self.assertEqual(self.renderer.template_dependencies('_base.html'), [])
+
+
+class StreamTestCase(TemplateRendererTestCase):
+
+    def test_stream_yields_rendered_page(self):
+        self.assertEqual(''.join(self.renderer.stream('simple.html')), '<body><h1>Simple</h1></body>')
+
+    def test_stream_buffers_pieces_into_chunks(self):
+        chunks = list(buffered(['ab', 'c', 'de', 'f', 'g'], 3))
+        self.assertEqual(chunks, ['abc', 'def', 'g'])
+
+    def test_buffered_empty_stream_yields_nothing(self):
+        self.assertEqual(list(buffered([], 3)), [])
+
+
+class AssetTestCase(TemplateRendererTestCase):
+
+    def test_asset_resolves_to_fingerprinted_url(self):
+        self.renderer.assets = {'theme.css': 'theme.0123456789.css'}
+        self.renderer._set_env_once()
+        template = self.renderer.jinja_env.from_string("{{ asset('/theme.css') }}")
+        self.assertEqual(template.render(), '/theme.0123456789.css')
+
+    def test_unknown_asset_keeps_its_url(self):
+        self.renderer._set_env_once()
+        template = self.renderer.jinja_env.from_string("{{ asset('theme.css') }}")
+        self.assertEqual(template.render(), '/theme.css')
+
+    def test_templates_calling_asset_are_detected(self):
+        self.assertFalse(self.renderer.uses_assets('simple.html'))
@@ -0,0 +1,68 @@
+from shutil import copytree, rmtree
+from unittest import TestCase
+import os
+
+from jen.watcher import InotifyWatcher, PollingWatcher, watch
+
+
+class WatcherTestMixin(object):
+
+    directory = '/tmp/jen-tests-source'
+
+    def setUp(self):
+        copytree('tests/site_example', self.directory)
+        self.watcher = self.create_watcher()
+
+    def tearDown(self):
+        self.watcher.close()
+        rmtree(self.directory)
+
+    def write(self, relative_path, text):
+        path = os.path.join(self.directory, relative_path)
+        with open(path, 'w') as f:
+            f.write(text)
+        mtime = os.stat(path).st_mtime + 10
+        os.utime(path, (mtime, mtime))
+
+    def test_nothing_changed(self):
+        self.assertEqual(self.watcher.wait(0.1), set())
+
+    def test_modified_file_is_reported(self):
+        self.write('simple.html', 'Changed')
+        self.assertIn('simple.html', self.watcher.wait(2))
+
+    def test_created_and_deleted_files_are_reported(self):
+        self.write('new.html', 'New')
+        os.remove(os.path.join(self.directory, 'robots.txt'))
+        changed = self.watcher.wait(2)
+        self.assertIn('new.html', changed)
+        self.assertIn('robots.txt', changed)
+
+    def test_files_in_new_directories_are_reported(self):
+        os.mkdir(os.path.join(self.directory, 'blog'))
+        self.watcher.wait(2)
+        self.write('blog/post.html', 'Post')
+        self.assertIn('blog/post.html', self.watcher.wait(2))
+
+    def test_excluded_directories_are_ignored(self):
+        self.watcher.close()
+        self.watcher = self.create_watcher(excluded=[os.path.join(self.directory, 'sub-with-index')])
+        self.write('sub-with-index/index.html', 'Changed')
+        self.assertEqual(self.watcher.wait(0.3), set())
+
+
+class PollingWatcherTestCase(WatcherTestMixin, TestCase):
+
+    def create_watcher(self, excluded=()):
+        return PollingWatcher(self.directory, excluded, interval=0.05)
+
+
+class InotifyWatcherTestCase(WatcherTestMixin, TestCase):
+
+    def create_watcher(self, excluded=()):
+        return InotifyWatcher(self.directory, excluded)
+
+    def test_watch_prefers_inotify(self):
+        watcher = watch(self.directory)
+        watcher.close()
+        self.assertIsInstance(watcher, InotifyWatcher)